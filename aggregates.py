@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Agregados das detecções mantidos incrementalmente
+"""
+
+
+class _Totals:
+    """Somas e contadores de um grupo de detecções (global, dispositivo ou hora)"""
+
+    __slots__ = (
+        "captures", "flies", "confidence_sum", "confidence_count",
+        "occupancy_sum", "inference_sum", "inference_count",
+        "excessive", "abnormal"
+    )
+
+    def __init__(self):
+        self.captures = 0
+        self.flies = 0
+        self.confidence_sum = 0.0
+        self.confidence_count = 0
+        self.occupancy_sum = 0.0
+        self.inference_sum = 0.0
+        self.inference_count = 0
+        self.excessive = 0
+        self.abnormal = 0
+
+    def update(self, values, sign):
+        flies, confidence, occupancy, inference, excessive, abnormal = values
+        self.captures += sign
+        self.flies += sign * flies
+        if confidence:
+            self.confidence_sum += sign * confidence
+            self.confidence_count += sign
+        self.occupancy_sum += sign * occupancy
+        if inference:
+            self.inference_sum += sign * inference
+            self.inference_count += sign
+        self.excessive += sign * excessive
+        self.abnormal += sign * abnormal
+
+        # Zerar somas de ponto flutuante para não acumular erro de arredondamento
+        if self.captures == 0:
+            self.confidence_sum = self.occupancy_sum = self.inference_sum = 0.0
+
+    def to_dict(self):
+        return {
+            "captures": self.captures,
+            "flies": self.flies,
+            "avg_confidence": self.confidence_sum / self.confidence_count if self.confidence_count else 0,
+            "avg_occupancy": self.occupancy_sum / self.captures if self.captures else 0,
+            "avg_inference_ms": self.inference_sum / self.inference_count if self.inference_count else 0,
+            "count_excessive": self.excessive,
+            "count_abnormal": self.abnormal
+        }
+
+
+def _values(message):
+    """
+    Extrai os campos numéricos usados nos agregados
+
+    Alertas seguem o diagnóstico do servidor, se houver, senão o do
+    dispositivo (mesma regra de storage.message_status e do filtro status).
+    """
+    deteccoes = message.get("deteccoes") or {}
+    diagnostico = message.get("diagnostico_servidor")
+    if not isinstance(diagnostico, dict):
+        diagnostico = message.get("diagnostico") or {}
+    return (
+        deteccoes.get("total") or 0,
+        deteccoes.get("confianca_media") or 0,
+        deteccoes.get("ocupacao_pct") or 0,
+        message.get("tempo_inferencia_ms") or 0,
+        1 if diagnostico.get("ocupacao_excessiva") else 0,
+        1 if diagnostico.get("anormal") else 0
+    )
+
+
+def _hour(message):
+    """Hora do dia ("HH:00") da detecção, como agrupado no dashboard"""
+    timestamp = message.get("timestamp")
+    if not isinstance(timestamp, str) or " " not in timestamp:
+        return None
+    return timestamp.split(" ")[1][:2] + ":00"
+
+
+class Aggregates:
+    """
+    Totais globais, por dispositivo e por hora do dia
+
+    Cada inserção e cada remoção (despejo do armazenamento) custa O(1),
+    então o endpoint de agregados não precisa percorrer as mensagens.
+    """
+
+    def __init__(self):
+        # Versão incrementada a cada alteração; o snapshot é reaproveitado enquanto ela não muda
+        self.version = 0
+        self._snapshot = (None, None)
+        self.reset()
+
+    def reset(self):
+        self._global = _Totals()
+        self._devices = {}
+        self._hours = {}
+        self.version += 1
+
+    def add(self, message):
+        self._update(message, 1)
+
+    def remove(self, message):
+        self._update(message, -1)
+
+    def _update(self, message, sign):
+        values = _values(message)
+        self._global.update(values, sign)
+        self._update_group(self._devices, message.get("lora_id"), values, sign)
+        self._update_group(self._hours, _hour(message), values, sign)
+        # Depois das somas: um snapshot montado no meio da atualização não fica em cache
+        self.version += 1
+
+    def rediagnosed(self, message, excessive, abnormal):
+        """
+        Troca nas contagens de alerta o diagnóstico anterior da mensagem pelo atual
+
+        ``excessive``/``abnormal`` são os valores com que ela foi contada
+        (ex.: ``MessageStore.rediagnose(thresholds, changed)``).
+        """
+        values = _values(message)
+        excessive_delta = values[4] - bool(excessive)
+        abnormal_delta = values[5] - bool(abnormal)
+        for totals in (self._global, self._devices.get(message.get("lora_id")), self._hours.get(_hour(message))):
+            if totals is not None:
+                totals.excessive += excessive_delta
+                totals.abnormal += abnormal_delta
+        self.version += 1
+
+    @staticmethod
+    def _update_group(groups, key, values, sign):
+        if key is None:
+            return
+        totals = groups.get(key)
+        if totals is None:
+            totals = groups[key] = _Totals()
+        totals.update(values, sign)
+        if totals.captures == 0:
+            del groups[key]
+
+    def snapshot(self):
+        """
+        Documento com os agregados atuais
+
+        O mesmo objeto é devolvido enquanto nada mudar (não altere o
+        resultado); assim os assinantes do stream comparam por identidade.
+        """
+        version = self.version
+        cached_version, document = self._snapshot
+        if cached_version == version:
+            return document
+        # Cópias rasas: os dicionários podem ganhar chaves durante a iteração
+        devices = dict(self._devices)
+        hours = dict(self._hours)
+        document = {
+            "global": {**self._global.to_dict(), "devices": len(devices)},
+            "devices": {key: totals.to_dict() for key, totals in devices.items()},
+            "hourly": {key: hours[key].to_dict() for key in sorted(hours)}
+        }
+        self._snapshot = (version, document)
+        return document
+
+
+def snapshot_delta(previous, current):
+    """
+    Diferença entre dois snapshots: totais globais, grupos novos ou alterados e grupos removidos
+
+    Sem ``previous``, o documento completo (``full``: true).
+    """
+    if previous is None:
+        return {**current, "full": True, "removed_devices": [], "removed_hours": []}
+    changes = {"global": current["global"], "full": False}
+    for key, removed_key in (("devices", "removed_devices"), ("hourly", "removed_hours")):
+        before = previous[key]
+        after = current[key]
+        changes[key] = {name: totals for name, totals in after.items() if before.get(name) != totals}
+        changes[removed_key] = [name for name in before if name not in after]
+    return changes
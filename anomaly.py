@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Detecção de anomalias por dispositivo (EWMA / z-score)
+======================================================
+
+Limiares fixos não servem a armadilhas com pressão de moscas muito
+diferente. Cada dispositivo tem sua própria linha de base: média e
+variância com média móvel exponencial (EWMA) do total de moscas e da
+ocupação, atualizadas em O(1) por frame. Um frame é anômalo quando
+se afasta da linha de base do dispositivo mais que ``sigma`` desvios
+padrão (z-score, nos dois sentidos), depois de ``warmup`` frames.
+
+O estado fica em colunas ``array`` (um slot por dispositivo, ~80 bytes)
+e o número de dispositivos é limitado: ao encher, os que estão há mais
+tempo sem enviar frames são descartados. Os frames anômalos mais
+recentes ficam em uma fila limitada (``feed()``, GET /api/anomalies).
+"""
+import math
+import sys
+import threading
+import time
+from array import array
+from collections import deque
+
+# Métricas acompanhadas: (nome no diagnóstico, chave em deteccoes, desvio padrão mínimo)
+# O desvio mínimo evita z enorme em dispositivos com leituras constantes (ex.: sempre 0 moscas)
+_METRICS = (
+    ("moscas", "total", 1.0),
+    ("ocupacao", "ocupacao_pct", 0.5),
+)
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _values(message):
+    """Valores das métricas na mensagem (None se ausente ou não numérico)"""
+    deteccoes = message.get("deteccoes")
+    if not isinstance(deteccoes, dict):
+        return None
+    return [_number(deteccoes.get(key)) for _, key, _ in _METRICS]
+
+
+def anomaly_of(message):
+    """Bloco ``diagnostico.anomalia`` da mensagem, ou None se ela não foi marcada"""
+    diagnostico = message.get("diagnostico")
+    return diagnostico.get("anomalia") if isinstance(diagnostico, dict) else None
+
+
+class AnomalyDetector:
+    """Linhas de base EWMA por dispositivo e fila dos frames anômalos"""
+
+    def __init__(self, sigma=3.0, alpha=0.05, warmup=20, max_devices=10000, feed_size=1000):
+        if sigma <= 0 or not 0 < alpha <= 1:
+            raise ValueError("sigma deve ser positivo e alpha entre 0 e 1")
+        self.sigma = float(sigma)
+        self.alpha = float(alpha)
+        self.warmup = warmup
+        self.max_devices = max_devices
+        self._lock = threading.Lock()
+        self._feed = deque(maxlen=feed_size)
+        self.reset()
+
+    def reset(self):
+        """Descarta linhas de base e fila"""
+        with self._lock:
+            self._slots = {}
+            self._devices = []
+            self._counts = array("I")
+            self._last_seen = array("d")
+            # Média e variância de cada métrica, intercaladas: [média0, var0, média1, var1] por slot
+            self._stats = array("d")
+            self._feed.clear()
+            self._flagged = 0
+            self._pruned = 0
+
+    # ------------------------------------------------------------------
+    # Atualização
+
+    def score(self, message):
+        """
+        Bloco ``anomalia`` do frame segundo a linha de base atual, ou None
+
+        Não altera a linha de base. O bloco traz o z-score e a média
+        esperada de cada métrica presente (``moscas_z``, ``moscas_media``...).
+        """
+        device = message.get("lora_id")
+        values = _values(message)
+        if device is None or values is None:
+            return None
+        with self._lock:
+            slot = self._slots.get(device)
+            if slot is None or self._counts[slot] < self.warmup:
+                return None
+            stats = self._stats
+            base = slot * 2 * len(_METRICS)
+            anomaly = {}
+            flagged = False
+            for index, ((name, _, min_std), value) in enumerate(zip(_METRICS, values)):
+                if value is None:
+                    continue
+                mean = stats[base + 2 * index]
+                z = (value - mean) / max(math.sqrt(stats[base + 2 * index + 1]), min_std)
+                flagged = flagged or abs(z) > self.sigma
+                anomaly[f"{name}_z"] = round(z, 2)
+                anomaly[f"{name}_media"] = round(mean, 2)
+            if not flagged:
+                return None
+            self._flagged += 1
+            return anomaly
+
+    def learn(self, message):
+        """Incorpora o frame à linha de base do dispositivo (O(1))"""
+        device = message.get("lora_id")
+        values = _values(message)
+        if device is None or values is None:
+            return
+        alpha = self.alpha
+        with self._lock:
+            slot = self._slots.get(device)
+            if slot is None:
+                slot = self._add(device)
+            count = self._counts[slot]
+            stats = self._stats
+            base = slot * 2 * len(_METRICS)
+            for index, value in enumerate(values):
+                if value is None:
+                    continue
+                position = base + 2 * index
+                if count == 0:
+                    stats[position] = value
+                    continue
+                # EWMA da média e da variância (forma incremental de Finch)
+                diff = value - stats[position]
+                increment = alpha * diff
+                stats[position] += increment
+                stats[position + 1] = (1 - alpha) * (stats[position + 1] + diff * increment)
+            if count < 0xFFFFFFFF:
+                self._counts[slot] = count + 1
+            self._last_seen[slot] = time.monotonic()
+
+    def observe(self, message):
+        """``score()`` seguido de ``learn()``: o bloco ``anomalia`` do frame, ou None"""
+        anomaly = self.score(message)
+        self.learn(message)
+        return anomaly
+
+    def record(self, message):
+        """Acrescenta à fila a mensagem armazenada (com seq), se ela foi marcada como anômala"""
+        anomaly = anomaly_of(message)
+        if not anomaly:
+            return
+        deteccoes = message.get("deteccoes") or {}
+        self._feed.append({
+            "seq": message.get("seq"),
+            "lora_id": message.get("lora_id"),
+            "gateway_id": message.get("gateway_id"),
+            "timestamp": message.get("timestamp"),
+            "moscas": deteccoes.get("total"),
+            "ocupacao_pct": deteccoes.get("ocupacao_pct"),
+            "anomalia": anomaly
+        })
+
+    def _add(self, device):
+        if len(self._devices) >= self.max_devices:
+            self._prune()
+        slot = len(self._devices)
+        self._slots[device] = slot
+        self._devices.append(device)
+        self._counts.append(0)
+        self._last_seen.append(0.0)
+        self._stats.extend([0.0] * (2 * len(_METRICS)))
+        return slot
+
+    def _prune(self):
+        """Descarta o quarto de dispositivos há mais tempo sem frames, compactando os slots"""
+        keep = sorted(range(len(self._devices)), key=self._last_seen.__getitem__)[len(self._devices) // 4 + 1:]
+        keep.sort()
+        width = 2 * len(_METRICS)
+        self._pruned += len(self._devices) - len(keep)
+        self._devices = [self._devices[slot] for slot in keep]
+        self._slots = {device: slot for slot, device in enumerate(self._devices)}
+        self._counts = array("I", (self._counts[slot] for slot in keep))
+        self._last_seen = array("d", (self._last_seen[slot] for slot in keep))
+        stats = self._stats
+        self._stats = array("d", (stats[slot * width + offset] for slot in keep for offset in range(width)))
+
+    # ------------------------------------------------------------------
+    # Leitura
+
+    def feed(self, since=None, limit=None, device=None):
+        """Frames anômalos recentes em ordem de seq (since exclusivo; com limit, os mais recentes)"""
+        entries = [
+            entry for entry in list(self._feed)
+            if (since is None or entry["seq"] > since) and (device is None or entry["lora_id"] == device)
+        ]
+        entries.sort(key=lambda entry: entry["seq"])
+        if limit is not None:
+            entries = entries[:limit] if since is not None else entries[max(len(entries) - limit, 0):] if limit else []
+        return entries
+
+    def baseline(self, device):
+        """Linha de base atual do dispositivo (frames vistos, média e desvio padrão), ou None"""
+        with self._lock:
+            slot = self._slots.get(device)
+            if slot is None:
+                return None
+            base = slot * 2 * len(_METRICS)
+            result = {"frames": self._counts[slot]}
+            for index, (name, _, _) in enumerate(_METRICS):
+                result[f"{name}_media"] = round(self._stats[base + 2 * index], 4)
+                result[f"{name}_desvio"] = round(math.sqrt(self._stats[base + 2 * index + 1]), 4)
+            return result
+
+    def nbytes(self):
+        """Memória aproximada das linhas de base (colunas e mapa de slots)"""
+        return (
+            self._counts.itemsize * len(self._counts)
+            + self._last_seen.itemsize * len(self._last_seen)
+            + self._stats.itemsize * len(self._stats)
+            + sys.getsizeof(self._devices)
+            + sys.getsizeof(self._slots)
+        )
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sigma": self.sigma,
+                "alpha": self.alpha,
+                "warmup": self.warmup,
+                "tracked_devices": len(self._devices),
+                "pruned_devices": self._pruned,
+                "flagged": self._flagged,
+                "feed": len(self._feed),
+                "bytes": self.nbytes()
+            }
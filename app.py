@@ -9,44 +9,367 @@ Envia notificações para o Telegram e armazena mensagens para visualização.
 
 Endpoints:
     POST /api/messages - Recebe mensagens dos dispositivos
+    POST /api/messages/batch - Recebe lotes de mensagens (gateways)
     GET /api/messages - Lista mensagens armazenadas
+    GET /api/stream - Stream (SSE) de novas mensagens
+    GET /api/aggregates - Agregados globais, por dispositivo e por hora
+    GET /metrics - Métricas no formato Prometheus
     GET / - Interface web para visualização
+
+Para ingestão assíncrona sob uvicorn/hypercorn, ver asgi.py.
 """
 
-import json
+import atexit
+import base64
+import binascii
+import csv
+import io
 import logging
+import math
 import os
+import threading
+import time
 from datetime import datetime
-from typing import List, Dict
-from collections import deque
 
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, g, request, jsonify, render_template_string
 from flask_cors import CORS
 
+import log_pipeline
+import lora_codec
+import payload_codec
+from aggregates import Aggregates, snapshot_delta
+from anomaly import AnomalyDetector
+from counters import Counters
+from dedup import DedupIndex, message_keys, signal_quality
+from diagnosis import Thresholds, diagnose
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry
+from notifier import TelegramNotifier
+from rate_limit import RateLimiter
+from shm_ring import SharedRing
+from sqlite_backend import SQLiteBackend
+from storage import PACK_VERSION, STATUSES, MessageStore, message_status, parse_timestamp
+from stream import MessageBroker
+from wal import WriteAheadLog
+from webhooks import WebhookFanout, WebhookSink, parse_sinks
+
 # Configuração de logs
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()  # WARNING desativa as linhas por frame
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text ou json (uma linha JSON por registro)
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # Fila da thread de logs (0 = escrita síncrona)
+LOG_FRAME_SAMPLE = int(os.getenv("LOG_FRAME_SAMPLE", "1"))  # Registrar 1 de cada N frames por dispositivo
+LOG_FRAME_RATE = float(os.getenv("LOG_FRAME_RATE", "0"))  # Máximo de linhas por segundo por dispositivo (0 = sem limite)
+
+log_pipeline.setup_logging(LOG_LEVEL, json_output=LOG_FORMAT == "json", queue_size=LOG_QUEUE_SIZE)
 logger = logging.getLogger(__name__)
 
+# Linhas por frame, amostradas por dispositivo
+frame_logger = logger.getChild("frames")
+frame_logger.addFilter(log_pipeline.FrameSampler(LOG_FRAME_SAMPLE, LOG_FRAME_RATE))
+
 # Configurações do servidor
 PORT = int(os.getenv("PORT", "5000"))
 MAX_MESSAGES = int(os.getenv("MAX_MESSAGES", "1000"))  # Máximo de mensagens em memória
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "5000"))  # Máximo de itens por lote
+STREAM_KEEPALIVE_SECONDS = float(os.getenv("STREAM_KEEPALIVE_SECONDS", "15"))  # Intervalo do evento stats no SSE
+STREAM_AGGREGATES_SECONDS = float(os.getenv("STREAM_AGGREGATES_SECONDS", "2"))  # Intervalo do evento aggregates (alterações) no SSE
+STREAM_BATCH_SIZE = 500  # Máximo de mensagens lidas por iteração do SSE
+EXPORT_PAGE_SIZE = 1000  # Mensagens lidas e serializadas por bloco em /api/export
+WAL_DIR = os.getenv("WAL_DIR", "")  # Diretório do log de mensagens (vazio = sem persistência)
+WAL_FSYNC_INTERVAL_MS = int(os.getenv("WAL_FSYNC_INTERVAL_MS", "100"))  # Intervalo do fsync em grupo (0 = a cada escrita)
+WAL_SEGMENT_MB = int(os.getenv("WAL_SEGMENT_MB", "64"))  # Tamanho máximo de cada segmento do log
+SQLITE_PATH = os.getenv("SQLITE_PATH", "")  # Banco SQLite com o histórico completo (vazio = desativado)
+# Ids dos dispositivos na ordem dos índices usados pelos frames binários (separados por vírgula)
+LORA_DEVICE_TABLE = [device.strip() for device in os.getenv("LORA_DEVICE_TABLE", "").split(",") if device.strip()]
+SHM_RING_NAME = os.getenv("SHM_RING_NAME", "")  # Anel em memória compartilhada entre workers (vazio = por processo)
+SHM_SLOT_BYTES = int(os.getenv("SHM_SLOT_BYTES", "1024"))  # Tamanho de cada mensagem no anel
+SHM_POLL_MS = int(os.getenv("SHM_POLL_MS", "100"))  # Intervalo de sincronização com o anel
+DEDUP_WINDOW_SECONDS = float(os.getenv("DEDUP_WINDOW_SECONDS", "300"))  # Janela de deduplicação de retransmissões (0 = desativada)
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "100000"))  # Chaves mantidas no índice de deduplicação
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", "0"))  # Frames por segundo por gateway/IP (0 = sem limite)
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "100"))  # Frames aceitos em rajada antes do limite
+METRICS_MAX_GATEWAYS = int(os.getenv("METRICS_MAX_GATEWAYS", "1000"))  # Gateways distintos em /metrics (demais em "_other")
+ANOMALY_SIGMA = float(os.getenv("ANOMALY_SIGMA", "3"))  # Desvios padrão da linha de base do dispositivo para marcar anomalia (0 = desativada)
+ANOMALY_ALPHA = float(os.getenv("ANOMALY_ALPHA", "0.05"))  # Peso de cada frame na média móvel exponencial (EWMA)
+ANOMALY_WARMUP = int(os.getenv("ANOMALY_WARMUP", "20"))  # Frames do dispositivo antes de marcar anomalias
+ANOMALY_MAX_DEVICES = int(os.getenv("ANOMALY_MAX_DEVICES", "10000"))  # Dispositivos com linha de base (os mais ociosos são descartados)
+ANOMALY_FEED_SIZE = int(os.getenv("ANOMALY_FEED_SIZE", "1000"))  # Frames anômalos mantidos para GET /api/anomalies
+TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN", "")  # Token do bot (vazio = notificações desativadas)
+DEFAULT_CHAT_ID = os.getenv("DEFAULT_CHAT_ID", "")  # Chat que recebe os alertas
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")  # Base da Bot API (ex.: servidor local de teste)
+TELEGRAM_COALESCE_SECONDS = float(os.getenv("TELEGRAM_COALESCE_SECONDS", "300"))  # Janela por dispositivo: alertas repetidos viram um resumo
+TELEGRAM_QUEUE_SIZE = int(os.getenv("TELEGRAM_QUEUE_SIZE", "1000"))  # Alertas aguardando envio (fila cheia = descartados)
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "5"))  # Novas tentativas por envio (espera exponencial)
+WEBHOOK_URLS = os.getenv("WEBHOOK_URLS", "")  # Destinos das detecções: "nome=url,nome=url" (vazio = desativado)
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "100"))  # Mensagens por entrega
+WEBHOOK_FLUSH_MS = int(os.getenv("WEBHOOK_FLUSH_MS", "1000"))  # Espera máxima para completar um lote
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "2"))  # Entregas simultâneas (conexões) por destino
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "10000"))  # Mensagens aguardando por destino (fila cheia = descartadas)
+WEBHOOK_MAX_RETRIES = int(os.getenv("WEBHOOK_MAX_RETRIES", "5"))  # Novas tentativas por lote antes de considerar o destino fora do ar
+WEBHOOK_SPILL_DIR = os.getenv("WEBHOOK_SPILL_DIR", "")  # Lotes não entregues com o destino fora do ar (vazio = descartados)
 
-# Armazenamento em memória (pode ser substituído por banco de dados)
-messages_storage: deque = deque(maxlen=MAX_MESSAGES)
+# Armazenamento em memória, em colunas compactas (pode ser substituído por banco de dados)
+messages_storage = MessageStore(maxlen=MAX_MESSAGES)
 
-# Estatísticas
-stats = {
-    "total_messages": 0,
-    "errors": 0,
-    "start_time": datetime.now()
-}
+# Notificação de novas mensagens para o stream SSE
+broker = MessageBroker()
+
+# Agregados atualizados a cada inserção/despejo
+aggregates = Aggregates()
+
+# Índice de retransmissões já armazenadas (mesmo frame por outro gateway ou reenviado)
+dedup = DedupIndex(DEDUP_WINDOW_SECONDS, DEDUP_MAX_ENTRIES) if DEDUP_WINDOW_SECONDS > 0 else None
+
+# Limite de taxa por gateway (client_id) ou IP de origem
+rate_limiter = RateLimiter(RATE_LIMIT_RATE, RATE_LIMIT_BURST) if RATE_LIMIT_RATE > 0 else None
+
+# Linhas de base EWMA por dispositivo e fila dos frames anômalos
+anomalies = AnomalyDetector(
+    ANOMALY_SIGMA, ANOMALY_ALPHA, ANOMALY_WARMUP, ANOMALY_MAX_DEVICES, ANOMALY_FEED_SIZE
+) if ANOMALY_SIGMA > 0 else None
+
+# Alertas ALERTA/ANORMAL para o Telegram (thread própria, fila limitada)
+notifier = None
+if TELEGRAM_TOKEN and DEFAULT_CHAT_ID:
+    notifier = TelegramNotifier(
+        TELEGRAM_TOKEN, DEFAULT_CHAT_ID, TELEGRAM_API_URL,
+        window=TELEGRAM_COALESCE_SECONDS, queue_size=TELEGRAM_QUEUE_SIZE, max_retries=TELEGRAM_MAX_RETRIES
+    )
+    atexit.register(notifier.close)
+
+# Encaminhamento das detecções para webhooks (fila e threads por destino)
+webhooks = None
+if WEBHOOK_URLS:
+    webhooks = WebhookFanout([
+        WebhookSink(
+            name, url,
+            batch_size=WEBHOOK_BATCH_SIZE,
+            flush_interval=WEBHOOK_FLUSH_MS / 1000,
+            concurrency=WEBHOOK_CONCURRENCY,
+            queue_size=WEBHOOK_QUEUE_SIZE,
+            max_retries=WEBHOOK_MAX_RETRIES,
+            spill_dir=WEBHOOK_SPILL_DIR or None
+        )
+        for name, url in parse_sinks(WEBHOOK_URLS)
+    ])
+    atexit.register(webhooks.close)
+
+# Estatísticas (contadores sem perda de incrementos entre threads)
+counters = Counters("total_messages", "errors")
+start_time = datetime.now()
+
+# Métricas expostas em /metrics (contadores sem trava no caminho de ingestão)
+metrics = Registry()
+http_latency = metrics.histogram(
+    "trapeyes_http_request_duration_seconds",
+    "Latência das requisições por rota, até o início da resposta",
+    ("method", "route")
+)
+http_requests = metrics.counter(
+    "trapeyes_http_requests_total", "Requisições por rota e status HTTP", ("method", "route", "status")
+)
+ingest_counter = metrics.counter(
+    "trapeyes_ingest_messages_total", "Mensagens armazenadas por formato de entrada", ("format",)
+)
+gateway_frames = metrics.counter(
+    "trapeyes_gateway_frames_total", "Frames recebidos por gateway, incluindo retransmissões", ("gateway",),
+    max_series=METRICS_MAX_GATEWAYS
+)
+duplicate_frames = metrics.counter(
+    "trapeyes_duplicate_frames_total", "Retransmissões descartadas pela deduplicação"
+)
+rate_limited = metrics.counter(
+    "trapeyes_rate_limited_total", "Requisições de ingestão recusadas (429) ou com itens recusados pelo limite de taxa"
+)
+decode_errors = metrics.counter(
+    "trapeyes_decode_errors_total", "Payloads que falharam na decodificação (body ou lora_data)", ("source",)
+)
+anomaly_frames = metrics.counter(
+    "trapeyes_anomalies_total", "Frames marcados como anômalos pela linha de base do dispositivo"
+)
+store_evictions = metrics.counter(
+    "trapeyes_store_evictions_total", "Mensagens despejadas do armazenamento em memória"
+)
+metrics.gauge("trapeyes_store_messages", "Mensagens no armazenamento em memória", lambda: len(messages_storage))
+metrics.gauge("trapeyes_store_bytes", "Memória aproximada do armazenamento em memória", lambda: messages_storage.nbytes())
+metrics.gauge("trapeyes_store_capacity", "Capacidade do armazenamento em memória (MAX_MESSAGES)", lambda: MAX_MESSAGES)
+metrics.gauge("trapeyes_stream_subscribers", "Clientes conectados ao stream SSE", lambda: broker.subscribers)
+metrics.gauge("trapeyes_log_dropped_records", "Registros de log descartados por fila cheia", log_pipeline.dropped_records)
+
+# Serializa as escritas (armazenamento, agregados, WAL em ordem de seq); leituras não travam
+store_lock = threading.Lock()
+
+# Limiares do diagnóstico do servidor (config.py; alteráveis em POST /api/diagnosis)
+diagnosis_thresholds = Thresholds.from_config()
+# Uma alteração de limiares por vez: o SQLite termina com os mesmos limiares da memória
+diagnosis_lock = threading.Lock()
+
+# Log de escrita antecipada: sobrevive a reinicializações do container
+wal = None
+
+# Histórico completo em SQLite; com ele, messages_storage é o cache das mensagens recentes
+backend = None
+
+# Anel compartilhado entre workers; com ele, messages_storage espelha o anel neste processo
+ring = None
+shared_sync_lock = threading.Lock()
+shared_floor_seq = None
+
+def restore_storage():
+    """Abre o WAL e/ou o SQLite configurados e recarrega as mensagens recentes em memória"""
+    global wal, backend
+    source = None
+    if SQLITE_PATH:
+        backend = SQLiteBackend(SQLITE_PATH)
+        atexit.register(backend.close)
+    if WAL_DIR:
+        wal = WriteAheadLog(
+            WAL_DIR,
+            retain=MAX_MESSAGES,
+            version=PACK_VERSION,
+            fsync_interval=WAL_FSYNC_INTERVAL_MS / 1000,
+            segment_bytes=WAL_SEGMENT_MB * 2 ** 20
+        )
+        atexit.register(wal.close)
+        messages_storage.restore(wal.replay(), wal.next_seq)
+        source = WAL_DIR
+    if backend is not None:
+        # O SQLite pode estar à frente do WAL (ex.: volume do WAL recriado)
+        max_seq = backend.max_seq()
+        if max_seq is not None and max_seq >= messages_storage.next_seq:
+            messages_storage.clear()
+            messages_storage.load(backend.last(MAX_MESSAGES), max_seq + 1)
+            source = SQLITE_PATH
+    
+    # Mensagens gravadas antes (ou com outros limiares) recebem o diagnóstico atual
+    messages_storage.rediagnose(diagnosis_thresholds)
+    for message_data in messages_storage:
+        aggregates.add(message_data)
+        if dedup is not None:
+            dedup.add(message_keys(message_data), message_data["seq"])
+        if anomalies is not None:
+            anomalies.learn(message_data)
+            anomalies.record(message_data)
+    if messages_storage:
+        broker.publish(messages_storage.last_seq)
+    logger.info(f"[STORAGE] {len(messages_storage)} mensagens restauradas de {source or 'nenhuma fonte'}")
+
+def open_shared_ring():
+    """Abre (ou cria) o anel compartilhado e sincroniza o armazenamento local com ele"""
+    global ring, backend
+    if WAL_DIR:
+        logger.warning("[SHM] WAL_DIR ignorado com SHM_RING_NAME; use SQLITE_PATH para persistência")
+    next_seq = 1
+    if SQLITE_PATH:
+        backend = SQLiteBackend(SQLITE_PATH)
+        atexit.register(backend.close)
+        max_seq = backend.max_seq()
+        if max_seq is not None:
+            next_seq = max_seq + 1
+    ring = SharedRing(
+        SHM_RING_NAME,
+        capacity=MAX_MESSAGES,
+        slot_bytes=SHM_SLOT_BYTES,
+        version=PACK_VERSION,
+        counters=("total_messages", "errors"),
+        next_seq=next_seq
+    )
+    atexit.register(ring.close)
+    sync_shared_storage()
+    start_shared_sync()
+    os.register_at_fork(after_in_child=start_shared_sync)
+    logger.info(f"[SHM] Anel {SHM_RING_NAME} {'criado' if ring.created else 'aberto'} ({len(messages_storage)} mensagens)")
+
+def clear_local_messages():
+    """Esvazia o armazenamento local e o que é derivado dele (agregados, deduplicação, anomalias)"""
+    messages_storage.clear()
+    aggregates.reset()
+    if dedup is not None:
+        dedup.clear()
+    if anomalies is not None:
+        anomalies.reset()
+
+def sync_shared_storage():
+    """
+    Traz para messages_storage as mensagens gravadas no anel por qualquer worker
+
+    Atualiza agregados e estatísticas a partir do anel e acorda o stream SSE,
+    de modo que todos os workers respondem com os mesmos dados.
+    """
+    global shared_floor_seq
+    with shared_sync_lock:
+        floor_seq = ring.floor_seq
+        if floor_seq != shared_floor_seq:
+            # Mensagens apagadas (DELETE) em algum worker
+            if shared_floor_seq is not None:
+                clear_local_messages()
+            shared_floor_seq = floor_seq
+        
+        rows = ring.read(since=messages_storage.next_seq - 1)
+        if not rows:
+            return
+        if rows[0][0] != messages_storage.next_seq or len(rows) >= messages_storage.maxlen:
+            # Worker ficou para trás além da capacidade do anel: recarregar,
+            # sem manter linhas de base e chaves de frames que não estão mais aqui
+            clear_local_messages()
+        evicted = messages_storage.restore(rows)
+        if evicted:
+            store_evictions.add(len(evicted))
+        for message_data in messages_storage.range(since=rows[0][0] - 1):
+            aggregates.add(message_data)
+            if dedup is not None:
+                dedup.add(message_keys(message_data), message_data["seq"])
+            if anomalies is not None:
+                # Linhas de base aprendem com os frames de todos os workers
+                anomalies.learn(message_data)
+                anomalies.record(message_data)
+        for message_data in evicted:
+            aggregates.remove(message_data)
+        broker.publish(messages_storage.last_seq)
+
+def shared_sync_loop():
+    while True:
+        time.sleep(SHM_POLL_MS / 1000)
+        try:
+            sync_shared_storage()
+        except Exception as e:
+            logger.error(f"[SHM] Erro ao sincronizar com o anel: {e}")
+
+def start_shared_sync():
+    """Sincronização periódica (stream SSE de mensagens recebidas por outros workers)"""
+    threading.Thread(target=shared_sync_loop, name="shm-sync", daemon=True).start()
+
+if SHM_RING_NAME:
+    open_shared_ring()
+elif WAL_DIR or SQLITE_PATH:
+    restore_storage()
 
 app = Flask(__name__)
 CORS(app)  # Permitir CORS para frontend
 
+def record_request(method, route, status, seconds):
+    """Registra latência e status de uma requisição (Flask ou ASGI)"""
+    http_latency.labels(method, route).observe(seconds)
+    http_requests.labels(method, route, str(status)).add()
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        # Rota do Flask (não a URL) para não criar uma série por caminho acessado
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        record_request(request.method, route, response.status_code, time.perf_counter() - start)
+    return response
+
+@app.before_request
+def sync_shared_request():
+    # Com vários workers, cada requisição vê as mensagens gravadas pelos demais
+    if ring is not None:
+        sync_shared_storage()
+
 @app.route('/')
 def index():
     """Página inicial com interface para visualizar detecções de moscas"""
@@ -967,86 +1290,70 @@ def index():
             `).join('');
         }
         
-        // Atualizar estatísticas
-        function updateStats(data) {
-            const captures = data.messages || [];
+        // Atualizar estatísticas a partir dos agregados do servidor
+        function updateStats(aggregates) {
+            const totals = aggregates.global;
+            const devices = aggregates.devices || {};
             
-            // Total de moscas detectadas
-            const totalFlies = captures.reduce((sum, cap) => {
-                return sum + (cap.deteccoes?.total || 0);
-            }, 0);
-            
-            // Total de capturas
-            const totalCaptures = captures.length;
-            
-            // Dispositivos LoRa únicos
-            const loraDevicesSet = new Set(captures.map(m => m.lora_id).filter(id => id));
-            const loraDevicesCount = loraDevicesSet.size || devicesData.length;
-            
-            // Calcular confiança média
-            let avgConfidence = 0;
-            let confCount = 0;
-            captures.forEach(cap => {
-                if (cap.deteccoes?.confianca_media) {
-                    avgConfidence += cap.deteccoes.confianca_media;
-                    confCount++;
-                }
-            });
-            avgConfidence = confCount > 0 ? ((avgConfidence / confCount) * 100).toFixed(1) : 0;
+            const totalFlies = totals.flies;
+            const totalCaptures = totals.captures;
+            const loraDevicesCount = totals.devices || devicesData.length;
+            const avgConfidence = (totals.avg_confidence * 100).toFixed(1);
             
             // Atualizar dispositivos com dados reais
             devicesData.forEach(device => {
-                const deviceCaptures = captures.filter(c => c.lora_id === device.id);
-                device.captures = deviceCaptures.length;
-                device.flies = deviceCaptures.reduce((sum, c) => sum + (c.deteccoes?.total || 0), 0);
-                
-                let devConfSum = 0;
-                let devConfCount = 0;
-                deviceCaptures.forEach(cap => {
-                    if (cap.deteccoes?.confianca_media) {
-                        devConfSum += cap.deteccoes.confianca_media;
-                        devConfCount++;
-                    }
-                });
-                device.avgConf = devConfCount > 0 ? ((devConfSum / devConfCount) * 100).toFixed(0) : 0;
+                const deviceTotals = devices[device.id];
+                device.captures = deviceTotals ? deviceTotals.captures : 0;
+                device.flies = deviceTotals ? deviceTotals.flies : 0;
+                device.avgConf = deviceTotals ? (deviceTotals.avg_confidence * 100).toFixed(0) : 0;
             });
             
-            // Calcular métricas de diagnóstico
-            let countExcessiva = 0;
-            let countAnormal = 0;
-            let avgOcupacao = 0;
-            let avgInferencia = 0;
-            let inferCount = 0;
-            
-            captures.forEach(cap => {
-                if (cap.diagnostico) {
-                    if (cap.diagnostico.ocupacao_excessiva) countExcessiva++;
-                    if (cap.diagnostico.anormal) countAnormal++;
-                }
-                if (cap.deteccoes?.ocupacao_pct) {
-                    avgOcupacao += cap.deteccoes.ocupacao_pct;
-                }
-                if (cap.tempo_inferencia_ms) {
-                    avgInferencia += cap.tempo_inferencia_ms;
-                    inferCount++;
-                }
-            });
-            
-            avgOcupacao = captures.length > 0 ? (avgOcupacao / captures.length).toFixed(1) : 0;
-            avgInferencia = inferCount > 0 ? (avgInferencia / inferCount).toFixed(1) : 0;
-            
             document.getElementById('total-flies').textContent = totalFlies;
             document.getElementById('total-captures').textContent = totalCaptures;
             document.getElementById('avg-confidence').textContent = avgConfidence + '%';
             document.getElementById('lora-devices').textContent = loraDevicesCount;
             
-            document.getElementById('avg-ocupacao').textContent = avgOcupacao + '%';
-            document.getElementById('avg-inference').textContent = avgInferencia + 'ms';
-            document.getElementById('count-excessiva').textContent = countExcessiva;
-            document.getElementById('count-anormal').textContent = countAnormal;
+            document.getElementById('avg-ocupacao').textContent = totals.avg_occupancy.toFixed(1) + '%';
+            document.getElementById('avg-inference').textContent = totals.avg_inference_ms.toFixed(1) + 'ms';
+            document.getElementById('count-excessiva').textContent = totals.count_excessive;
+            document.getElementById('count-anormal').textContent = totals.count_abnormal;
             
             document.getElementById('nav-total').textContent = totalFlies;
             document.getElementById('nav-devices').textContent = loraDevicesCount;
+            
+            // Atualizar grafico de deteccoes por hora
+            const hours = Object.keys(aggregates.hourly || {}).sort();
+            if (hours.length > 0) {
+                detectionsChart.data.labels = hours;
+                detectionsChart.data.datasets[0].data = hours.map(h => aggregates.hourly[h].flies);
+                detectionsChart.update('none');
+            }
+            
+            renderDevices();
+        }
+        
+        // Buscar agregados (no máximo uma requisição em andamento)
+        let aggregatesPending = false;
+        let aggregatesStale = false;
+        async function loadAggregates() {
+            if (aggregatesPending) {
+                aggregatesStale = true;
+                return;
+            }
+            aggregatesPending = true;
+            try {
+                const response = await fetch('/api/aggregates');
+                const data = await response.json();
+                updateStats(data.aggregates);
+            } catch (error) {
+                console.error('Erro ao carregar agregados:', error);
+            } finally {
+                aggregatesPending = false;
+                if (aggregatesStale) {
+                    aggregatesStale = false;
+                    setTimeout(loadAggregates, 1000);
+                }
+            }
         }
         
         // Renderizar tabela de detecções
@@ -1089,36 +1396,56 @@ def index():
         }
         
         // Carregar dados da API
+        // Cache local das mensagens recentes; apenas as novas (seq > lastSeq) são buscadas.
+        // Totais, dispositivos e grafico por hora vêm de /api/aggregates.
+        const RECENT_MESSAGES = 50;
+        let cachedMessages = [];
+        let lastSeq = null;
+        
+        function trimCache() {
+            if (cachedMessages.length > RECENT_MESSAGES) {
+                cachedMessages = cachedMessages.slice(-RECENT_MESSAGES);
+            }
+        }
+        
         async function loadData() {
             try {
-                const response = await fetch('/api/messages');
-                const data = await response.json();
+                const url = lastSeq === null
+                    ? `/api/messages?limit=${RECENT_MESSAGES}`
+                    : `/api/messages?since=${lastSeq}&limit=${RECENT_MESSAGES}`;
+                const response = await fetch(url);
+                const page = await response.json();
+                
+                // Servidor reiniciado ou mensagens apagadas: recarregar tudo
+                if (lastSeq !== null && (page.last_seq === null || page.last_seq < lastSeq)) {
+                    lastSeq = null;
+                    cachedMessages = [];
+                    return loadData();
+                }
+                
+                cachedMessages = cachedMessages.concat(page.messages || []);
+                if (page.first_seq !== null) {
+                    const firstKept = cachedMessages.findIndex(m => m.seq >= page.first_seq);
+                    if (firstKept > 0) cachedMessages = cachedMessages.slice(firstKept);
+                }
+                trimCache();
+                if (page.next_since !== null && page.next_since !== undefined) lastSeq = page.next_since;
+                renderData();
+                loadAggregates();
+            } catch (error) {
+                console.error('Erro ao carregar dados:', error);
+            }
+        }
+        
+        // Renderizar dashboard a partir do cache local
+        function renderData() {
+            try {
+                const data = { messages: cachedMessages };
                 
-                updateStats(data);
                 renderDetectionsTable(data.messages);
-                renderDevices();
                 
                 // Atualizar graficos com dados reais se disponiveis
                 if (data.messages && data.messages.length > 0) {
-                    // Agrupar moscas detectadas por hora (ultimas 24h)
-                    const hourlyDetections = {};
-                    data.messages.forEach(msg => {
-                        if (msg.timestamp) {
-                            const hour = msg.timestamp.split(' ')[1].split(':')[0] + ':00';
-                            const moscas = msg.deteccoes?.total || 0;
-                            hourlyDetections[hour] = (hourlyDetections[hour] || 0) + moscas;
-                        }
-                    });
-                    
-                    // Atualizar grafico de deteccoes por hora
-                    if (Object.keys(hourlyDetections).length > 0) {
-                        const hours = Object.keys(hourlyDetections).sort();
-                        const counts = hours.map(h => hourlyDetections[h]);
-                        detectionsChart.data.labels = hours;
-                        detectionsChart.data.datasets[0].data = counts;
-                        detectionsChart.update('none');
-                    }
-                    
                     // Atualizar grafico de confianca media ao longo do tempo
                     const confidenceData = data.messages
                         .filter(m => m.deteccoes?.confianca_media)
@@ -1152,16 +1479,77 @@ def index():
                 }
                 
             } catch (error) {
-                console.error('Erro ao carregar dados:', error);
+                console.error('Erro ao renderizar dados:', error);
             }
         }
         
+        // Agrupar várias mensagens do stream em uma única renderização
+        let renderPending = false;
+        function scheduleRender() {
+            if (renderPending) return;
+            renderPending = true;
+            requestAnimationFrame(() => {
+                renderPending = false;
+                renderData();
+            });
+        }
+        
+        // Receber novas detecções via Server-Sent Events
+        function startStream() {
+            const source = new EventSource(lastSeq === null ? '/api/stream' : `/api/stream?last_event_id=${lastSeq}`);
+            
+            source.addEventListener('message', (event) => {
+                const message = JSON.parse(event.data);
+                if (lastSeq !== null && message.seq <= lastSeq) return;
+                cachedMessages.push(message);
+                trimCache();
+                lastSeq = message.seq;
+                scheduleRender();
+            });
+            
+            // Alterações dos agregados a cada STREAM_AGGREGATES_SECONDS (o primeiro evento traz tudo)
+            let streamAggregates = null;
+            source.addEventListener('aggregates', (event) => {
+                const delta = JSON.parse(event.data);
+                if (delta.full || streamAggregates === null) {
+                    streamAggregates = { global: {}, devices: {}, hourly: {} };
+                }
+                streamAggregates.global = delta.global;
+                Object.assign(streamAggregates.devices, delta.devices);
+                Object.assign(streamAggregates.hourly, delta.hourly);
+                delta.removed_devices.forEach(device => delete streamAggregates.devices[device]);
+                delta.removed_hours.forEach(hour => delete streamAggregates.hourly[hour]);
+                updateStats(streamAggregates);
+            });
+            
+            source.addEventListener('stats', (event) => {
+                const summary = JSON.parse(event.data);
+                // Mensagens apagadas no servidor: recarregar tudo
+                if (summary.messages_stored === 0 && cachedMessages.length > 0) {
+                    cachedMessages = [];
+                    scheduleRender();
+                }
+                if (summary.first_seq !== null) {
+                    const firstKept = cachedMessages.findIndex(m => m.seq >= summary.first_seq);
+                    if (firstKept > 0) {
+                        cachedMessages = cachedMessages.slice(firstKept);
+                        scheduleRender();
+                    }
+                }
+            });
+            
+            return source;
+        }
+        
         // Inicializacao
         renderDevices();
-        loadData();
-        
-        // Atualizar dados reais da API a cada 5 segundos
-        setInterval(loadData, 5000);
+        if (window.EventSource) {
+            loadData().then(startStream);
+        } else {
+            // Navegadores sem SSE: polling incremental a cada 5 segundos
+            loadData();
+            setInterval(loadData, 5000);
+        }
     </script>
 </body>
 </html>
@@ -1170,21 +1558,604 @@ def index():
 
 @app.route('/api/messages', methods=['GET'])
 def get_messages():
-    """Retorna lista de mensagens armazenadas"""
+    """
+    Retorna lista de mensagens armazenadas
+
+    Parâmetros opcionais (query string):
+        since   - retorna apenas mensagens com seq maior que este valor
+        before  - retorna apenas mensagens com seq menor que este valor
+        limit   - número máximo de mensagens; sem since, retorna as mais recentes
+        device  - apenas mensagens deste dispositivo (lora_id)
+        gateway - apenas mensagens deste gateway (gateway_id)
+        status  - apenas mensagens com este diagnóstico: normal, alerta ou anormal
+        from/to - intervalo do horário da detecção (inclusive), como
+                  "YYYY-MM-DD", "YYYY-MM-DD HH:MM:SS" ou segundos desde a época
+
+    Sem parâmetros retorna todas as mensagens em memória (compatibilidade).
+    Com SQLITE_PATH configurado, filtros e cursores anteriores ao cache
+    em memória também consultam o banco, mas apenas para os seqs
+    anteriores ao cache: os recentes vêm da memória, mesmo antes de
+    serem gravados no banco.
+    """
     try:
-        messages_list = list(messages_storage)
+        since = request.args.get('since', type=int)
+        before = request.args.get('before', type=int)
+        limit = request.args.get('limit', type=int)
+        if limit is not None and limit < 0:
+            return jsonify({"success": False, "error": "limit inválido"}), 400
+        filters = {
+            "device": request.args.get('device'),
+            "gateway": request.args.get('gateway'),
+            "status": parse_status_param(request.args.get('status')),
+            "start": parse_time_param(request.args.get('from')),
+            "end": parse_time_param(request.args.get('to'), end_of_day=True)
+        }
+        
+        messages_list = query_messages(since, before, limit, **filters)
         
         return jsonify({
             "success": True,
             "messages": messages_list,
             "count": len(messages_list),
-            "stats": stats
+            "next_since": messages_list[-1]["seq"] if messages_list else since,
+            "first_seq": messages_storage.first_seq,
+            "last_seq": messages_storage.last_seq,
+            "stats": current_stats()
         }), 200
-        
+    
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         logger.error(f"[ERROR] Erro ao listar mensagens: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+def parse_time_param(value, end_of_day=False):
+    """Converte from/to em segundos desde a época (mesma convenção dos timestamps armazenados)"""
+    if not value:
+        return None
+    if value.lstrip('-').isdigit():
+        return int(value)
+    if len(value) == 10:
+        value += " 23:59:59" if end_of_day else " 00:00:00"
+    seconds = parse_timestamp(value.replace('T', ' ', 1))
+    if seconds is None:
+        raise ValueError(f"Data inválida: {value}")
+    return seconds
+
+def parse_status_param(value):
+    """Valida o filtro status (normal, alerta ou anormal)"""
+    if not value:
+        return None
+    status = value.lower()
+    if status not in STATUSES:
+        raise ValueError(f"status inválido: use {', '.join(STATUSES)}")
+    return status
+
+def query_messages(since=None, before=None, limit=None, device=None, gateway=None, status=None, start=None, end=None):
+    """
+    Seleciona mensagens no cache em memória (pelos índices do MessageStore) e, se necessário, no SQLite
+
+    O cache guarda todos os seqs a partir de first_seq, inclusive os que a
+    thread do SQLite ainda não gravou: o banco só responde pelos seqs
+    anteriores a ele. Sem filtros nem cursores anteriores ao cache, apenas
+    o cache é consultado (compatibilidade).
+    """
+    filtered = device is not None or gateway is not None or status is not None or start is not None or end is not None
+    first_seq = messages_storage.first_seq
+    if backend is None or not (
+        filtered or
+        (first_seq is not None and since is not None and since < first_seq - 1) or
+        (first_seq is not None and before is not None and before - (limit or 0) <= first_seq)
+    ):
+        return messages_storage.select(since, before, limit, device, gateway, status, start, end)
+
+    def history(since, before, limit):
+        # Seqs despejados do cache podem ainda estar na fila de gravação
+        backend.flush(timeout=5)
+        return backend.query(since, before, limit, device, gateway, start, end, status)
+
+    if first_seq is None:
+        return history(since, before, limit)
+    if since is not None and since >= first_seq - 1:
+        return messages_storage.select(since, before, limit, device, gateway, status, start, end)
+    if before is not None and before <= first_seq:
+        return history(since, before, limit)
+
+    if since is not None:
+        # Em ordem crescente a partir de since: histórico, depois o cache
+        older = history(since, first_seq, limit)
+        if limit is not None and len(older) >= limit:
+            return older
+        remaining = None if limit is None else limit - len(older)
+        return older + messages_storage.select(first_seq - 1, before, remaining, device, gateway, status, start, end)
+
+    # As mais recentes: o cache, completado pelo histórico
+    recent = messages_storage.select(None, before, limit, device, gateway, status, start, end)
+    if limit is not None and len(recent) >= limit:
+        return recent
+    return history(None, first_seq, None if limit is None else limit - len(recent)) + recent
+
+def export_pages(device=None, gateway=None, status=None, start=None, end=None):
+    """
+    Mensagens filtradas em páginas de até EXPORT_PAGE_SIZE, em ordem de seq
+
+    Percorre o SQLite (histórico completo) ou o armazenamento em memória
+    com um cursor de seq, até o último seq existente no início da
+    exportação: apenas uma página fica em memória por vez. Mensagens
+    despejadas da memória durante a exportação ficam de fora.
+    """
+    if backend is not None:
+        backend.flush(timeout=5)
+        high = backend.max_seq()
+    else:
+        high = messages_storage.last_seq
+    if high is None:
+        return
+    since = -1
+    while True:
+        if backend is not None:
+            page = backend.query(since, high + 1, EXPORT_PAGE_SIZE, device, gateway, start, end, status)
+        else:
+            page = messages_storage.select(since, high + 1, EXPORT_PAGE_SIZE, device, gateway, status, start, end)
+        if not page:
+            return
+        since = page[-1]["seq"]
+        yield page
+
+# Colunas do CSV: (grupo, chave); as listas (deteccoes.itens) ficam de fora
+EXPORT_CSV_FIELDS = (
+    (None, "seq"), (None, "timestamp"), (None, "lora_id"), (None, "gateway_id"), (None, "message_id"),
+    (None, "rssi"), (None, "snr"), (None, "tempo_inferencia_ms"),
+    ("deteccoes", "total"), ("deteccoes", "confianca_media"), ("deteccoes", "confianca_min"),
+    ("deteccoes", "confianca_max"), ("deteccoes", "ocupacao_pct"), ("deteccoes", "limiar_confianca"),
+    ("deteccoes", "area_total_px"),
+    ("diagnostico", "ocupacao_excessiva"), ("diagnostico", "anormal"),
+    ("diagnostico_servidor", "ocupacao_excessiva"), ("diagnostico_servidor", "anormal"),
+    (None, "received_at"), (None, "source_ip"), (None, "original_format")
+)
+
+def export_row(message_data):
+    """Linha do CSV: campos de deteccoes/diagnostico/diagnostico_servidor achatados com prefixo do grupo"""
+    row = []
+    for group, key in EXPORT_CSV_FIELDS:
+        if group is None:
+            value = message_data.get(key)
+        else:
+            value = (message_data.get(group) or {}).get(key)
+        row.append("" if value is None else str(value).lower() if isinstance(value, bool) else value)
+    return row
+
+def export_ndjson(pages):
+    """Uma mensagem JSON por linha; um bloco por página"""
+    dumps = payload_codec.dumps
+    for page in pages:
+        yield b"".join(dumps(message_data) + b"\n" for message_data in page)
+
+def export_csv(pages):
+    """Cabeçalho seguido de uma linha por mensagem; um bloco por página"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow([key if group is None else f"{group}_{key}" for group, key in EXPORT_CSV_FIELDS])
+    yield buffer.getvalue()
+    for page in pages:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(export_row(message_data) for message_data in page)
+        yield buffer.getvalue()
+
+@app.route('/api/export', methods=['GET'])
+def export_messages():
+    """
+    Exporta as mensagens em NDJSON ou CSV, em streaming
+
+    Parâmetros opcionais (query string):
+        format  - ndjson (padrão) ou csv
+        device  - apenas mensagens deste dispositivo (lora_id)
+        gateway - apenas mensagens deste gateway (gateway_id)
+        status  - normal, alerta ou anormal
+        from/to - intervalo do horário da detecção, como em GET /api/messages
+
+    A resposta é gerada página a página (EXPORT_PAGE_SIZE mensagens), com
+    memória constante independentemente do tamanho do resultado. Com
+    SQLITE_PATH configurado, exporta o histórico completo.
+    """
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"success": False, "error": f"format inválido: use {' ou '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        pages = export_pages(
+            device=request.args.get('device'),
+            gateway=request.args.get('gateway'),
+            status=parse_status_param(request.args.get('status')),
+            start=parse_time_param(request.args.get('from')),
+            end=parse_time_param(request.args.get('to'), end_of_day=True)
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    
+    generate, mimetype = EXPORT_FORMATS[export_format]
+    filename = f"trapeyes-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    return Response(
+        generate(pages),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+EXPORT_FORMATS = {
+    "ndjson": (export_ndjson, "application/x-ndjson"),
+    "csv": (export_csv, "text/csv")
+}
+
+def count_stat(key, amount=1):
+    """Incrementa uma estatística (no anel compartilhado, se configurado)"""
+    if ring is not None:
+        ring.add(key, amount)
+    else:
+        counters.add(key, amount)
+
+def current_stats():
+    """Contadores atuais (do anel compartilhado, se configurado) e horário de início"""
+    values = ring.counters() if ring is not None else counters.snapshot()
+    return {**values, "start_time": start_time}
+
+def record_ingest(messages):
+    """Contabiliza as mensagens armazenadas por formato, os frames por gateway e as retransmissões"""
+    formats = {}
+    gateways = {}
+    duplicates = 0
+    for message_data in messages:
+        if message_data.get("duplicate"):
+            duplicates += 1
+        else:
+            message_format = message_data["original_format"]
+            formats[message_format] = formats.get(message_format, 0) + 1
+        gateway_id = message_data.get("gateway_id")
+        if gateway_id is not None:
+            gateway_id = str(gateway_id)
+            gateways[gateway_id] = gateways.get(gateway_id, 0) + 1
+    for message_format, count in formats.items():
+        ingest_counter.labels(message_format).add(count)
+    for gateway_id, count in gateways.items():
+        gateway_frames.labels(gateway_id).add(count)
+    if duplicates:
+        duplicate_frames.add(duplicates)
+
+def notify_alerts(messages):
+    """Enfileira para o Telegram os alertas das mensagens armazenadas (retransmissões ficam de fora)"""
+    if notifier is None:
+        return
+    for message_data in messages:
+        if not message_data.get("duplicate"):
+            notifier.notify(message_data)
+
+def forward_messages(messages):
+    """Enfileira as mensagens armazenadas para os webhooks (retransmissões ficam de fora)"""
+    if webhooks is None:
+        return
+    webhooks.put([message_data for message_data in messages if not message_data.get("duplicate")])
+
+def split_duplicates(messages):
+    """
+    Separa as retransmissões de mensagens já armazenadas ou anteriores no mesmo lote
+
+    As retransmissões recebem "duplicate": True. Retorna (mensagens novas
+    com suas chaves, pares (cópia, original) de repetições dentro do lote,
+    {seq armazenado: cópia com o melhor sinal}); as cópias de repetições
+    dentro do lote recebem o seq depois que a original for armazenada.
+    """
+    fresh = []
+    repeated = []
+    best_copies = {}
+    pending = {}
+    for message_data in messages:
+        keys = message_keys(message_data)
+        original = next((pending[key] for key in keys if key in pending), None)
+        if original is not None:
+            message_data["duplicate"] = True
+            repeated.append((message_data, original))
+            continue
+        seq = dedup.find(keys)
+        if seq is not None:
+            message_data["duplicate"] = True
+            message_data["seq"] = seq
+            keep_best_copy(best_copies, message_data)
+            continue
+        fresh.append((message_data, keys))
+        for key in keys:
+            pending[key] = message_data
+    return fresh, repeated, best_copies
+
+def keep_best_copy(best_copies, message_data):
+    best = best_copies.get(message_data["seq"])
+    if best is None or signal_quality(message_data) > signal_quality(best):
+        best_copies[message_data["seq"]] = message_data
+
+def signal_fields(message_data):
+    """Campos que identificam por qual gateway (e com que sinal) o frame chegou"""
+    return {key: message_data[key] for key in ("gateway_id", "message_id", "rssi", "snr") if key in message_data}
+
+def keep_best_signal(best_copies):
+    """Atualiza RSSI/SNR e gateway das mensagens armazenadas que chegaram com sinal melhor por outro gateway"""
+    for seq, copy in best_copies.items():
+        stored = messages_storage.get(seq)
+        if stored is None or signal_quality(copy) <= signal_quality(stored):
+            continue
+        updated = messages_storage.update(seq, signal_fields(copy))
+        if updated is None:
+            continue
+        if backend is not None:
+            backend.write([updated])
+        if wal is not None:
+            payload = messages_storage.pack(seq)
+            if payload is not None:
+                wal.update(seq, payload)
+
+def diagnose_messages(messages):
+    """Anexa o diagnóstico do servidor (limiares atuais) a cada mensagem"""
+    thresholds = diagnosis_thresholds
+    for message_data in messages:
+        message_data["diagnostico_servidor"] = diagnose(message_data, thresholds)
+
+def flag_anomalies(messages, learn=True):
+    """
+    Marca em ``diagnostico.anomalia`` os frames fora da linha de base do dispositivo
+
+    Com ``learn``, cada frame também atualiza a linha de base (O(1)); com o
+    anel compartilhado, a atualização fica para a sincronização, que vê os
+    frames de todos os workers.
+    """
+    check = anomalies.observe if learn else anomalies.score
+    flagged = 0
+    for message_data in messages:
+        anomaly = check(message_data)
+        if anomaly is not None:
+            diagnostico = message_data.get("diagnostico")
+            if not isinstance(diagnostico, dict):
+                diagnostico = message_data["diagnostico"] = {}
+            diagnostico["anomalia"] = anomaly
+            flagged += 1
+    if flagged:
+        anomaly_frames.add(flagged)
+
+def store_messages(messages):
+    """
+    Armazena as mensagens (atribuindo seq) e atualiza agregados e stream
+
+    Retransmissões (dedup.py) não são inseridas: ficam com "duplicate": True
+    e o seq da mensagem original, que passa a ter o RSSI/SNR e o gateway
+    da cópia com melhor sinal.
+    """
+    if ring is not None:
+        store_shared_messages(messages)
+        return
+    with store_lock:
+        diagnose_messages(messages)
+        if dedup is not None:
+            fresh, repeated, best_copies = split_duplicates(messages)
+            messages = [message_data for message_data, _ in fresh]
+        if anomalies is not None:
+            flag_anomalies(messages)
+        evicted = messages_storage.extend(messages)
+        if evicted:
+            store_evictions.add(len(evicted))
+        if anomalies is not None:
+            for message_data in messages:
+                anomalies.record(message_data)
+        if backend is not None:
+            backend.write(messages)
+        if wal is not None:
+            records = ((message_data["seq"], messages_storage.pack(message_data["seq"])) for message_data in messages)
+            wal.append([(seq, payload) for seq, payload in records if payload is not None])
+        for message_data in messages:
+            aggregates.add(message_data)
+        for message_data in evicted:
+            aggregates.remove(message_data)
+        if dedup is not None:
+            for message_data, keys in fresh:
+                dedup.add(keys, message_data["seq"])
+            for message_data, original in repeated:
+                message_data["seq"] = original["seq"]
+                keep_best_copy(best_copies, message_data)
+            keep_best_signal(best_copies)
+        if messages:
+            broker.publish(messages[-1]["seq"])
+
+def store_shared_messages(messages):
+    """
+    Anexa as mensagens ao anel compartilhado e sincroniza o armazenamento local
+
+    As retransmissões são descartadas com o índice alimentado pela
+    sincronização, mas a mensagem original no anel não é atualizada.
+    """
+    repeated = ()
+    diagnose_messages(messages)
+    if dedup is not None:
+        fresh, repeated, _ = split_duplicates(messages)
+        messages = [message_data for message_data, _ in fresh]
+    if not messages:
+        return
+    if anomalies is not None:
+        flag_anomalies(messages, learn=False)
+    payloads = []
+    for message_data in messages:
+        payload = messages_storage.pack_message(message_data)
+        if len(payload) > ring.max_payload:
+            logger.warning(f"[SHM] Mensagem de {len(payload)} bytes excede o slot; campos extras descartados")
+            payload = messages_storage.pack_message(message_data, residual=False)
+        payloads.append(payload)
+    first_seq = ring.append(payloads)
+    for offset, message_data in enumerate(messages):
+        message_data["seq"] = first_seq + offset
+    if backend is not None:
+        backend.write(messages)
+    sync_shared_storage()
+    for message_data, original in repeated:
+        message_data["seq"] = original["seq"]
+
+@app.route('/api/aggregates', methods=['GET'])
+def get_aggregates():
+    """
+    Retorna agregados das mensagens armazenadas
+
+    Totais globais, por dispositivo e por hora do dia (moscas, capturas,
+    médias de confiança, ocupação e inferência, contagem de alertas),
+    mantidos incrementalmente a cada inserção e despejo.
+    """
+    return jsonify({
+        "success": True,
+        "aggregates": aggregates.snapshot(),
+        "last_seq": broker.last_seq
+    }), 200
+
+@app.route('/api/anomalies', methods=['GET'])
+def get_anomalies():
+    """
+    Frames anômalos recentes (desvio da linha de base EWMA do dispositivo)
+
+    Parâmetros opcionais (query string):
+        since  - apenas frames com seq maior que este valor
+        limit  - número máximo de frames; sem since, retorna os mais recentes
+        device - apenas frames deste dispositivo (inclui a linha de base atual)
+    """
+    if anomalies is None:
+        return jsonify({"success": False, "error": "Detecção de anomalias desativada (ANOMALY_SIGMA=0)"}), 404
+    since = request.args.get('since', type=int)
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit < 0:
+        return jsonify({"success": False, "error": "limit inválido"}), 400
+    device = request.args.get('device')
+    entries = anomalies.feed(since, limit, device)
+    
+    return jsonify({
+        "success": True,
+        "anomalies": entries,
+        "count": len(entries),
+        "next_since": entries[-1]["seq"] if entries else since,
+        "baseline": anomalies.baseline(device) if device is not None else None,
+        "stats": anomalies.stats()
+    }), 200
+
+def format_sse(event, data, event_id=None):
+    """Formata um evento Server-Sent Events"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {payload_codec.dumps(data).decode('utf-8')}")
+    return "\n".join(lines) + "\n\n"
+
+def stream_cursor(last_event_id):
+    """
+    Seq a partir do qual o stream começa (ValueError se o id for inválido)
+
+    Sem id, apenas mensagens novas. Um id à frente do último seq publicado
+    (servidor reiniciado sem WAL) é trazido de volta, senão o cliente só
+    receberia mensagens quando o seq passasse dele.
+    """
+    if not last_event_id:
+        return broker.last_seq
+    return min(int(last_event_id), broker.last_seq)
+
+def read_stream(last_seq):
+    """
+    Próximas mensagens do stream depois de ``last_seq``; retorna (mensagens, novo cursor)
+
+    Se nada depois do cursor está armazenado mas o broker já publicou seqs
+    maiores, elas foram apagadas (DELETE) ou despejadas: o cursor avança
+    até o último seq publicado em vez de continuar lendo um intervalo vazio.
+    """
+    # Lido antes do armazenamento: tudo até ele já foi gravado quando foi publicado
+    published = broker.last_seq
+    messages_list = messages_storage.range(since=last_seq, limit=STREAM_BATCH_SIZE)
+    if messages_list:
+        return messages_list, messages_list[-1]["seq"]
+    return messages_list, max(last_seq, published)
+
+def stream_aggregates(previous):
+    """
+    Evento "aggregates" com o que mudou desde o snapshot ``previous``
+
+    Retorna (evento ou None se nada mudou, snapshot atual). O snapshot é
+    compartilhado entre os assinantes enquanto os agregados não mudam.
+    """
+    current = aggregates.snapshot()
+    if current is previous:
+        return None, previous
+    return format_sse("aggregates", snapshot_delta(previous, current)), current
+
+def stream_events(last_seq):
+    """Gera eventos SSE a partir do seq informado até o cliente desconectar"""
+    broker.subscribe()
+    try:
+        yield "retry: 3000\n\n"
+        snapshot = None
+        aggregates_due = time.monotonic()
+        stats_due = aggregates_due + STREAM_KEEPALIVE_SECONDS
+        while True:
+            now = time.monotonic()
+            if now >= aggregates_due:
+                # Com ou sem mensagens novas: alterações dos agregados a cada intervalo
+                event, snapshot = stream_aggregates(snapshot)
+                if event is not None:
+                    yield event
+                aggregates_due = now + STREAM_AGGREGATES_SECONDS
+            messages_list, last_seq = read_stream(last_seq)
+            if messages_list:
+                for message_data in messages_list:
+                    yield format_sse("message", message_data, message_data["seq"])
+                stats_due = time.monotonic() + STREAM_KEEPALIVE_SECONDS
+                continue
+            
+            if now >= stats_due:
+                # Sem novidades no intervalo: enviar resumo (também serve de keepalive)
+                yield format_sse("stats", stream_stats())
+                stats_due = now + STREAM_KEEPALIVE_SECONDS
+            broker.wait(last_seq, max(min(aggregates_due, stats_due) - time.monotonic(), 0.01))
+    finally:
+        broker.unsubscribe()
+
+def stream_stats():
+    """Resumo enviado no evento "stats" do stream"""
+    stats = current_stats()
+    return {
+        **stats,
+        # Em ISO 8601: o backend json da biblioteca padrão não serializa datetime
+        "start_time": stats["start_time"].isoformat(),
+        "messages_stored": len(messages_storage),
+        "first_seq": messages_storage.first_seq,
+        "last_seq": broker.last_seq
+    }
+
+@app.route('/api/stream', methods=['GET'])
+def stream_messages():
+    """
+    Stream (Server-Sent Events) das detecções armazenadas
+
+    Cada mensagem é enviada como evento "message" com id igual ao seq.
+    Ao reconectar, o navegador envia Last-Event-ID e o stream retoma a
+    partir dali usando o armazenamento em memória. Sem cursor, apenas
+    mensagens novas são enviadas. A cada STREAM_AGGREGATES_SECONDS envia
+    um evento "aggregates" com as alterações dos agregados e, sem
+    novidades por STREAM_KEEPALIVE_SECONDS, um evento "stats".
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_seq = stream_cursor(last_event_id)
+    except ValueError:
+        return jsonify({"success": False, "error": "Last-Event-ID inválido"}), 400
+    
+    return Response(
+        stream_events(last_seq),
+        mimetype='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
 def expand_lora_payload(raw_data):
     """
     Converte payload do gateway LoRa para formato expandido interno
@@ -1215,105 +2186,210 @@ def expand_lora_payload(raw_data):
         "id": "trap_eye_01"      # id do dispositivo
     }
     
+    O lora_data também pode ser o frame binário (lora_codec) em base64,
+    ou os próprios bytes do frame quando recebido como application/octet-stream.
+    
     Retorna formato expandido para processamento interno
     """
     # Detectar formato do gateway LoRa (com lora_data)
     if "lora_data" in raw_data:
-        # Extrair dados do gateway
-        gateway_id = raw_data.get("client_id", "UNKNOWN_GATEWAY")
-        message_id = raw_data.get("message_id", 0)
-        rssi = raw_data.get("rssi", 0)
-        snr = raw_data.get("snr", 0)
-        
-        # Parsear lora_data (string JSON)
-        lora_data_str = raw_data.get("lora_data", "{}")
-        try:
-            compact_data = json.loads(lora_data_str)
-        except json.JSONDecodeError:
-            logger.error(f"[ERROR] Erro ao decodificar lora_data: {lora_data_str}")
-            compact_data = {}
-        
-        # Processar dados LoRa
-        dt = compact_data.get("dt", "")  # ddmmyyyy
-        hr = compact_data.get("hr", "00:00:00")
-        
-        # Converter data de ddmmyyyy para yyyy-mm-dd
-        if len(dt) == 8:
-            day = dt[0:2]
-            month = dt[2:4]
-            year = dt[4:8]
-            timestamp = f"{year}-{month}-{day} {hr}"
-        else:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Parsear lora_data (string JSON ou frame binário)
+        compact_data = decode_lora_data(raw_data.get("lora_data", "{}"))
         
         # Expandir payload completo
-        expanded = {
-            "timestamp": timestamp,
-            "gateway_id": gateway_id,
-            "message_id": message_id,
-            "rssi": rssi,
-            "snr": snr,
-            "tempo_inferencia_ms": compact_data.get("ti", 0),
-            "deteccoes": {
-                "total": compact_data.get("m", 0),
-                "limiar_confianca": 0.5,  # Valor padrão (não vem no LoRa)
-                "confianca_media": compact_data.get("cm", 0),
-                "confianca_min": compact_data.get("cmin", 0),
-                "confianca_max": compact_data.get("cmax", 0),
-                "ocupacao_pct": compact_data.get("op", 0),
-                "area_total_px": 0,  # Não disponível no formato compacto
-                "itens": []  # Bounding boxes não são enviadas pelo LoRa
-            },
-            "diagnostico": {
-                "ocupacao_excessiva": compact_data.get("dg", {}).get("oe", False),
-                "anormal": compact_data.get("dg", {}).get("an", False)
-            },
-            "lora_id": compact_data.get("id", "UNKNOWN")
+        return {
+            "timestamp": expand_timestamp(compact_data),
+            "gateway_id": raw_data.get("client_id", "UNKNOWN_GATEWAY"),
+            "message_id": raw_data.get("message_id", 0),
+            "rssi": raw_data.get("rssi", 0),
+            "snr": raw_data.get("snr", 0),
+            **expand_compact(compact_data)
         }
-        
-        return expanded
     
     # Detectar se é formato compacto direto (LoRa sem gateway)
     elif "dt" in raw_data and "hr" in raw_data:
-        # Formato compacto LoRa - expandir
-        dt = raw_data.get("dt", "")  # ddmmyyyy
-        hr = raw_data.get("hr", "00:00:00")
-        
-        # Converter data de ddmmyyyy para yyyy-mm-dd
-        if len(dt) == 8:
-            day = dt[0:2]
-            month = dt[2:4]
-            year = dt[4:8]
-            timestamp = f"{year}-{month}-{day} {hr}"
-        else:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Expandir payload
-        expanded = {
-            "timestamp": timestamp,
-            "tempo_inferencia_ms": raw_data.get("ti", 0),
-            "deteccoes": {
-                "total": raw_data.get("m", 0),
-                "limiar_confianca": 0.5,  # Valor padrão (não vem no LoRa)
-                "confianca_media": raw_data.get("cm", 0),
-                "confianca_min": raw_data.get("cmin", 0),
-                "confianca_max": raw_data.get("cmax", 0),
-                "ocupacao_pct": raw_data.get("op", 0),
-                "area_total_px": 0,  # Não disponível no formato compacto
-                "itens": []  # Bounding boxes não são enviadas pelo LoRa
-            },
-            "diagnostico": {
-                "ocupacao_excessiva": raw_data.get("dg", {}).get("oe", False),
-                "anormal": raw_data.get("dg", {}).get("an", False)
-            },
-            "lora_id": raw_data.get("id", "UNKNOWN")
+        return {
+            "timestamp": expand_timestamp(raw_data),
+            **expand_compact(raw_data)
         }
-        
-        return expanded
     else:
         # Já está no formato expandido (compatibilidade legado)
         return raw_data
 
+def decode_lora_data(lora_data):
+    """
+    Decodifica o lora_data do gateway: JSON compacto, frame binário em base64 ou bytes
+
+    Um lora_data já decodificado junto com o envelope (payload_codec.decode_body)
+    é usado como está.
+    """
+    try:
+        if isinstance(lora_data, dict):
+            return lora_data
+        if isinstance(lora_data, (bytes, bytearray)):
+            return lora_codec.decode(lora_data, LORA_DEVICE_TABLE)
+        if lora_data.lstrip().startswith("{"):
+            return payload_codec.decode_compact(lora_data)
+        return lora_codec.decode(base64.b64decode(lora_data, validate=True), LORA_DEVICE_TABLE)
+    except (ValueError, binascii.Error, AttributeError) as e:
+        decode_errors.labels("lora_data").add()
+        logger.error("[ERROR] Erro ao decodificar lora_data: %r (%s)", lora_data, e)
+        return {}
+
+def expand_timestamp(compact_data):
+    """Converte dt (ddmmyyyy) + hr para "yyyy-mm-dd HH:MM:SS" (agora, se dt inválido)"""
+    dt = compact_data.get("dt", "")  # ddmmyyyy
+    hr = compact_data.get("hr", "00:00:00")
+    if len(dt) == 8:
+        day = dt[0:2]
+        month = dt[2:4]
+        year = dt[4:8]
+        return f"{year}-{month}-{day} {hr}"
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def expand_compact(compact_data):
+    """Campos expandidos de detecção/diagnóstico a partir do formato compacto"""
+    get = compact_data.get
+    dg = get("dg", {})
+    return {
+        "tempo_inferencia_ms": get("ti", 0),
+        "deteccoes": {
+            "total": get("m", 0),
+            "limiar_confianca": 0.5,  # Valor padrão (não vem no LoRa)
+            "confianca_media": get("cm", 0),
+            "confianca_min": get("cmin", 0),
+            "confianca_max": get("cmax", 0),
+            "ocupacao_pct": get("op", 0),
+            "area_total_px": 0,  # Não disponível no formato compacto
+            "itens": []  # Bounding boxes não são enviadas pelo LoRa
+        },
+        "diagnostico": {
+            "ocupacao_excessiva": dg.get("oe", False),
+            "anormal": dg.get("an", False)
+        },
+        "lora_id": get("id", "UNKNOWN")
+    }
+
+def detect_format(raw_data):
+    """Identifica o formato de entrada: gateway_lora, lora_compact ou expanded"""
+    if "lora_data" in raw_data:
+        return "gateway_lora"
+    if "dt" in raw_data:
+        return "lora_compact"
+    return "expanded"
+
+def build_message(raw_data, client_ip):
+    """
+    Expande o payload e adiciona os metadados de armazenamento
+
+    Retorna a mensagem pronta para ser armazenada em messages_storage.
+    """
+    data = expand_lora_payload(raw_data)
+    return {
+        **data,
+        "source_ip": client_ip,
+        "processed": True,
+        "received_at": datetime.now().isoformat(),
+        "original_format": detect_format(raw_data)
+    }
+
+def json_response(payload, status=200, headers=None):
+    """Resposta JSON serializada pelo payload_codec (mais rápido que jsonify)"""
+    return Response(payload_codec.dumps(payload), status=status, headers=headers, mimetype='application/json')
+
+def ingest_headers(body):
+    """Cabeçalhos extras da resposta de ingestão (Retry-After no 429)"""
+    retry_after = body.get("retry_after")
+    return {"Retry-After": str(retry_after)} if retry_after is not None else None
+
+def rate_limit_key(raw_data, client_ip):
+    """Chave do limite de taxa: o gateway (client_id do payload) ou, sem ele, o IP de origem"""
+    client_id = raw_data.get("client_id") if isinstance(raw_data, dict) else None
+    return f"gateway:{client_id}" if client_id is not None else f"ip:{client_ip}"
+
+def check_rate_limit(key, cost=1):
+    """Consome fichas do limite de taxa; retorna None ou a resposta 429 (corpo, status)"""
+    if rate_limiter is None:
+        return None
+    wait = rate_limiter.acquire(key, cost)
+    if not wait:
+        return None
+    rate_limited.add()
+    retry_after = max(1, math.ceil(wait))
+    logger.debug("[RATE] %s limitado por %s s", key, retry_after)
+    return {"success": False, "error": "Limite de requisições excedido", "retry_after": retry_after}, 429
+
+def limit_batch(items, client_ip):
+    """
+    Limite de taxa de um lote: cada item consome uma ficha do seu gateway
+
+    Cada gateway admite tantos itens quantas forem as suas fichas; os
+    seguintes são recusados. Retorna {índice: retry_after} dos recusados.
+    """
+    if rate_limiter is None:
+        return {}
+    indexes_by_key = {}
+    for index, item in enumerate(items):
+        indexes_by_key.setdefault(rate_limit_key(item, client_ip), []).append(index)
+    refused = {}
+    for key, indexes in indexes_by_key.items():
+        granted, wait = rate_limiter.acquire_up_to(key, len(indexes))
+        if granted < len(indexes):
+            retry_after = max(1, math.ceil(wait))
+            logger.debug("[RATE] %s: %s de %s itens limitados por %s s", key, len(indexes) - granted, len(indexes), retry_after)
+            for index in indexes[granted:]:
+                refused[index] = retry_after
+    if refused:
+        rate_limited.add()
+    return refused
+
+def is_json_mimetype(mimetype):
+    """Mesmo critério de request.is_json: application/json ou application/*+json"""
+    return mimetype == 'application/json' or (mimetype.startswith('application/') and mimetype.endswith('+json'))
+
+def decode_json_body(mimetype, body):
+    """
+    Decodifica um corpo JSON, incluindo o lora_data do gateway
+
+    Retorna None se o corpo não for JSON válido.
+    """
+    if not is_json_mimetype(mimetype):
+        return None
+    try:
+        return payload_codec.decode_body(body)
+    except payload_codec.PayloadDecodeError:
+        decode_errors.labels("body").add()
+        return None
+
+def binary_frame_payload(frame, headers):
+    """
+    Monta o payload do gateway para um frame binário enviado como corpo da requisição
+
+    Metadados opcionais nos cabeçalhos (werkzeug Headers): X-Gateway-Id,
+    X-Message-Id, X-RSSI e X-SNR.
+    """
+    if not frame:
+        return None
+    def number(value):
+        return int(value) if value.lstrip('-').isdigit() else float(value)
+    
+    return {
+        "client_id": headers.get('X-Gateway-Id', 'UNKNOWN_GATEWAY'),
+        "message_id": headers.get('X-Message-Id', 0, type=int),
+        "lora_data": frame,
+        "rssi": headers.get('X-RSSI', 0, type=number),
+        "snr": headers.get('X-SNR', 0, type=number)
+    }
+
+def parse_message_body(mimetype, body, headers):
+    """Payload de POST /api/messages: frame LoRa binário bruto (octet-stream) ou JSON"""
+    if mimetype == 'application/octet-stream':
+        return binary_frame_payload(body, headers)
+    return decode_json_body(mimetype, body)
+
+def request_client_ip():
+    return request.environ.get('HTTP_X_REAL_IP', request.remote_addr)
+
 @app.route('/api/messages', methods=['POST'])
 def receive_message():
     """
@@ -1362,75 +2438,230 @@ def receive_message():
         "lora_id": "trap_eye_01"
     }
     """
+    raw_data = parse_message_body(request.mimetype, request.get_data(), request.headers)
+    body, status = ingest_message(raw_data, request_client_ip())
+    return json_response(body, status, ingest_headers(body))
+
+def ingest_message(raw_data, client_ip):
+    """
+    Expande e armazena uma detecção já decodificada
+
+    Compartilhado pelo servidor Flask e pelo ASGI (asgi.py).
+    Retorna (corpo da resposta, status HTTP).
+    """
     try:
-        stats["total_messages"] += 1
+        limited = check_rate_limit(rate_limit_key(raw_data, client_ip))
+        if limited is not None:
+            return limited
+        
+        count_stat("total_messages")
         
-        # Validar JSON
-        raw_data = request.get_json()
-        if not raw_data:
+        if not raw_data or not isinstance(raw_data, dict):
             logger.warning("[ERROR] JSON inválido ou ausente")
-            return jsonify({"success": False, "error": "JSON inválido"}), 400
+            return {"success": False, "error": "JSON inválido"}, 400
         
-        # Expandir payload se necessário (LoRa -> formato interno)
-        data = expand_lora_payload(raw_data)
+        # Expandir payload (LoRa -> formato interno) e adicionar metadata
+        message_data = build_message(raw_data, client_ip)
         
         # Extrair dados do formato expandido
-        client_ip = request.environ.get('HTTP_X_REAL_IP', request.remote_addr)
-        deteccoes = data.get('deteccoes', {})
+        deteccoes = message_data.get('deteccoes', {})
         total_moscas = deteccoes.get('total', 0)
-        lora_id = data.get('lora_id', 'Desconhecido')
-        gateway_id = data.get('gateway_id', 'Direto')
-        diagnostico = data.get('diagnostico', {})
-        rssi = data.get('rssi', 0)
-        snr = data.get('snr', 0)
-        
-        # Log da requisição
-        status = "ANORMAL" if diagnostico.get('anormal') else "ALERTA" if diagnostico.get('ocupacao_excessiva') else "NORMAL"
-        logger.info(f"[{status}] {total_moscas} moscas | Device: {lora_id} | Gateway: {gateway_id} | RSSI: {rssi} dBm | SNR: {snr} dB")
-        
-        # Adicionar metadata
-        message_data = {
-            **data,
-            "source_ip": client_ip,
-            "processed": True,
-            "received_at": datetime.now().isoformat(),
-            "original_format": "gateway_lora" if "lora_data" in raw_data else ("lora_compact" if "dt" in raw_data else "expanded")
-        }
-        
-        # Armazenar mensagem
-        messages_storage.append(message_data)
-        logger.info(f"[STORAGE] Detecção armazenada (total: {len(messages_storage)})")
+        lora_id = message_data.get('lora_id', 'Desconhecido')
+        gateway_id = message_data.get('gateway_id', 'Direto')
+        diagnostico = message_data.get('diagnostico', {})
+        rssi = message_data.get('rssi', 0)
+        snr = message_data.get('snr', 0)
+        
+        # Armazenar mensagem (retransmissões não são inseridas de novo)
+        store_messages([message_data])
+        record_ingest([message_data])
+        notify_alerts([message_data])
+        forward_messages([message_data])
+        duplicate = message_data.get("duplicate", False)
+        
+        # Log da requisição (formatado na thread de logs, amostrado por dispositivo)
+        if frame_logger.isEnabledFor(logging.INFO):
+            if duplicate:
+                status = "DUPLICADO"
+            else:
+                status = message_status(message_data).upper()
+            frame_logger.info(
+                "[%s] %s moscas | Device: %s | Gateway: %s | RSSI: %s dBm | SNR: %s dB | seq %s (total: %s)",
+                status, total_moscas, lora_id, gateway_id, rssi, snr, message_data["seq"], len(messages_storage),
+                extra={
+                    "device": lora_id, "gateway": gateway_id, "status": status, "flies": total_moscas,
+                    "rssi": rssi, "snr": snr, "seq": message_data["seq"]
+                }
+            )
         
-        return jsonify({
+        return {
             "success": True,
             "message": f"Detecção recebida: {total_moscas} moscas",
-            "stored": True,
+            "stored": not duplicate,
+            "duplicate": duplicate,
             "message_id": len(messages_storage) - 1,
+            "seq": message_data["seq"],
             "device_id": lora_id,
             "gateway_id": gateway_id,
             "diagnostico": diagnostico,
+            "diagnostico_servidor": message_data["diagnostico_servidor"],
             "signal_quality": {
                 "rssi": rssi,
                 "snr": snr
             },
-            "format": "gateway_lora" if "lora_data" in raw_data else ("lora_compact" if "dt" in raw_data else "expanded")
-        }), 200
+            "format": message_data["original_format"]
+        }, 200
         
     except Exception as e:
-        stats["errors"] += 1
+        count_stat("errors")
         logger.error(f"[ERROR] Erro ao processar detecção: {e}")
-        return jsonify({"success": False, "error": str(e)}), 500
+        return {"success": False, "error": str(e)}, 500
+
+def parse_batch_body(mimetype, body):
+    """
+    Extrai a lista de payloads de uma requisição em lote
+
+    Aceita um array JSON, um objeto {"messages": [...]} ou NDJSON
+    (um payload por linha, Content-Type application/x-ndjson).
+    Linhas NDJSON inválidas viram None para serem reportadas por item.
+    """
+    if mimetype in ("application/x-ndjson", "application/ndjson"):
+        items = []
+        for line in body.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(payload_codec.decode_body(line))
+            except payload_codec.PayloadDecodeError:
+                decode_errors.labels("body").add()
+                items.append(None)
+        return items
+
+    payload = decode_json_body(mimetype, body)
+    if isinstance(payload, dict):
+        payload = payload.get("messages")
+    return payload if isinstance(payload, list) else None
+
+@app.route('/api/messages/batch', methods=['POST'])
+def receive_batch():
+    """
+    Recebe um lote de detecções em uma única requisição
+
+    Usado pelos gateways para reenviar frames LoRa armazenados durante
+    quedas de conexão. Cada item pode estar em qualquer um dos formatos
+    aceitos por POST /api/messages. Os itens válidos são armazenados em
+    bloco e a resposta traz o status de cada item, na ordem recebida.
+    """
+    items = parse_batch_body(request.mimetype, request.get_data())
+    body, status = ingest_batch(items, request_client_ip())
+    return json_response(body, status, ingest_headers(body))
+
+def ingest_batch(items, client_ip):
+    """Armazena um lote já decodificado; retorna (corpo da resposta, status HTTP)"""
+    try:
+        if items is None:
+            logger.warning("[ERROR] Lote inválido ou ausente")
+            return {"success": False, "error": "Lote inválido"}, 400
+        if len(items) > MAX_BATCH_SIZE:
+            logger.warning(f"[ERROR] Lote com {len(items)} itens excede o limite de {MAX_BATCH_SIZE}")
+            return {
+                "success": False,
+                "error": f"Lote excede o limite de {MAX_BATCH_SIZE} itens"
+            }, 413
+        
+        # Cada item conta como um frame no limite do seu gateway
+        refused = limit_batch(items, client_ip)
+        retry_after = max(refused.values()) if refused else None
+        if items and len(refused) == len(items):
+            return {"success": False, "error": "Limite de requisições excedido", "retry_after": retry_after}, 429
+        
+        count_stat("total_messages", len(items) - len(refused))
+        
+        accepted = []
+        results = []
+        for index, raw_data in enumerate(items):
+            if index in refused:
+                results.append({
+                    "index": index,
+                    "success": False,
+                    "error": "Limite de requisições excedido",
+                    "retry_after": refused[index]
+                })
+                continue
+            if not isinstance(raw_data, dict) or not raw_data:
+                results.append({"index": index, "success": False, "error": "JSON inválido"})
+                continue
+            try:
+                message_data = build_message(raw_data, client_ip)
+            except Exception as e:
+                results.append({"index": index, "success": False, "error": str(e)})
+                continue
+            accepted.append(message_data)
+            results.append({
+                "index": index,
+                "success": True,
+                "device_id": message_data.get('lora_id', 'Desconhecido'),
+                "format": message_data["original_format"]
+            })
+        
+        # Armazenar lote
+        store_messages(accepted)
+        record_ingest(accepted)
+        notify_alerts(accepted)
+        forward_messages(accepted)
+        accepted_results = (result for result in results if result["success"])
+        duplicates = 0
+        for result, message_data in zip(accepted_results, accepted):
+            result["seq"] = message_data["seq"]
+            if message_data.get("duplicate"):
+                result["duplicate"] = True
+                duplicates += 1
+        
+        rejected = len(items) - len(refused) - len(accepted)
+        count_stat("errors", rejected)
+        logger.info(
+            "[BATCH] %s/%s detecções armazenadas, %s retransmissões, %s limitadas (total: %s)",
+            len(accepted) - duplicates, len(items), duplicates, len(refused), len(messages_storage)
+        )
+        
+        body = {
+            "success": rejected == 0 and not refused,
+            "received": len(items),
+            "stored": len(accepted) - duplicates,
+            "duplicates": duplicates,
+            "rejected": rejected,
+            "rate_limited": len(refused),
+            "results": results
+        }
+        if refused:
+            body["retry_after"] = retry_after
+        return body, 200
+    
+    except Exception as e:
+        count_stat("errors")
+        logger.error(f"[ERROR] Erro ao processar lote: {e}")
+        return {"success": False, "error": str(e)}, 500
 
 @app.route('/api/messages', methods=['DELETE'])
 def delete_all_messages():
     """Apaga todas as mensagens armazenadas"""
     try:
-        count = len(messages_storage)
-        messages_storage.clear()
-        
-        # Resetar estatísticas
-        stats["total_messages"] = 0
-        stats["errors"] = 0
+        with store_lock:
+            count = len(messages_storage)
+            if ring is not None:
+                ring.clear()
+                ring.reset_counters()
+            clear_local_messages()
+            if rate_limiter is not None:
+                rate_limiter.reset()
+            if wal is not None:
+                wal.reset(messages_storage.next_seq)
+            if backend is not None:
+                backend.clear()
+            
+            # Resetar estatísticas
+            counters.reset()
         
         logger.info(f"🗑️  Todas as mensagens foram apagadas ({count} mensagens)")
         
@@ -1444,21 +2675,84 @@ def delete_all_messages():
         logger.error(f"💥 Erro ao apagar mensagens: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/diagnosis', methods=['GET'])
+def get_diagnosis():
+    """Limiares atuais do diagnóstico do servidor"""
+    return jsonify({
+        "success": True,
+        "thresholds": diagnosis_thresholds._asdict(),
+        "defaults": Thresholds.from_config()._asdict()
+    }), 200
+
+@app.route('/api/diagnosis', methods=['POST'])
+def set_diagnosis():
+    """
+    Altera os limiares do diagnóstico do servidor e reavalia o histórico
+
+    Body JSON com qualquer subconjunto de ocupacao_excessiva,
+    anormal_ocupacao e anormal_moscas (os ausentes mantêm o valor atual).
+    Todas as mensagens em memória são reavaliadas de uma vez (vetorizado
+    com NumPy) e, com SQLITE_PATH, o histórico completo também. A
+    alteração vale para este processo até reiniciar; para mantê-la, use as
+    variáveis de ambiente de config.py.
+    """
+    global diagnosis_thresholds
+    if ring is not None:
+        return jsonify({"success": False, "error": "Indisponível com SHM_RING_NAME (limiares por worker)"}), 409
+    try:
+        thresholds = Thresholds.from_dict(request.get_json(silent=True), diagnosis_thresholds)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    
+    with diagnosis_lock:
+        started = time.perf_counter()
+        with store_lock:
+            diagnosis_thresholds = thresholds
+            changed = []
+            count = messages_storage.rediagnose(thresholds, changed)
+            # Contagens de alerta dos agregados seguem o novo diagnóstico (só as mensagens que mudaram)
+            for seq, excessive, abnormal in changed:
+                aggregates.rediagnosed(messages_storage.get(seq), excessive, abnormal)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+        # Fora do store_lock: a ingestão continua enquanto o SQLite regrava o histórico
+        stored = backend.rediagnose(thresholds) if backend is not None else None
+    
+    logger.info(
+        "[DIAGNOSIS] Limiares %s: %s mensagens reavaliadas em %.1f ms", thresholds._asdict(), count, elapsed_ms
+    )
+    return jsonify({
+        "success": True,
+        "thresholds": thresholds._asdict(),
+        "reevaluated": count,
+        "reevaluated_stored": stored,
+        "elapsed_ms": round(elapsed_ms, 3)
+    }), 200
+
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """Retorna estatísticas do servidor"""
-    uptime = datetime.now() - stats["start_time"]
+    uptime = datetime.now() - start_time
     
     return jsonify({
         "success": True,
         "stats": {
-            **stats,
+            **current_stats(),
             "uptime_seconds": int(uptime.total_seconds()),
             "messages_stored": len(messages_storage),
-            "max_messages": MAX_MESSAGES
+            "max_messages": MAX_MESSAGES,
+            "rate_limit": rate_limiter.stats() if rate_limiter is not None else None,
+            "anomalies": anomalies.stats() if anomalies is not None else None,
+            "notifications": notifier.stats() if notifier is not None else None,
+            "webhooks": webhooks.stats() if webhooks is not None else None,
+            "backend": backend.stats() if backend is not None else None
         }
     }), 200
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Métricas no formato de exposição de texto do Prometheus"""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check para monitoramento"""
@@ -1482,12 +2776,17 @@ if __name__ == '__main__':
     print("="*60)
     print(f"Porta: {PORT}")
     print(f"Maximo de mensagens: {MAX_MESSAGES}")
+    print(f"WAL: {WAL_DIR or 'desativado'}")
     print()
     print("Endpoints:")
     print(f"  - GET  http://localhost:{PORT}/         (Dashboard)")
     print(f"  - POST http://localhost:{PORT}/api/messages (Receber mensagem)")
+    print(f"  - POST http://localhost:{PORT}/api/messages/batch (Receber lote)")
     print(f"  - GET  http://localhost:{PORT}/api/messages (Listar mensagens)")
+    print(f"  - GET  http://localhost:{PORT}/api/stream (Stream SSE)")
+    print(f"  - GET  http://localhost:{PORT}/api/aggregates (Agregados)")
     print(f"  - GET  http://localhost:{PORT}/api/stats (Estatisticas)")
+    print(f"  - GET  http://localhost:{PORT}/metrics (Metricas Prometheus)")
     print()
     print("Servidor iniciado!")
     print("="*60)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🚀 TrapEyes - Servidor ASGI
+===========================
+
+Modo de ingestão assíncrona para servidores ASGI (uvicorn, hypercorn).
+As rotas de ingestão e o stream são rotas ASGI nativas que usam as mesmas
+funções do app Flask (expansão, armazenamento, WAL, SQLite e agregados).
+A ingestão roda no pool de threads padrão do loop, pois espera store_lock,
+o WAL e o SQLite; o stream roda no próprio event loop:
+
+    POST /api/messages        - ingest_message
+    POST /api/messages/batch  - ingest_batch
+    GET  /api/stream          - SSE acordado pelo broker, sem thread por cliente
+
+As demais rotas (dashboard, consultas, estatísticas) são repassadas ao
+app Flask via a2wsgi, num pool de threads. Respostas e códigos de status
+são os mesmos do servidor Flask.
+
+Uso:
+    pip install uvicorn a2wsgi
+    uvicorn asgi:application --host 0.0.0.0 --port 8080
+"""
+import asyncio
+import os
+import time
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+from werkzeug.datastructures import Headers
+
+import payload_codec
+from app import (
+    PORT, STREAM_AGGREGATES_SECONDS, STREAM_KEEPALIVE_SECONDS,
+    app as flask_app, broker, format_sse, ingest_batch, ingest_headers, ingest_message,
+    parse_batch_body, parse_message_body, read_stream, record_request, stream_aggregates,
+    stream_cursor, stream_stats
+)
+
+# Threads do pool que atende as rotas Flask (dashboard, consultas)
+ASGI_WSGI_WORKERS = int(os.getenv("ASGI_WSGI_WORKERS", "16"))
+
+wsgi_fallback = WSGIMiddleware(flask_app, workers=ASGI_WSGI_WORKERS)
+
+# Mesmo comportamento do flask-cors configurado no app
+CORS_HEADERS = [(b"access-control-allow-origin", b"*")]
+
+
+class _Request:
+    """Dados de uma requisição HTTP ASGI usados pelas rotas nativas"""
+
+    __slots__ = ("scope", "headers", "mimetype")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.headers = Headers([
+            (name.decode("latin-1"), value.decode("latin-1")) for name, value in scope["headers"]
+        ])
+        self.mimetype = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+
+    @property
+    def client_ip(self):
+        client = self.scope.get("client")
+        return self.headers.get("X-Real-IP") or (client[0] if client else None)
+
+    @property
+    def args(self):
+        return parse_qs(self.scope.get("query_string", b"").decode("latin-1"))
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        event = await receive()
+        if event["type"] == "http.disconnect":
+            return None
+        chunks.append(event.get("body", b""))
+        if not event.get("more_body"):
+            return b"".join(chunks)
+
+
+async def send_json(send, payload, status=200, headers=None):
+    body = payload_codec.dumps(payload)
+    extra = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in (headers or {}).items()]
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            *CORS_HEADERS,
+            *extra
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def run_sync(function, *args):
+    """
+    Executa uma função síncrona do app no pool de threads padrão do loop
+
+    A ingestão usa store_lock, WAL e SQLite; no event loop, um DELETE ou
+    POST /api/diagnosis segurando o lock travaria todas as conexões.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+async def receive_message(request, receive, send):
+    body = await read_body(receive)
+    if body is None:
+        return
+    raw_data = parse_message_body(request.mimetype, body, request.headers)
+    payload, status = await run_sync(ingest_message, raw_data, request.client_ip)
+    await send_json(send, payload, status, ingest_headers(payload))
+
+
+async def receive_batch(request, receive, send):
+    body = await read_body(receive)
+    if body is None:
+        return
+    items = parse_batch_body(request.mimetype, body)
+    payload, status = await run_sync(ingest_batch, items, request.client_ip)
+    await send_json(send, payload, status, ingest_headers(payload))
+
+
+async def stream_messages(request, receive, send):
+    """Stream SSE equivalente ao GET /api/stream do Flask"""
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id", [None])[0]
+    try:
+        last_seq = stream_cursor(last_event_id)
+    except ValueError:
+        await send_json(send, {"success": False, "error": "Last-Event-ID inválido"}, 400)
+        return
+
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    disconnected = False
+
+    def notify():
+        loop.call_soon_threadsafe(wakeup.set)
+
+    async def watch_disconnect():
+        nonlocal disconnected
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        disconnected = True
+        wakeup.set()
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    broker.add_listener(notify)
+    broker.subscribe()
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+                *CORS_HEADERS
+            ]
+        })
+        await send({"type": "http.response.body", "body": b"retry: 3000\n\n", "more_body": True})
+        snapshot = None
+        aggregates_due = time.monotonic()
+        stats_due = aggregates_due + STREAM_KEEPALIVE_SECONDS
+        while not disconnected:
+            now = time.monotonic()
+            events = []
+            if now >= aggregates_due:
+                # Com ou sem mensagens novas: alterações dos agregados a cada intervalo
+                event, snapshot = stream_aggregates(snapshot)
+                if event is not None:
+                    events.append(event)
+                aggregates_due = now + STREAM_AGGREGATES_SECONDS
+
+            # Limpo antes da leitura: uma publicação depois dela acorda a espera abaixo
+            wakeup.clear()
+            messages_list, last_seq = read_stream(last_seq)
+            if messages_list:
+                events.extend(format_sse("message", message_data, message_data["seq"]) for message_data in messages_list)
+                stats_due = time.monotonic() + STREAM_KEEPALIVE_SECONDS
+            elif now >= stats_due:
+                # Sem novidades no intervalo: enviar resumo (também serve de keepalive)
+                events.append(format_sse("stats", stream_stats()))
+                stats_due = now + STREAM_KEEPALIVE_SECONDS
+            if events:
+                await send({"type": "http.response.body", "body": "".join(events).encode("utf-8"), "more_body": True})
+
+            if messages_list:
+                # Pode haver mais mensagens: ceder o loop antes de ler o próximo lote
+                await asyncio.sleep(0)
+                continue
+            try:
+                await asyncio.wait_for(wakeup.wait(), max(min(aggregates_due, stats_due) - time.monotonic(), 0.01))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        broker.unsubscribe()
+        broker.remove_listener(notify)
+        watcher.cancel()
+
+
+ROUTES = {
+    ("POST", "/api/messages"): receive_message,
+    ("POST", "/api/messages/batch"): receive_batch,
+    ("GET", "/api/stream"): stream_messages
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        event = await receive()
+        if event["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif event["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    """Aplicação ASGI: rotas de ingestão nativas, demais rotas no Flask"""
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    method, path = scope.get("method"), scope.get("path")
+    handler = ROUTES.get((method, path)) if scope["type"] == "http" else None
+    if handler is None:
+        await wsgi_fallback(scope, receive, send)
+        return
+
+    # Latência até o início da resposta, como no after_request do Flask
+    start = time.perf_counter()
+
+    async def timed_send(event):
+        if event["type"] == "http.response.start":
+            record_request(method, path, event["status"], time.perf_counter() - start)
+        await send(event)
+
+    await handler(_Request(scope), receive, timed_send)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run("asgi:application", host="0.0.0.0", port=PORT, log_level="warning")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📊 Benchmark do frame LoRa: JSON compacto vs binário
+====================================================
+
+Compara tamanho e custo de decodificação + expansão dos dois formatos
+dentro do envelope do gateway. O round-trip do codec é verificado em
+tests/test_lora_codec.py.
+
+Uso:
+    python3 benchmarks/bench_codec.py [quantidade de frames]
+"""
+
+import base64
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import app  # noqa: E402
+import lora_codec  # noqa: E402
+from app import expand_lora_payload  # noqa: E402
+
+DEVICE_TABLE = [f"LORA-{index:03d}" for index in range(1, 201)]
+
+
+def make_compact():
+    return {
+        "dt": f"{random.randint(1, 28):02d}{random.randint(1, 12):02d}{random.randint(2024, 2030)}",
+        "hr": f"{random.randint(0, 23):02d}:{random.randint(0, 59):02d}:{random.randint(0, 59):02d}",
+        "ti": random.randint(50, 5000),
+        "m": random.randint(0, 300),
+        "cm": round(random.uniform(0.5, 1), 3),
+        "cmin": round(random.uniform(0.3, 0.6), 3),
+        "cmax": round(random.uniform(0.8, 1), 3),
+        "op": round(random.uniform(0, 100), 2),
+        "dg": {"oe": random.random() < 0.3, "an": random.random() < 0.1},
+        "id": random.choice(DEVICE_TABLE + ["trap_eye_01"])
+    }
+
+
+def envelope(lora_data):
+    return {"client_id": "gateway-pico", "message_id": 1, "lora_data": lora_data, "rssi": -57, "snr": 9}
+
+
+def bench(name, payloads):
+    start = time.perf_counter()
+    for payload in payloads:
+        expand_lora_payload(payload)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24} {elapsed / len(payloads) * 1e6:8.2f} us/frame")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    random.seed(42)
+    frames = [make_compact() for _ in range(count)]
+
+    # Tabela de dispositivos usada pelo servidor para ids por índice
+    app.LORA_DEVICE_TABLE[:] = DEVICE_TABLE
+
+    json_frames = [json.dumps(frame, separators=(",", ":")) for frame in frames]
+    binary_frames = [lora_codec.encode(frame) for frame in frames]
+    indexed_frames = [lora_codec.encode(frame, DEVICE_TABLE) for frame in frames]
+
+    print()
+    print(f"{'formato':<24} {'bytes (média)':>14}")
+    for name, encoded in (("JSON compacto", json_frames), ("binário", binary_frames), ("binário + índice", indexed_frames)):
+        print(f"{name:<24} {sum(len(frame) for frame in encoded) / count:>14.1f}")
+
+    print()
+    bench("JSON em lora_data", [envelope(frame) for frame in json_frames])
+    bench("binário base64", [envelope(base64.b64encode(frame).decode()) for frame in binary_frames])
+    bench("binário bruto", [envelope(frame) for frame in indexed_frames])
+
+
+if __name__ == "__main__":
+    main()
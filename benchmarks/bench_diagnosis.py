@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📊 Benchmark da reavaliação do diagnóstico
+==========================================
+
+Mede ``MessageStore.rediagnose()`` (o que POST /api/diagnosis executa)
+com o buffer cheio, com NumPy e com o fallback em Python puro, e
+confere o resultado contra ``diagnosis.diagnose()`` em uma amostra.
+
+Uso:
+    python3 benchmarks/bench_diagnosis.py [quantidade de mensagens]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import diagnosis  # noqa: E402
+from diagnosis import Thresholds, diagnose  # noqa: E402
+from storage import MessageStore  # noqa: E402
+
+THRESHOLDS = (Thresholds(20, 30, 50), Thresholds(10, 15, 25), Thresholds(35, 40, 70))
+
+
+def make_message(index):
+    """Mensagem expandida com valores realistas (mesma faixa de bench_storage.py)"""
+    return {
+        "timestamp": f"2025-11-20 {random.randint(0, 23):02d}:{random.randint(0, 59):02d}:00",
+        "lora_id": f"LORA-{random.randint(1, 200):03d}",
+        "gateway_id": f"gateway-{random.randint(1, 10)}",
+        "message_id": index,
+        "deteccoes": {"total": random.randint(0, 80), "ocupacao_pct": round(random.uniform(0, 40), 2)},
+        "diagnostico": {"ocupacao_excessiva": random.random() < 0.3, "anormal": random.random() < 0.1}
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    random.seed(42)
+    template = [make_message(index) for index in range(10_000)]
+    store = MessageStore(count)
+    # Um pouco além da capacidade: o buffer circular dá a volta
+    for offset in range(0, count + len(template) // 3, len(template)):
+        store.extend(template)
+
+    print(f"📦 {len(store)} mensagens ({store.nbytes() / 2 ** 20:.1f} MB)")
+    backends = [("numpy", diagnosis.numpy)] if diagnosis.numpy is not None else []
+    backends.append(("python", None))
+    numpy = diagnosis.numpy
+    try:
+        for name, module in backends:
+            diagnosis.numpy = module
+            timings = []
+            for thresholds in THRESHOLDS:
+                started = time.perf_counter()
+                store.rediagnose(thresholds)
+                timings.append(time.perf_counter() - started)
+            sample = random.sample(range(store.first_seq, store.next_seq), 1000)
+            assert all(store.get(seq)["diagnostico_servidor"] == diagnose(store.get(seq), thresholds) for seq in sample)
+            print(f"   {name:<8} melhor {min(timings) * 1000:8.1f} ms | pior {max(timings) * 1000:8.1f} ms")
+    finally:
+        diagnosis.numpy = numpy
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📊 Carga de ingestão: servidor Flask (Werkzeug) vs ASGI (uvicorn)
+================================================================
+
+Sobe cada servidor num subprocesso e dispara POST /api/messages com
+envelopes do gateway LoRa a partir de conexões keep-alive concorrentes
+(cliente asyncio com sockets crus, para que o cliente não seja o
+gargalo). O servidor de desenvolvimento do Werkzeug fecha a conexão a
+cada resposta, então ali o custo da reconexão entra na latência, como
+acontece com os gateways. Mede requisições/s bem-sucedidas,
+latências p50/p99 e erros (status != 200 ou conexão perdida).
+
+Uso:
+    python3 benchmarks/bench_ingest.py [requisições] [conexões]
+"""
+
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PORT = 8790
+
+SERVERS = {
+    "flask (app.run)": [sys.executable, "app.py"],
+    "asgi (uvicorn)": [sys.executable, "asgi.py"]
+}
+
+
+def make_body(index):
+    frame = {
+        "dt": "20112025",
+        "hr": f"{random.randint(0, 23):02d}:{random.randint(0, 59):02d}:{random.randint(0, 59):02d}",
+        "ti": random.randint(50, 5000),
+        "m": random.randint(0, 300),
+        "cm": round(random.uniform(0.5, 1), 3),
+        "cmin": round(random.uniform(0.3, 0.6), 3),
+        "cmax": round(random.uniform(0.8, 1), 3),
+        "op": round(random.uniform(0, 100), 2),
+        "dg": {"oe": False, "an": False},
+        "id": f"LORA-{random.randint(1, 50):03d}"
+    }
+    return json.dumps({
+        "client_id": "gateway-pico",
+        "message_id": index,
+        "lora_data": json.dumps(frame, separators=(",", ":")),
+        "rssi": -57,
+        "snr": 9
+    }).encode("utf-8")
+
+
+def make_request(body):
+    return (
+        f"POST /api/messages HTTP/1.1\r\nHost: localhost\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+    ).encode("latin-1") + body
+
+
+async def connection(requests, latencies, errors):
+    """Envia as requisições em sequência, reconectando se o servidor fechar a conexão"""
+    reader = writer = None
+    for request in requests:
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+            writer.write(request)
+            head = await reader.readuntil(b"\r\n\r\n")
+            status = int(head.split(b" ", 2)[1])
+            length = 0
+            close = False
+            for line in head.lower().split(b"\r\n"):
+                if line.startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+                elif line == b"connection: close":
+                    close = True
+            await reader.readexactly(length)
+        except (OSError, asyncio.IncompleteReadError):
+            errors.append(request)
+            if writer is not None:
+                writer.close()
+                writer = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            errors.append(request)
+        # Werkzeug responde "Connection: close": cada requisição abre uma conexão
+        if close:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def load(requests, connections):
+    latencies = []
+    errors = []
+    chunks = [requests[index::connections] for index in range(connections)]
+    start = time.perf_counter()
+    await asyncio.gather(*(connection(chunk, latencies, errors) for chunk in chunks))
+    return time.perf_counter() - start, sorted(latencies), len(errors)
+
+
+def wait_ready():
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{PORT}/health", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("servidor não respondeu")
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    connections = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    random.seed(42)
+    requests = [make_request(make_body(index)) for index in range(total)]
+    env = {**os.environ, "PORT": str(PORT), "MAX_MESSAGES": "100000", "WAL_DIR": "", "SQLITE_PATH": ""}
+
+    print(f"{total} requisições, {connections} conexões")
+    print(f"{'servidor':<18} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'erros':>7}")
+    for name, command in SERVERS.items():
+        server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_ready()
+            asyncio.run(load(requests[:500], connections))  # aquecimento
+            elapsed, latencies, errors = asyncio.run(load(requests, connections))
+        finally:
+            server.terminate()
+            server.wait()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000
+        print(f"{name:<18} {(total - errors) / elapsed:>10.0f} {p50:>9.2f} {p99:>9.2f} {errors:>7}")
+
+
+if __name__ == "__main__":
+    main()
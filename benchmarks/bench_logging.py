@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📊 Benchmark do custo dos logs na ingestão
+==========================================
+
+Chama ingest_message (o mesmo caminho de POST /api/messages, sem o
+HTTP) com os logs desligados, síncronos (como o logging.basicConfig
+anterior), pela fila e com amostragem por dispositivo. A saída vai para
+um arquivo temporário.
+
+"ingest" é o tempo visto pelas requisições; "total" inclui esvaziar a
+fila de logs no final. Registros descartados indicam fila cheia.
+
+Uso:
+    python3 benchmarks/bench_logging.py [quantidade de mensagens]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_storage import make_payload  # noqa: E402
+
+import app  # noqa: E402
+import log_pipeline  # noqa: E402
+import payload_codec  # noqa: E402
+
+MODES = [
+    # nome, nível, JSON, tamanho da fila, 1 de N frames por dispositivo
+    ("desligado (WARNING)", "WARNING", False, 10000, 1),
+    ("síncrono, texto", "INFO", False, 0, 1),
+    ("fila, texto", "INFO", False, 10000, 1),
+    ("fila, JSON", "INFO", True, 10000, 1),
+    ("fila, texto, 1 de 10", "INFO", False, 10000, 10),
+]
+
+
+def run(bodies, level, json_output, queue_size, every):
+    sampler = app.frame_logger.filters[0]
+    with tempfile.TemporaryFile("w") as output:
+        log_pipeline.setup_logging(level, json_output=json_output, queue_size=queue_size, stream=output)
+        sampler.__init__(every=every)
+        dropped = log_pipeline.dropped_records()
+        app.messages_storage.clear()
+
+        start = time.perf_counter()
+        for body in bodies:
+            app.ingest_message(payload_codec.decode_body(body), "127.0.0.1")
+        ingest = time.perf_counter() - start
+        log_pipeline.shutdown()
+        total = time.perf_counter() - start
+        return ingest, total, log_pipeline.dropped_records() - dropped
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    bodies = [payload_codec.dumps(make_payload(index)) for index in range(count)]
+    print(f"{count} mensagens | codec {payload_codec.BACKEND}\n")
+    print(f"{'modo':<22} {'ingest req/s':>13} {'us/msg':>8} {'total req/s':>12} {'descartados':>12}")
+    for name, level, json_output, queue_size, every in MODES:
+        ingest, total, dropped = run(bodies, level, json_output, queue_size, every)
+        print(f"{name:<22} {count / ingest:>13,.0f} {ingest / count * 1e6:>8.1f} {count / total:>12,.0f} {dropped:>12}")
+
+    log_pipeline.setup_logging("INFO")
+
+
+if __name__ == "__main__":
+    main()
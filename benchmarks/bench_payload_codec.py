@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📊 Benchmark da decodificação dos payloads por backend JSON
+===========================================================
+
+Custo por frame de decodificar o corpo da requisição e expandi-lo
+(``payload_codec.decode_body`` + ``expand_lora_payload``) nos três
+formatos aceitos por POST /api/messages (envelope do gateway, compacto
+LoRa e expandido legado), para cada backend instalado (orjson, msgspec,
+json). A linha "antes" reproduz o caminho anterior: ``json.loads`` do
+corpo seguido de ``json.loads`` do lora_data dentro da expansão.
+
+Uso:
+    python3 benchmarks/bench_payload_codec.py [quantidade de frames]
+"""
+
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import payload_codec  # noqa: E402
+from app import expand_lora_payload  # noqa: E402
+
+
+def make_compact():
+    return {
+        "dt": f"{random.randint(1, 28):02d}{random.randint(1, 12):02d}2025",
+        "hr": f"{random.randint(0, 23):02d}:{random.randint(0, 59):02d}:{random.randint(0, 59):02d}",
+        "ti": random.randint(50, 5000),
+        "m": random.randint(0, 300),
+        "cm": round(random.uniform(0.5, 1), 3),
+        "cmin": round(random.uniform(0.3, 0.6), 3),
+        "cmax": round(random.uniform(0.8, 1), 3),
+        "op": round(random.uniform(0, 100), 2),
+        "dg": {"oe": random.random() < 0.3, "an": random.random() < 0.1},
+        "id": f"LORA-{random.randint(1, 200):03d}"
+    }
+
+
+def make_bodies(count):
+    """Corpos (bytes) de cada formato, como chegam na requisição"""
+    gateway, compact, expanded = [], [], []
+    for index in range(count):
+        frame = make_compact()
+        gateway.append({
+            "client_id": "gateway-pico",
+            "message_id": index,
+            "lora_data": json.dumps(frame, separators=(",", ":")),
+            "rssi": -random.randint(40, 120),
+            "snr": random.randint(-5, 12)
+        })
+        compact.append(frame)
+        expanded.append({
+            "timestamp": "2025-11-20 14:30:45",
+            "tempo_inferencia_ms": frame["ti"],
+            "deteccoes": {
+                "total": frame["m"],
+                "limiar_confianca": 0.5,
+                "confianca_media": frame["cm"],
+                "ocupacao_pct": frame["op"],
+                "area_total_px": 10000,
+                "itens": []
+            },
+            "diagnostico": {"ocupacao_excessiva": frame["dg"]["oe"], "anormal": frame["dg"]["an"]},
+            "lora_id": frame["id"]
+        })
+    encode = lambda payloads: [json.dumps(payload).encode("utf-8") for payload in payloads]
+    return {"gateway_lora": encode(gateway), "lora_compact": encode(compact), "expanded": encode(expanded)}
+
+
+def run(bodies, decode):
+    start = time.perf_counter()
+    for body in bodies:
+        expand_lora_payload(decode(body))
+    return (time.perf_counter() - start) / len(bodies) * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    random.seed(42)
+    formats = make_bodies(count)
+
+    # Todos os backends devem produzir a mesma mensagem expandida
+    for bodies in formats.values():
+        for body in bodies[:1000]:
+            expected = expand_lora_payload(json.loads(body))
+            for backend in payload_codec.available_backends():
+                payload_codec.set_backend(backend)
+                assert expand_lora_payload(payload_codec.decode_body(body)) == expected, (backend, body)
+    print(f"Backends equivalentes: {', '.join(payload_codec.available_backends())}")
+    print()
+
+    names = list(formats)
+    print(f"{'backend (us/frame)':<20}" + "".join(f"{name:>14}" for name in names))
+    print(f"{'antes (json)':<20}" + "".join(f"{run(formats[name], json.loads):>14.2f}" for name in names))
+    for backend in payload_codec.available_backends():
+        payload_codec.set_backend(backend)
+        print(f"{backend:<20}" + "".join(f"{run(formats[name], payload_codec.decode_body):>14.2f}" for name in names))
+
+
+if __name__ == "__main__":
+    main()
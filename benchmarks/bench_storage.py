@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📊 Benchmark do armazenamento em memória
+========================================
+
+Compara o deque de dicts (armazenamento original) com o MessageStore
+colunar: memória ocupada, custo de inserção e custo de leitura.
+
+Uso:
+    python3 benchmarks/bench_storage.py [quantidade de mensagens]
+"""
+
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app import build_message  # noqa: E402
+from storage import MessageStore  # noqa: E402
+
+
+def make_payload(index):
+    """Payload do gateway LoRa com valores realistas"""
+    compact = {
+        "dt": "20112025",
+        "hr": f"{random.randint(0, 23):02d}:{random.randint(0, 59):02d}:{random.randint(0, 59):02d}",
+        "ti": random.randint(50, 2000),
+        "m": random.randint(0, 80),
+        "cm": round(random.uniform(0.5, 1), 3),
+        "cmin": round(random.uniform(0.3, 0.6), 3),
+        "cmax": round(random.uniform(0.8, 1), 3),
+        "op": round(random.uniform(0, 40), 2),
+        "dg": {"oe": random.random() < 0.3, "an": random.random() < 0.1},
+        "id": f"LORA-{random.randint(1, 200):03d}"
+    }
+    return {
+        "client_id": f"gateway-{random.randint(1, 10)}",
+        "message_id": index,
+        "lora_data": json.dumps(compact, separators=(",", ":")),
+        "rssi": random.randint(-120, -30),
+        "snr": random.randint(-10, 12)
+    }
+
+
+def fill(factory, messages):
+    storage = factory(len(messages))
+    if isinstance(storage, MessageStore):
+        storage.extend(messages)
+    else:
+        for index, message in enumerate(messages):
+            message["seq"] = index + 1
+        storage.extend(messages)
+    return storage
+
+
+def measure(name, factory, make_messages):
+    count = len(make_messages())
+
+    # Memória retida: as mensagens só existem dentro do armazenamento
+    gc.collect()
+    tracemalloc.start()
+    storage = fill(factory, make_messages())
+    gc.collect()
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del storage
+
+    # Tempos (sem tracemalloc, que distorce as medições)
+    messages = make_messages()
+    gc.collect()
+    start = time.perf_counter()
+    storage = fill(factory, messages)
+    insert_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    read = list(storage)
+    read_seconds = time.perf_counter() - start
+    assert len(read) == count
+
+    print(f"{name:<14} {memory / 2 ** 20:>10.1f} MB {memory / count:>10.0f} B/msg "
+          f"{insert_seconds / count * 1e6:>10.2f} us/ins {read_seconds / count * 1e6:>10.2f} us/leit")
+    return memory / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    print(f"Mensagens: {count}")
+    print(f"{'armazenamento':<14} {'memória':>13} {'por msg':>12} {'inserção':>16} {'leitura':>17}")
+
+    def make_messages():
+        random.seed(42)
+        return [build_message(make_payload(i), "10.0.0.1") for i in range(count)]
+
+    per_dict = measure("deque", lambda size: deque(maxlen=size), make_messages)
+    per_column = measure("MessageStore", MessageStore, make_messages)
+
+    print()
+    print(f"Redução de memória: {per_dict / per_column:.1f}x")
+    print(f"Mensagens em 1 GB: deque ~{2 ** 30 / per_dict:,.0f} | MessageStore ~{2 ** 30 / per_column:,.0f}")
+
+    # Meta do armazenamento colunar: 1M de mensagens na memória que o deque usa para 50k
+    target = 50000 * per_dict
+    needed = 1000000 * per_column
+    print(
+        f"Meta 1M no espaço de 50k dicts: {needed / 2 ** 20:.0f} MB de {target / 2 ** 20:.0f} MB "
+        f"({'atingida' if needed <= target else 'não atingida'}; "
+        f"cabem ~{target / per_column:,.0f} mensagens)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📊 Benchmark do log de escrita antecipada (WAL)
+===============================================
+
+Mede a escrita de N mensagens já empacotadas no WAL (fsync em grupo) e
+o tempo de inicialização: replay dos segmentos + carga no MessageStore.
+
+Uso:
+    python3 benchmarks/bench_wal.py [quantidade de mensagens]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app import build_message  # noqa: E402
+from bench_storage import make_payload  # noqa: E402
+from storage import PACK_VERSION, MessageStore  # noqa: E402
+from wal import WriteAheadLog  # noqa: E402
+
+BATCH = 100
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    directory = tempfile.mkdtemp(prefix="trapeyes-wal-")
+    try:
+        source = MessageStore(count)
+        message = build_message(make_payload(0), "10.0.0.1")
+        source.extend([{**message, "message_id": index} for index in range(count)])
+        records = [(seq, source.pack(seq)) for seq in range(1, count + 1)]
+        del source
+
+        wal = WriteAheadLog(directory, retain=count, version=PACK_VERSION, fsync_interval=0.1)
+        wal.replay()
+        start = time.perf_counter()
+        for offset in range(0, count, BATCH):
+            wal.append(records[offset:offset + BATCH])
+        wal.close()
+        write_seconds = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        del records
+
+        start = time.perf_counter()
+        wal = WriteAheadLog(directory, retain=count, version=PACK_VERSION, fsync_interval=0.1)
+        restored = wal.replay()
+        replay_seconds = time.perf_counter() - start
+        store = MessageStore(count)
+        store.restore(restored, wal.next_seq)
+        load_seconds = time.perf_counter() - start
+        wal.close()
+        assert len(store) == count
+
+        print(f"Mensagens: {count} | WAL: {size / 2 ** 20:.1f} MB em {len(os.listdir(directory))} segmento(s)")
+        print(f"Escrita:  {write_seconds:8.2f} s ({count / write_seconds:,.0f} msg/s)")
+        print(f"Replay:   {replay_seconds:8.2f} s ({count / replay_seconds:,.0f} msg/s)")
+        print(f"+ carga:  {load_seconds:8.2f} s ({count / load_seconds:,.0f} msg/s)")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
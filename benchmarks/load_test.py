@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🚦 Teste de carga de ponta a ponta
+==================================
+
+Simula N dispositivos atrás de M gateways enviando detecções para
+POST /api/messages. A mistura de formatos (envelope do gateway, frame
+compacto direto, formato expandido legado) e a fração de frames
+recebidos também por um segundo gateway são configuráveis. Cada
+dispositivo tem seu relógio (dt/hr avança a cada frame) e cada gateway
+seu contador de message_id, como no campo.
+
+Com ``--rate`` a carga é de malha aberta: a requisição i é agendada para
+o instante i/rate e a latência conta a partir do agendamento (um
+servidor lento não reduz a carga nem esconde a fila). Sem ``--rate``,
+cada conexão envia a próxima requisição assim que recebe a resposta.
+
+O servidor é iniciado localmente (``--server flask`` ou ``asgi``) ou já
+deve estar rodando (``--server none --url ...``). Relata vazão, latência
+p50/p95/p99, taxa de erros, status HTTP e memória residente (RSS) do
+servidor, e grava tudo em JSON para comparar versões:
+
+    python3 benchmarks/load_test.py --server asgi --rate 1500 --duration 20 --output asgi.json
+    python3 benchmarks/load_test.py --server asgi --rate 1500 --duration 20 --compare asgi.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    "flask": [sys.executable, "app.py"],
+    "asgi": [sys.executable, "asgi.py"]
+}
+
+FORMATS = ("gateway", "compact", "expanded")
+
+
+# ----------------------------------------------------------------------
+# Dispositivos e gateways simulados
+
+class Device:
+    """Armadilha com relógio próprio e contagem de moscas que varia aos poucos"""
+
+    def __init__(self, index, gateways, interval, rng):
+        self.id = f"LORA-{index:04d}"
+        self.gateway = gateways[index % len(gateways)]
+        # Vizinho ao alcance: recebe parte dos frames em duplicidade
+        self.neighbor = gateways[(index + 1) % len(gateways)]
+        self.interval = interval
+        self.clock = datetime(2025, 11, 20, 6, 0, 0) + timedelta(seconds=rng.uniform(0, interval))
+        self.flies = rng.randint(0, 20)
+        self.rng = rng
+
+    def frame(self):
+        """Próximo frame compacto LoRa"""
+        rng = self.rng
+        self.clock += timedelta(seconds=self.interval)
+        self.flies = max(0, self.flies + rng.randint(-3, 4))
+        occupancy = round(min(100.0, self.flies * rng.uniform(0.3, 0.6)), 2)
+        confidence = round(rng.uniform(0.6, 0.95), 3)
+        return {
+            "dt": self.clock.strftime("%d%m%Y"),
+            "hr": self.clock.strftime("%H:%M:%S"),
+            "ti": rng.randint(50, 2000),
+            "m": self.flies,
+            "cm": confidence,
+            "cmin": round(confidence - rng.uniform(0, 0.2), 3),
+            "cmax": round(min(1.0, confidence + rng.uniform(0, 0.05)), 3),
+            "op": occupancy,
+            "dg": {"oe": occupancy > 20, "an": occupancy > 30 or self.flies > 50},
+            "id": self.id
+        }
+
+
+class Gateway:
+    def __init__(self, index):
+        self.id = f"gateway-{index:02d}"
+        self.message_id = 0
+
+    def envelope(self, frame, rng):
+        self.message_id += 1
+        return {
+            "client_id": self.id,
+            "message_id": self.message_id,
+            "lora_data": json.dumps(frame, separators=(",", ":")),
+            "rssi": rng.randint(-120, -40),
+            "snr": rng.randint(-10, 12)
+        }
+
+
+def expanded(frame):
+    """Formato expandido legado equivalente ao frame compacto"""
+    dt = frame["dt"]
+    return {
+        "timestamp": f"{dt[4:8]}-{dt[2:4]}-{dt[0:2]} {frame['hr']}",
+        "tempo_inferencia_ms": frame["ti"],
+        "deteccoes": {
+            "total": frame["m"],
+            "confianca_media": frame["cm"],
+            "confianca_min": frame["cmin"],
+            "confianca_max": frame["cmax"],
+            "ocupacao_pct": frame["op"]
+        },
+        "diagnostico": {"ocupacao_excessiva": frame["dg"]["oe"], "anormal": frame["dg"]["an"]},
+        "lora_id": frame["id"]
+    }
+
+
+def build_bodies(args, count):
+    """Corpos das requisições, na ordem de envio (round-robin entre os dispositivos)"""
+    rng = random.Random(args.seed)
+    gateways = [Gateway(index) for index in range(1, args.gateways + 1)]
+    devices = [Device(index, gateways, args.device_interval, rng) for index in range(1, args.devices + 1)]
+    weights = [args.mix[name] for name in FORMATS]
+    bodies = []
+    index = 0
+    while len(bodies) < count:
+        device = devices[index % len(devices)]
+        index += 1
+        frame = device.frame()
+        kind = rng.choices(FORMATS, weights)[0]
+        if kind == "gateway":
+            bodies.append(device.gateway.envelope(frame, rng))
+            if rng.random() < args.duplicates and device.neighbor is not device.gateway:
+                bodies.append(device.neighbor.envelope(frame, rng))
+        elif kind == "compact":
+            bodies.append(frame)
+        else:
+            bodies.append(expanded(frame))
+    return [json.dumps(body, separators=(",", ":")).encode("utf-8") for body in bodies[:count]]
+
+
+# ----------------------------------------------------------------------
+# Cliente HTTP (asyncio, sockets crus: o cliente não pode ser o gargalo)
+
+def make_request(host, body):
+    return (
+        f"POST /api/messages HTTP/1.1\r\nHost: {host}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+    ).encode("latin-1") + body
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    close = False
+    for line in head.lower().split(b"\r\n"):
+        if line.startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+        elif line == b"connection: close":
+            close = True
+    await reader.readexactly(length)
+    return status, close
+
+
+async def worker(host, port, jobs, results):
+    """Conexão keep-alive que atende a fila de requisições (reconecta se o servidor fechar)"""
+    reader = writer = None
+    while True:
+        job = await jobs.get()
+        if job is None:
+            break
+        scheduled, request = job
+        if scheduled is not None:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        sent = time.perf_counter()
+        start = scheduled if scheduled is not None else sent
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(request)
+            status, close = await read_response(reader)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            results.append((None, time.perf_counter() - start))
+            if writer is not None:
+                writer.close()
+                writer = None
+            continue
+        results.append((status, time.perf_counter() - start))
+        if close:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(host, port, requests, connections, rate):
+    jobs = asyncio.Queue()
+    results = []
+    start = time.perf_counter() + 0.05
+    for index, request in enumerate(requests):
+        jobs.put_nowait((start + index / rate if rate else None, request))
+    for _ in range(connections):
+        jobs.put_nowait(None)
+    workers = [asyncio.ensure_future(worker(host, port, jobs, results)) for _ in range(connections)]
+    await asyncio.gather(*workers)
+    return time.perf_counter() - start, results
+
+
+# ----------------------------------------------------------------------
+# Servidor
+
+def rss_kb(pid):
+    """Memória residente do processo (Linux), ou None"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+class RssSampler:
+    """Amostra o RSS do servidor durante a carga (pico e final)"""
+
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+
+    async def run(self, done):
+        while not done.is_set():
+            value = rss_kb(self.pid)
+            if value is not None:
+                self.samples.append(value)
+            try:
+                await asyncio.wait_for(done.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+def wait_ready(url):
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"{url}/health", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"servidor não respondeu em {url}")
+
+
+def git_version():
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def summarize(elapsed, results, rss_samples):
+    latencies = sorted(latency for _, latency in results)
+    statuses = {}
+    for status, _ in results:
+        key = str(status) if status is not None else "connection_error"
+        statuses[key] = statuses.get(key, 0) + 1
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    return {
+        "requests": len(results),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(ok / elapsed, 1),
+        "error_rate": round(1 - ok / len(results), 5) if results else 0,
+        "statuses": statuses,
+        "latency_ms": {
+            name: round(percentile(latencies, fraction) * 1000, 3) if latencies else None
+            for name, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))
+        },
+        "rss_kb": {
+            "start": rss_samples[0] if rss_samples else None,
+            "peak": max(rss_samples) if rss_samples else None,
+            "end": rss_samples[-1] if rss_samples else None
+        }
+    }
+
+
+def print_summary(summary):
+    latency = summary["latency_ms"]
+    rss = summary["rss_kb"]
+    print(f"Vazão:     {summary['throughput_rps']:,.1f} req/s ({summary['requests']} requisições em {summary['elapsed_s']} s)")
+    print(f"Latência:  p50 {latency['p50']} ms | p95 {latency['p95']} ms | p99 {latency['p99']} ms | máx {latency['max']} ms")
+    print(f"Erros:     {summary['error_rate'] * 100:.2f}% | status {summary['statuses']}")
+    if rss["peak"] is not None:
+        print(f"RSS:       início {rss['start'] / 1024:.1f} MB | pico {rss['peak'] / 1024:.1f} MB | fim {rss['end'] / 1024:.1f} MB")
+
+
+def print_comparison(summary, baseline_path):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    before = baseline["summary"]
+    print(f"\nComparação com {baseline_path} ({baseline.get('version') or 'versão desconhecida'}):")
+    rows = [
+        ("req/s", before["throughput_rps"], summary["throughput_rps"]),
+        *[(f"{name} ms", before["latency_ms"][name], summary["latency_ms"][name]) for name in ("p50", "p95", "p99")],
+        ("erros %", before["error_rate"] * 100, summary["error_rate"] * 100),
+        ("RSS pico MB", (before["rss_kb"]["peak"] or 0) / 1024, (summary["rss_kb"]["peak"] or 0) / 1024)
+    ]
+    for name, old, new in rows:
+        if old is None or new is None:
+            continue
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "-"
+        print(f"  {name:<12} {old:>12.2f} -> {new:>12.2f}  ({change})")
+
+
+# ----------------------------------------------------------------------
+
+def parse_mix(value):
+    mix = dict.fromkeys(FORMATS, 0.0)
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in mix:
+            raise argparse.ArgumentTypeError(f"formato desconhecido: {name} (use {', '.join(FORMATS)})")
+        mix[name] = float(weight)
+    return mix
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Teste de carga de POST /api/messages")
+    parser.add_argument("--server", choices=[*SERVERS, "none"], default="asgi",
+                        help="servidor iniciado localmente (none = usar --url)")
+    parser.add_argument("--url", default="http://127.0.0.1:8791", help="endereço do servidor")
+    parser.add_argument("--devices", type=int, default=200, help="dispositivos simulados")
+    parser.add_argument("--gateways", type=int, default=4, help="gateways simulados")
+    parser.add_argument("--device-interval", type=float, default=60, help="segundos entre frames de um dispositivo (relógio do frame)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("gateway=0.8,compact=0.15,expanded=0.05"),
+                        help="pesos dos formatos, ex.: gateway=0.8,compact=0.15,expanded=0.05")
+    parser.add_argument("--duplicates", type=float, default=0.1, help="fração dos frames também recebida por um segundo gateway")
+    parser.add_argument("--rate", type=float, default=0, help="requisições/s (0 = o mais rápido possível)")
+    parser.add_argument("--duration", type=float, default=10, help="segundos de carga com --rate")
+    parser.add_argument("--requests", type=int, default=20000, help="requisições sem --rate")
+    parser.add_argument("--connections", type=int, default=32, help="conexões simultâneas")
+    parser.add_argument("--warmup", type=int, default=500, help="requisições de aquecimento (fora da medição)")
+    parser.add_argument("--env", action="append", default=[], metavar="NOME=VALOR", help="variável de ambiente do servidor")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--label", default="", help="identificação da execução no JSON")
+    parser.add_argument("--output", help="arquivo JSON com configuração e resultados")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    count = int(args.rate * args.duration) if args.rate else args.requests
+    bodies = build_bodies(args, count + args.warmup)
+    requests = [make_request(host, body) for body in bodies]
+
+    server = None
+    if args.server != "none":
+        env = {
+            **os.environ, "PORT": str(port), "MAX_MESSAGES": "100000", "WAL_DIR": "", "SQLITE_PATH": "",
+            "LOG_LEVEL": "WARNING"
+        }
+        env.update(item.split("=", 1) for item in args.env)
+        server = subprocess.Popen(SERVERS[args.server], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        wait_ready(f"{url.scheme}://{host}:{port}")
+        mode = f"{args.rate:.0f} req/s por {args.duration:.0f} s" if args.rate else f"{count} requisições em malha fechada"
+        print(f"Servidor {args.server} em {host}:{port} | {args.devices} dispositivos, {args.gateways} gateways | "
+              f"{mode}, {args.connections} conexões")
+        if args.warmup:
+            asyncio.run(run_load(host, port, requests[:args.warmup], args.connections, 0))
+
+        async def measured():
+            done = asyncio.Event()
+            sampler = RssSampler(server.pid) if server is not None else None
+            task = asyncio.ensure_future(sampler.run(done)) if sampler else None
+            elapsed, results = await run_load(host, port, requests[args.warmup:], args.connections, args.rate)
+            done.set()
+            if task:
+                await task
+            return elapsed, results, sampler.samples if sampler else []
+
+        elapsed, results, rss_samples = asyncio.run(measured())
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    summary = summarize(elapsed, results, rss_samples)
+    print_summary(summary)
+    if args.compare:
+        print_comparison(summary, args.compare)
+    if args.output:
+        config = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+        with open(args.output, "w") as output:
+            json.dump({
+                "label": args.label,
+                "version": git_version(),
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "config": config,
+                "summary": summary
+            }, output, indent=2, ensure_ascii=False)
+        print(f"\nResultados gravados em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
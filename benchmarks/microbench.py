@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📊 Microbenchmarks dos caminhos críticos
+========================================
+
+Mede, por operação:
+
+- ``expand_lora_payload`` nos três formatos de entrada (envelope do
+  gateway, compacto LoRa e expandido legado);
+- ``build_message``: a montagem do ``message_data`` em
+  ``receive_message()`` (expansão + metadados);
+- GET /api/messages com 1k, 10k e 100k mensagens (seleção e ``jsonify``);
+- GET /api/stats.
+
+Cada caso é calibrado para rodar ao menos 0,2 s por repetição; o
+resultado é o melhor tempo entre as repetições (o menos afetado por
+ruído) e a mediana. ``--save`` grava os números num arquivo de
+referência e ``--compare`` aponta os casos que ficaram mais lentos que a
+referência além do limite (``--threshold``, em %), saindo com código 1:
+
+    python3 benchmarks/microbench.py --save             # grava a referência
+    python3 benchmarks/microbench.py --compare          # compara com ela
+    python3 benchmarks/microbench.py --filter expand    # apenas alguns casos
+
+A referência padrão é ``benchmarks/microbench_baseline.json``; compare
+apenas números medidos na mesma máquina.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import timeit
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, "benchmarks", "microbench_baseline.json")
+
+# Configuração do app antes da importação: armazenamento grande, sem
+# persistência, sem deduplicação (os frames sintéticos se repetiriam) e
+# sem linhas de log por frame
+os.environ.update({
+    "MAX_MESSAGES": "100000", "WAL_DIR": "", "SQLITE_PATH": "", "SHM_RING_NAME": "",
+    "DEDUP_WINDOW_SECONDS": "0", "RATE_LIMIT_RATE": "0", "LOG_LEVEL": "WARNING"
+})
+sys.path.insert(0, ROOT)
+
+import app as server  # noqa: E402
+
+PAYLOADS_PER_RUN = 1000
+MESSAGE_COUNTS = (1000, 10000, 100000)
+
+
+def make_compact(rng, index):
+    return {
+        "dt": f"{rng.randint(1, 28):02d}{rng.randint(1, 12):02d}2025",
+        "hr": f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}",
+        "ti": rng.randint(50, 2000),
+        "m": rng.randint(0, 80),
+        "cm": round(rng.uniform(0.5, 1), 3),
+        "cmin": round(rng.uniform(0.3, 0.6), 3),
+        "cmax": round(rng.uniform(0.8, 1), 3),
+        "op": round(rng.uniform(0, 40), 2),
+        "dg": {"oe": rng.random() < 0.3, "an": rng.random() < 0.1},
+        "id": f"LORA-{index % 200:03d}"
+    }
+
+
+def make_payloads(count, seed=1):
+    """Payloads já decodificados de cada formato, como chegam em expand_lora_payload"""
+    rng = random.Random(seed)
+    formats = {"gateway_lora": [], "lora_compact": [], "expanded": []}
+    for index in range(count):
+        frame = make_compact(rng, index)
+        formats["gateway_lora"].append({
+            "client_id": f"gateway-{index % 4:02d}",
+            "message_id": index,
+            "lora_data": json.dumps(frame, separators=(",", ":")),
+            "rssi": -rng.randint(40, 120),
+            "snr": rng.randint(-5, 12)
+        })
+        formats["lora_compact"].append(frame)
+        dt = frame["dt"]
+        formats["expanded"].append({
+            "timestamp": f"{dt[4:8]}-{dt[2:4]}-{dt[0:2]} {frame['hr']}",
+            "tempo_inferencia_ms": frame["ti"],
+            "deteccoes": {
+                "total": frame["m"],
+                "confianca_media": frame["cm"],
+                "confianca_min": frame["cmin"],
+                "confianca_max": frame["cmax"],
+                "ocupacao_pct": frame["op"]
+            },
+            "diagnostico": {"ocupacao_excessiva": frame["dg"]["oe"], "anormal": frame["dg"]["an"]},
+            "lora_id": frame["id"]
+        })
+    return formats
+
+
+def fill_store(count):
+    """Enche o armazenamento com ``count`` mensagens do envelope do gateway"""
+    payloads = make_payloads(count, seed=2)["gateway_lora"]
+    for start in range(0, count, 5000):
+        server.store_messages([server.build_message(payload, "127.0.0.1") for payload in payloads[start:start + 5000]])
+
+
+def build_cases():
+    """Nome -> (função sem argumentos, operações por chamada)"""
+    cases = {}
+    payloads = make_payloads(PAYLOADS_PER_RUN)
+    for name, items in payloads.items():
+        cases[f"expand_lora_payload[{name}]"] = (
+            lambda items=items: [server.expand_lora_payload(item) for item in items], len(items)
+        )
+    for name, items in payloads.items():
+        cases[f"build_message[{name}]"] = (
+            lambda items=items: [server.build_message(item, "127.0.0.1") for item in items], len(items)
+        )
+
+    client = server.app.test_client()
+
+    def get(url):
+        def call():
+            response = client.get(url)
+            assert response.status_code == 200, response.status_code
+        return call
+
+    for count in MESSAGE_COUNTS:
+        cases[f"get_messages[{count // 1000}k]"] = (get(f"/api/messages?limit={count}"), 1)
+    cases["get_stats"] = (get("/api/stats"), 1)
+    return cases
+
+
+def measure(func, ops, repeat):
+    """(melhor, mediana) em microssegundos por operação"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, number)
+    runs = [elapsed / (number * ops) * 1e6 for elapsed in timer.repeat(repeat, number)]
+    return min(runs), statistics.median(runs)
+
+
+def git_version():
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """Imprime a variação por caso e retorna os casos acima do limite"""
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    print(f"\nComparação com {baseline_path} ({baseline.get('version') or 'versão desconhecida'}), limite +{threshold:g}%:")
+    regressions = []
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"  {name:<32} sem referência")
+            continue
+        change = (result["best_us"] - before["best_us"]) / before["best_us"] * 100
+        flag = ""
+        if change > threshold:
+            flag = "  ⚠️ REGRESSÃO"
+            regressions.append(name)
+        print(f"  {name:<32} {before['best_us']:>12.2f} -> {result['best_us']:>12.2f} µs  ({change:+.1f}%){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks dos caminhos críticos")
+    parser.add_argument("--filter", default="", help="apenas casos cujo nome contém este texto")
+    parser.add_argument("--repeat", type=int, default=5, help="repetições por caso")
+    parser.add_argument("--save", nargs="?", const=BASELINE, help="grava os resultados (padrão: referência)")
+    parser.add_argument("--compare", nargs="?", const=BASELINE, help="compara com a referência (padrão: referência)")
+    parser.add_argument("--threshold", type=float, default=10, help="regressão tolerada, em %% (padrão: 10)")
+    args = parser.parse_args()
+
+    cases = {name: case for name, case in build_cases().items() if args.filter in name}
+    if any(name.startswith("get_") for name in cases):
+        fill_store(max(MESSAGE_COUNTS))
+
+    print(f"{'Caso':<32} {'melhor':>12} {'mediana':>12}")
+    results = {}
+    for name, (func, ops) in cases.items():
+        best, median = measure(func, ops, args.repeat)
+        results[name] = {"best_us": round(best, 3), "median_us": round(median, 3)}
+        print(f"{name:<32} {best:>9.2f} µs {median:>9.2f} µs")
+
+    regressions = compare(results, args.compare, args.threshold) if args.compare else []
+
+    if args.save:
+        with open(args.save, "w") as output:
+            json.dump({
+                "version": git_version(),
+                "python": platform.python_version(),
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "results": results
+            }, output, indent=2, ensure_ascii=False)
+            output.write("\n")
+        print(f"\nResultados gravados em {args.save}")
+
+    if regressions:
+        print(f"\n{len(regressions)} caso(s) acima do limite: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
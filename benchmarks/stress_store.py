@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🧪 Teste de estresse de concorrência do armazenamento
+=====================================================
+
+Várias threads ingerem mensagens (ingest_message / ingest_batch) enquanto
+outras leem o armazenamento (range, get) e os agregados, com troca de
+thread forçada a cada poucos microssegundos. Ao final verifica:
+
+- nenhuma contagem perdida em total_messages;
+- seqs contíguos e sem repetição, de first_seq a last_seq;
+- agregados consistentes com as mensagens retidas;
+- nenhuma exceção nos leitores, nenhuma leitura fora de ordem e nenhuma
+  ingestão recusada.
+
+Uso:
+    python3 benchmarks/stress_store.py [segundos] [escritores] [leitores]
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_storage import make_payload  # noqa: E402
+
+import app  # noqa: E402
+
+
+def writer(stop, written, stored, index, failures):
+    count = 0
+    stored_count = 0
+    while not stop.is_set():
+        if random.random() < 0.2:
+            items = [make_payload(count + offset) for offset in range(random.randint(2, 20))]
+            body, status = app.ingest_batch(items, f"10.0.0.{index}")
+        else:
+            items = [make_payload(count)]
+            body, status = app.ingest_message(items[0], f"10.0.0.{index}")
+        if status not in (200, 201):
+            failures.append(f"escritor {index}: status {status} ({body.get('error')})")
+            break
+        stored_count += body["stored"]
+        count += len(items)
+    written[index] = count
+    stored[index] = stored_count
+
+
+def reader(stop, failures):
+    storage = app.messages_storage
+    while not stop.is_set():
+        try:
+            since = storage.first_seq
+            messages = storage.range(since=since - 1 if since else None, limit=200)
+            seqs = [message["seq"] for message in messages]
+            if seqs and seqs != list(range(seqs[0], seqs[0] + len(seqs))):
+                failures.append(f"range não contíguo: {seqs[:5]}...")
+            for message in messages[:5]:
+                current = storage.get(message["seq"])
+                if current is not None and current["seq"] != message["seq"]:
+                    failures.append(f"get({message['seq']}) devolveu seq {current['seq']}")
+            app.aggregates.snapshot()
+        except Exception as e:  # noqa: BLE001 - qualquer exceção é falha
+            failures.append(f"{type(e).__name__}: {e}")
+
+
+def run(seconds=5, writers=4, readers=4):
+    """Executa o cenário e retorna as verificações [(nome, ok, detalhe)]"""
+    storage = app.messages_storage
+    start_seq = storage.next_seq - 1
+    start_total = app.current_stats()["total_messages"]
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+
+    stop = threading.Event()
+    written = [0] * writers
+    stored = [0] * writers
+    failures = []
+    threads = [threading.Thread(target=writer, args=(stop, written, stored, index, failures)) for index in range(writers)]
+    threads += [threading.Thread(target=reader, args=(stop, failures)) for _ in range(readers)]
+    try:
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        sys.setswitchinterval(switch_interval)
+
+    total = sum(written)
+    ingested = app.current_stats()["total_messages"] - start_total
+    messages = storage.range(limit=len(storage))
+    seqs = [message["seq"] for message in messages]
+    snapshot = app.aggregates.snapshot()
+    return [
+        ("total_messages", ingested == total, f"{ingested} de {total}"),
+        ("seqs contíguos", seqs == list(range(storage.first_seq, storage.last_seq + 1)), f"{len(seqs)} mensagens"),
+        # Retransmissões (mesmo dispositivo e horário) não recebem seq
+        ("último seq", storage.last_seq - start_seq == sum(stored), f"{storage.last_seq} (esperado {start_seq + sum(stored)})"),
+        ("agregados", snapshot["global"]["captures"] == len(storage), f"{snapshot['global']['captures']} capturas"),
+        ("threads", total > 0 and not failures, f"{total} mensagens enviadas, {len(failures)} falhas" + (f" (ex.: {failures[0]})" if failures else ""))
+    ]
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    writers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    readers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    app.logger.disabled = True
+    print(f"{writers} escritores, {readers} leitores, {seconds:.0f} s, MAX_MESSAGES={app.MAX_MESSAGES}")
+    checks = run(seconds, writers, readers)
+    for name, ok, detail in checks:
+        print(f"  {'OK   ' if ok else 'FALHA'} {name:<16} {detail}")
+
+    sys.exit(0 if all(ok for _, ok, _ in checks) else 1)
+
+
+if __name__ == "__main__":
+    main()
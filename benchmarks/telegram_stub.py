@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🧪 Servidor local da Bot API do Telegram (stub) e teste do notificador
+======================================================================
+
+Responde a ``POST /bot<token>/sendMessage`` como a Bot API e imprime cada
+mensagem recebida, para testar o servidor sem enviar nada ao Telegram.
+Pode simular falhas: as primeiras N requisições recebem 500 ou 429.
+
+Uso:
+    # Stub na porta 8081; o servidor aponta para ele
+    python3 benchmarks/telegram_stub.py --port 8081 [--fail 2] [--status 429]
+    TELEGRAM_TOKEN=teste DEFAULT_CHAT_ID=1 TELEGRAM_API_URL=http://127.0.0.1:8081 python3 app.py
+
+    # Verificação automática de TelegramNotifier contra o stub
+    python3 benchmarks/telegram_stub.py --check
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+class StubServer(ThreadingHTTPServer):
+    """Bot API falsa: guarda as mensagens recebidas e falha as primeiras ``fail`` requisições"""
+
+    daemon_threads = True
+
+    def __init__(self, address, fail=0, status=500, quiet=False):
+        super().__init__(address, StubHandler)
+        self.fail = fail
+        self.fail_status = status
+        self.quiet = quiet
+        self.requests = 0
+        self.connections = set()
+        self.messages = []
+        self.lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, como a Bot API
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with server.lock:
+            server.requests += 1
+            server.connections.add(self.client_address)
+            failing = server.fail > 0
+            if failing:
+                server.fail -= 1
+        if not self.path.endswith("/sendMessage"):
+            return self.reply(404, {"ok": False, "description": "Not Found"})
+        if failing:
+            if server.fail_status == 429:
+                return self.reply(429, {"ok": False, "parameters": {"retry_after": 0.2}})
+            return self.reply(server.fail_status, {"ok": False})
+        payload = json.loads(body)
+        with server.lock:
+            server.messages.append(payload)
+        if not server.quiet:
+            print(f"--- chat {payload.get('chat_id')} ---\n{payload.get('text')}\n", flush=True)
+        self.reply(200, {"ok": True, "result": {"message_id": len(server.messages)}})
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(fail=0, status=500, quiet=True):
+    server = StubServer(("127.0.0.1", 0), fail, status, quiet)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def frame(device, flies, occupancy, status, second):
+    diagnostico = {"ocupacao_excessiva": status != "normal", "anormal": status == "anormal"}
+    return {
+        "lora_id": device,
+        "gateway_id": "gateway-pico",
+        "timestamp": f"2025-11-20 10:00:{second:02d}",
+        "deteccoes": {"total": flies, "ocupacao_pct": occupancy},
+        "diagnostico": diagnostico,
+        "diagnostico_servidor": diagnostico
+    }
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def check():
+    from notifier import TelegramNotifier
+
+    results = []
+
+    # Agrupamento: 1º alerta na hora, piora na hora, repetições em um resumo no fim da janela
+    server = start_stub()
+    notifier = TelegramNotifier("teste", 42, f"http://127.0.0.1:{server.server_port}", window=0.5, backoff=0.05)
+    started = time.perf_counter()
+    for second in range(20):
+        notifier.notify(frame("LORA-001", 30 + second, 25.0, "alerta", second))
+    notifier.notify(frame("LORA-001", 60, 35.0, "anormal", 20))
+    notifier.notify(frame("LORA-002", 1, 1.0, "normal", 21))
+    notify_ms = (time.perf_counter() - started) * 1000
+    wait_for(lambda: len(server.messages) >= 3, timeout=3)
+    texts = [message["text"] for message in server.messages]
+    results.append(("sem bloqueio", notify_ms < 50, f"{notify_ms:.1f} ms para 22 frames"))
+    results.append(("agrupamento", len(texts) == 3 and "mais 19 alerta(s)" in texts[2], f"{len(texts)} mensagens"))
+    results.append(("piora", len(texts) >= 2 and texts[1].startswith("🔴 ANORMAL"), texts[1].split("\n")[0] if len(texts) > 1 else ""))
+    results.append(("keep-alive", len(server.connections) == 1, f"{len(server.connections)} conexão(ões)"))
+    notifier.close()
+    server.shutdown()
+
+    # Novas tentativas: 500 e 429 (retry_after) antes do sucesso
+    for status in (500, 429):
+        server = start_stub(fail=2, status=status)
+        notifier = TelegramNotifier("teste", 42, f"http://127.0.0.1:{server.server_port}", window=60, backoff=0.05)
+        notifier.notify(frame("LORA-003", 70, 40.0, "anormal", 0))
+        delivered = wait_for(lambda: len(server.messages) == 1)
+        stats = notifier.stats()
+        results.append((f"retry {status}", delivered and stats["retries"] == 2, f"{stats['retries']} novas tentativas"))
+        notifier.close()
+        server.shutdown()
+
+    # Servidor fora do ar: conexão recusada, alerta descartado após as tentativas
+    server = start_stub()
+    port = server.server_port
+    server.shutdown()
+    server.server_close()
+    notifier = TelegramNotifier("teste", 42, f"http://127.0.0.1:{port}", window=60, max_retries=2, backoff=0.01)
+    notifier.notify(frame("LORA-004", 70, 40.0, "anormal", 0))
+    failed = wait_for(lambda: notifier.stats()["failed"] == 1)
+    results.append(("fora do ar", failed, f"{notifier.stats()['retries']} novas tentativas, descartado"))
+
+    # Fila cheia: descarta sem bloquear
+    notifier = TelegramNotifier("teste", 42, f"http://127.0.0.1:{port}", queue_size=5, max_retries=50, backoff=1)
+    for second in range(50):
+        notifier.notify(frame(f"LORA-{second:03d}", 70, 40.0, "anormal", second))
+    stats = notifier.stats()
+    results.append(("fila cheia", stats["dropped"] > 0, f"{stats['dropped']} descartados"))
+    notifier._stopping.set()
+
+    ok = True
+    for name, passed, detail in results:
+        ok = ok and passed
+        print(f"  {'OK   ' if passed else 'FALHA'} {name:<14} {detail}")
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--fail", type=int, default=0, help="responder com erro às primeiras N requisições")
+    parser.add_argument("--status", type=int, default=500, help="status das falhas simuladas (500 ou 429)")
+    parser.add_argument("--check", action="store_true", help="testar o TelegramNotifier contra o stub e sair")
+    args = parser.parse_args()
+    if args.check:
+        return check()
+    server = StubServer(("127.0.0.1", args.port), args.fail, args.status)
+    print(f"📨 Stub da Bot API em http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🧪 Receptor local de webhooks (stub) e teste do encaminhamento
+==============================================================
+
+Recebe os lotes POST dos webhooks (array JSON de mensagens), conta
+mensagens, lotes e requisições simultâneas, e pode simular um destino
+lento (``--delay``) ou fora do ar (``--fail``: as primeiras N requisições
+recebem 503).
+
+Uso:
+    # Receptor na porta 8082; o servidor encaminha para ele
+    python3 benchmarks/webhook_stub.py --port 8082 [--delay 0.2] [--fail 10]
+    WEBHOOK_URLS=stub=http://127.0.0.1:8082/ingest python3 app.py
+
+    # Verificação automática de WebhookSink contra o stub
+    python3 benchmarks/webhook_stub.py --check
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+class StubServer(ThreadingHTTPServer):
+    """Receptor falso: guarda os seqs recebidos e mede a concorrência"""
+
+    daemon_threads = True
+
+    def __init__(self, address, delay=0.0, fail=0, quiet=False):
+        super().__init__(address, StubHandler)
+        self.delay = delay
+        self.fail = fail
+        self.quiet = quiet
+        self.lock = threading.Lock()
+        self.seqs = []
+        self.batches = []
+        self.connections = set()
+        self.active = 0
+        self.max_active = 0
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            server.connections.add(self.client_address)
+            failing = server.fail > 0
+            if failing:
+                server.fail -= 1
+        try:
+            if server.delay:
+                time.sleep(server.delay)
+            if failing:
+                return self.reply(503)
+            messages = json.loads(body)
+            with server.lock:
+                server.batches.append(len(messages))
+                server.seqs.extend(message.get("seq") for message in messages)
+            if not server.quiet:
+                print(f"lote de {len(messages)} mensagens (seq {messages[0].get('seq')}..{messages[-1].get('seq')})", flush=True)
+            self.reply(200)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def reply(self, status):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(delay=0.0, fail=0, port=0):
+    server = StubServer(("127.0.0.1", port), delay, fail, quiet=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def messages(first, count):
+    return [{"seq": seq, "lora_id": "LORA-001", "deteccoes": {"total": seq % 50}} for seq in range(first, first + count)]
+
+
+def check():
+    from webhooks import WebhookSink
+
+    results = []
+
+    # Lotes por tamanho e por tempo, sem bloquear a ingestão
+    server = start_stub()
+    sink = WebhookSink("stub", f"http://127.0.0.1:{server.server_port}/ingest", batch_size=50, flush_interval=0.3)
+    started = time.perf_counter()
+    for message in messages(1, 120):
+        sink.put(message)
+    put_ms = (time.perf_counter() - started) * 1000
+    wait_for(lambda: len(server.seqs) == 120)
+    results.append(("sem bloqueio", put_ms < 50, f"{put_ms:.1f} ms para 120 mensagens"))
+    results.append(("lotes", sorted(server.batches) == [20, 50, 50], f"{server.batches}"))
+    results.append(("keep-alive", len(server.connections) <= sink.concurrency, f"{len(server.connections)} conexão(ões)"))
+    stats = sink.stats()
+    results.append(("lag", stats["lag_messages"] == 0 and stats["lag_seq"] == 0, f"lag {stats['lag_seconds']} s no último lote"))
+    sink.close()
+    server.shutdown()
+
+    # Limite de concorrência por destino com receptor lento
+    server = start_stub(delay=0.2)
+    sink = WebhookSink("lento", f"http://127.0.0.1:{server.server_port}/", batch_size=10, flush_interval=0.05, concurrency=3)
+    for message in messages(1, 200):
+        sink.put(message)
+    wait_for(lambda: len(server.seqs) == 200)
+    results.append(("concorrência", server.max_active == 3, f"máximo {server.max_active} simultâneas (limite 3)"))
+    sink.close()
+    server.shutdown()
+
+    # Novas tentativas: 503 nas duas primeiras requisições
+    server = start_stub(fail=2)
+    sink = WebhookSink("retry", f"http://127.0.0.1:{server.server_port}/", batch_size=10, concurrency=1, backoff=0.05)
+    for message in messages(1, 10):
+        sink.put(message)
+    wait_for(lambda: len(server.seqs) == 10)
+    stats = sink.stats()
+    results.append(("retry", len(server.seqs) == 10 and stats["retries"] == 2, f"{stats['retries']} novas tentativas"))
+    sink.close()
+    server.shutdown()
+
+    # Destino fora do ar: lotes vão para o disco e são reenviados quando ele volta
+    spill_dir = tempfile.mkdtemp(prefix="webhook-spill-")
+    try:
+        server = start_stub()
+        port = server.server_port
+        server.shutdown()
+        server.server_close()
+        sink = WebhookSink(
+            "lake", f"http://127.0.0.1:{port}/", batch_size=25, flush_interval=0.1,
+            max_retries=1, backoff=0.05, spill_dir=spill_dir
+        )
+        for message in messages(1, 100):
+            sink.put(message)
+        wait_for(lambda: sink.stats()["spilled"] == 100)
+        stats = sink.stats()
+        results.append(("transbordo", stats["state"] == "down" and stats["spilled"] == 100,
+                        f"{stats['spilled']} mensagens em {len(os.listdir(os.path.join(spill_dir, 'lake')))} arquivos"))
+        server = start_stub(port=port)
+        for message in messages(101, 20):
+            sink.put(message)
+        # O stub registra os seqs antes de responder: esperar também o disco esvaziar
+        recovered = wait_for(lambda: len(set(server.seqs)) == 120 and sink.stats()["spilled"] == 0, timeout=15)
+        stats = sink.stats()
+        results.append(("recuperação", recovered and stats["state"] == "up" and stats["spilled"] == 0,
+                        f"{len(set(server.seqs))} de 120 entregues, {stats['spilled']} no disco"))
+        sink.close()
+        server.shutdown()
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    ok = True
+    for name, passed, detail in results:
+        ok = ok and passed
+        print(f"  {'OK   ' if passed else 'FALHA'} {name:<14} {detail}")
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--delay", type=float, default=0.0, help="segundos de espera por requisição")
+    parser.add_argument("--fail", type=int, default=0, help="responder 503 às primeiras N requisições")
+    parser.add_argument("--check", action="store_true", help="testar o WebhookSink contra o stub e sair")
+    args = parser.parse_args()
+    if args.check:
+        return check()
+    server = StubServer(("127.0.0.1", args.port), args.delay, args.fail)
+    print(f"📨 Receptor de webhooks em http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
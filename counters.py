@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Contadores fragmentados por thread
+==================================
+
+``stats["total_messages"] += 1`` não é atômico: duas threads podem ler
+o mesmo valor e uma das somas se perde. Aqui cada thread incrementa o
+seu próprio fragmento (só ela escreve nele), então o incremento não
+precisa de trava e nenhuma contagem se perde; a leitura soma os
+fragmentos.
+
+Servidores que criam uma thread por requisição (Werkzeug) deixariam
+fragmentos órfãos; quando a thread termina, o valor do fragmento é
+incorporado a um total acumulado e o fragmento é descartado.
+"""
+import threading
+import weakref
+
+
+class _Shard:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+
+class _Owner:
+    """Mantido no threading.local; coletado quando a thread termina"""
+
+    __slots__ = ("shard", "__weakref__")
+
+    def __init__(self, shard):
+        self.shard = shard
+
+
+class ShardedCounter:
+    """Contador com incremento sem trava e sem perda entre threads"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = set()
+        self._retired = 0
+        self._baseline = 0
+
+    def _shard(self):
+        shard = _Shard()
+        owner = self._local.owner = _Owner(shard)
+        with self._lock:
+            self._shards.add(shard)
+        weakref.finalize(owner, self._retire, shard)
+        return shard
+
+    def _retire(self, shard):
+        with self._lock:
+            self._retired += shard.value
+            self._shards.discard(shard)
+
+    def add(self, amount=1):
+        owner = getattr(self._local, "owner", None)
+        shard = owner.shard if owner is not None else self._shard()
+        shard.value += amount
+
+    def _total(self):
+        with self._lock:
+            return self._retired + sum(shard.value for shard in self._shards)
+
+    @property
+    def value(self):
+        return self._total() - self._baseline
+
+    def reset(self):
+        """Zera o contador (incrementos concorrentes ao reset contam de um lado ou do outro)"""
+        self._baseline = self._total()
+
+
+class Counters:
+    """Conjunto de contadores nomeados (ex.: estatísticas do servidor)"""
+
+    def __init__(self, *names):
+        self._counters = {name: ShardedCounter() for name in names}
+
+    def add(self, name, amount=1):
+        self._counters[name].add(amount)
+
+    def __getitem__(self, name):
+        return self._counters[name].value
+
+    def snapshot(self):
+        return {name: counter.value for name, counter in self._counters.items()}
+
+    def reset(self):
+        for counter in self._counters.values():
+            counter.reset()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Deduplicação de retransmissões LoRa
+===================================
+
+O mesmo frame chega mais de uma vez quando o gateway retransmite ou
+quando dois gateways estão ao alcance do dispositivo. Uma mensagem é
+considerada repetida se já foi vista, dentro da janela de tempo, com a
+mesma chave:
+
+- ``(lora_id, timestamp)``: mesmo frame (dt + hr) do mesmo dispositivo,
+  por qualquer gateway;
+- ``(gateway_id, message_id)``: mesma retransmissão de um gateway.
+
+O índice guarda apenas o hash de cada chave e o seq da mensagem
+armazenada, num dicionário ordenado por inserção: consulta O(1) e
+memória limitada a ``max_entries`` chaves (as mais antigas saem primeiro,
+assim como as que passaram da janela).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+def message_keys(message):
+    """Hashes das chaves de deduplicação da mensagem expandida"""
+    keys = []
+    lora_id = message.get("lora_id")
+    timestamp = message.get("timestamp")
+    if isinstance(lora_id, str) and lora_id != "UNKNOWN" and isinstance(timestamp, str):
+        keys.append(hash(("frame", lora_id, timestamp)))
+    gateway_id = message.get("gateway_id")
+    message_id = message.get("message_id")
+    if gateway_id is not None and message_id:
+        keys.append(hash(("gateway", gateway_id, message_id)))
+    return keys
+
+
+def signal_quality(message):
+    """(RSSI, SNR) para comparar cópias do mesmo frame; valores ausentes perdem"""
+    rssi = message.get("rssi")
+    snr = message.get("snr")
+    return (
+        rssi if isinstance(rssi, (int, float)) and rssi != 0 else float("-inf"),
+        snr if isinstance(snr, (int, float)) else float("-inf")
+    )
+
+
+class DedupIndex:
+    """Hashes de chaves vistas recentemente -> seq da mensagem armazenada"""
+
+    def __init__(self, window_seconds=300, max_entries=100000):
+        self.window = window_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        entries = self._entries
+        while entries:
+            _, (_, seen) = next(iter(entries.items()))
+            if now - seen < self.window and len(entries) <= self.max_entries:
+                break
+            entries.popitem(last=False)
+
+    def find(self, keys):
+        """Seq da mensagem já vista com alguma das chaves, ou None"""
+        if not keys:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and now - entry[1] < self.window:
+                    return entry[0]
+        return None
+
+    def add(self, keys, seq):
+        """Registra as chaves da mensagem armazenada com o seq informado"""
+        if not keys:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                self._entries[key] = (seq, now)
+                self._entries.move_to_end(key)
+            self._expire(now)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
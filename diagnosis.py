@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Diagnóstico no servidor
+=======================
+
+O dispositivo envia seu próprio diagnóstico (``dg.oe``/``dg.an``), que
+depende dos limiares gravados no firmware. O servidor recalcula o
+diagnóstico de cada detecção a partir da ocupação (``op``) e do total de
+moscas (``m``) com os limiares de ``config.py``:
+
+- ocupação excessiva: ocupação > OCUPACAO_EXCESSIVA_THRESHOLD
+- anormal: ocupação > ANORMAL_OCUPACAO_THRESHOLD ou moscas > ANORMAL_MOSCAS_THRESHOLD
+
+O resultado é guardado em ``diagnostico_servidor``, ao lado do
+``diagnostico`` do dispositivo. ``evaluate()`` aplica a mesma regra a
+colunas inteiras (NumPy, se instalado), para reavaliar todo o histórico
+quando os limiares mudam.
+"""
+from collections import namedtuple
+
+import config
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - dependência opcional
+    numpy = None
+
+
+class Thresholds(namedtuple("Thresholds", "ocupacao_excessiva anormal_ocupacao anormal_moscas")):
+    """Limiares do diagnóstico (ocupação em %, moscas em unidades)"""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_config(cls):
+        return cls(
+            config.OCUPACAO_EXCESSIVA_THRESHOLD,
+            config.ANORMAL_OCUPACAO_THRESHOLD,
+            config.ANORMAL_MOSCAS_THRESHOLD
+        )
+
+    @classmethod
+    def from_dict(cls, values, defaults):
+        """Limiares de um JSON, completando os ausentes com ``defaults``"""
+        if not isinstance(values, dict):
+            raise ValueError("limiares devem ser um objeto JSON")
+        unknown = set(values) - set(cls._fields)
+        if unknown:
+            raise ValueError(f"limiares desconhecidos: {', '.join(sorted(unknown))}")
+        merged = defaults._asdict()
+        for name, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                raise ValueError(f"{name} deve ser um número não negativo")
+            merged[name] = value
+        return cls(**merged)
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def diagnose(message, thresholds):
+    """Diagnóstico da mensagem expandida (campos ausentes ou não numéricos contam como 0)"""
+    deteccoes = message.get("deteccoes")
+    if not isinstance(deteccoes, dict):
+        deteccoes = {}
+    occupancy = _number(deteccoes.get("ocupacao_pct"))
+    flies = _number(deteccoes.get("total"))
+    return {
+        "ocupacao_excessiva": occupancy > thresholds.ocupacao_excessiva,
+        "anormal": occupancy > thresholds.anormal_ocupacao or flies > thresholds.anormal_moscas
+    }
+
+
+def evaluate(occupancy, flies, thresholds):
+    """
+    Diagnóstico de colunas inteiras: (ocupação excessiva, anormal) por linha
+
+    Com NumPy, ``occupancy`` e ``flies`` são arrays e o resultado são dois
+    arrays booleanos; sem NumPy, sequências e listas de bool.
+    """
+    if numpy is not None:
+        excessive = occupancy > thresholds.ocupacao_excessiva
+        abnormal = (occupancy > thresholds.anormal_ocupacao) | (flies > thresholds.anormal_moscas)
+        return excessive, abnormal
+    excess_limit = thresholds.ocupacao_excessiva
+    occupancy_limit = thresholds.anormal_ocupacao
+    flies_limit = thresholds.anormal_moscas
+    excessive = [value > excess_limit for value in occupancy]
+    abnormal = [value > occupancy_limit or count > flies_limit for value, count in zip(occupancy, flies)]
+    return excessive, abnormal
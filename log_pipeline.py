@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Logs sem bloqueio no caminho de ingestão
+========================================
+
+As requisições apenas enfileiram o LogRecord (``QueueHandler``); a
+formatação e a escrita no stream acontecem na thread do
+``QueueListener``. Diferente do ``QueueHandler`` padrão, o registro não
+é formatado antes de entrar na fila, então mensagens com argumentos
+(``logger.info("%s moscas", total)``) só são montadas fora da
+requisição. Os argumentos devem ser valores imutáveis (números,
+strings), já que são lidos depois.
+
+Com a fila cheia (saída mais lenta que a entrada) os registros são
+descartados e contados em ``dropped_records()``, em vez de bloquear a
+requisição.
+
+``FrameSampler`` limita as linhas por frame de cada dispositivo
+(amostragem 1 de N e/ou máximo de linhas por segundo), e
+``JsonFormatter`` produz uma linha JSON por registro, com os campos
+passados em ``extra``.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Atributos de todo LogRecord; os demais vieram de ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro, com os campos de ``extra`` no nível superior"""
+
+    def format(self, record):
+        document = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                document[key] = value
+        if record.exc_info:
+            document["exception"] = self.formatException(record.exc_info)
+        return json.dumps(document, ensure_ascii=False, default=str)
+
+
+class FrameSampler(logging.Filter):
+    """
+    Amostragem por dispositivo das linhas por frame
+
+    ``every`` registra 1 de cada N frames de cada dispositivo (1 = todos)
+    e ``rate`` limita as linhas por segundo de cada dispositivo (0 = sem
+    limite). Registros sem o atributo ``device`` (``extra``) e de nível
+    WARNING ou acima sempre passam. A linha que passa leva em ``skipped``
+    quantas linhas do dispositivo foram omitidas desde a anterior.
+
+    Os contadores não usam trava: sob concorrência a amostragem é
+    aproximada, o que basta para reduzir o volume de logs.
+    """
+
+    def __init__(self, every=1, rate=0, max_devices=10000):
+        super().__init__()
+        self.every = max(1, int(every))
+        self.rate = float(rate)
+        self.max_devices = max_devices
+        self._seen = {}
+        self._skipped = {}
+        self._buckets = {}
+
+    def filter(self, record):
+        device = getattr(record, "device", None)
+        if device is None or record.levelno >= logging.WARNING:
+            return True
+        if len(self._seen) >= self.max_devices:
+            # Ids de dispositivo vêm dos clientes: não crescer sem limite
+            self._seen.clear()
+            self._skipped.clear()
+            self._buckets.clear()
+
+        count = self._seen.get(device, 0)
+        self._seen[device] = count + 1
+        if count % self.every or not self._take_token(device):
+            self._skipped[device] = self._skipped.get(device, 0) + 1
+            return False
+        skipped = self._skipped.pop(device, 0)
+        if skipped:
+            record.skipped = skipped
+        return True
+
+    def _take_token(self, device):
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        bucket = self._buckets.get(device)
+        if bucket is None:
+            bucket = self._buckets[device] = [self.rate, now]
+        tokens = min(self.rate, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1
+        return True
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """Enfileira o registro sem formatá-lo; descarta se a fila estiver cheia"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_output = None
+_handler = None
+_listener = None
+
+
+def setup_logging(level="INFO", json_output=False, queue_size=10000, stream=None):
+    """
+    Configura o logger raiz
+
+    ``queue_size`` limita a fila entre as requisições e a thread de
+    escrita; 0 escreve de forma síncrona na thread da requisição (como o
+    ``logging.basicConfig``). Pode ser chamada de novo para reconfigurar:
+    só os handlers instalados por ela são trocados.
+
+    Como no ``logging.basicConfig``, um logger raiz que já tem handlers de
+    outro código (gunicorn, uvicorn, pytest) é mantido como está, e a
+    função retorna False.
+    """
+    global _output, _handler
+    shutdown()
+    root = logging.getLogger()
+    for handler in (_handler, _output):
+        if handler is not None:
+            root.removeHandler(handler)
+    _handler = _output = None
+    if root.handlers:
+        return False
+    root.setLevel(level)
+
+    _output = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    _output.setFormatter(JsonFormatter() if json_output else logging.Formatter(TEXT_FORMAT))
+    if queue_size <= 0:
+        root.addHandler(_output)
+        return True
+    _handler = _DeferredQueueHandler(queue.Queue(queue_size))
+    root.addHandler(_handler)
+    _start_listener()
+    return True
+
+
+def _start_listener():
+    global _listener
+    _listener = QueueListener(_handler.queue, _output, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_after_fork():
+    # A thread do listener não existe no processo filho (ex.: gunicorn --preload)
+    global _handler
+    if _listener is None:
+        return
+    dropped = _handler.dropped
+    logging.getLogger().removeHandler(_handler)
+    _handler = _DeferredQueueHandler(queue.Queue(_handler.queue.maxsize))
+    _handler.dropped = dropped
+    logging.getLogger().addHandler(_handler)
+    _start_listener()
+
+
+def shutdown():
+    """Esvazia a fila e encerra a thread de escrita"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_records():
+    """Registros descartados por fila cheia desde o início"""
+    return _handler.dropped if _handler is not None else 0
+
+
+atexit.register(shutdown)
+os.register_at_fork(after_in_child=_restart_after_fork)
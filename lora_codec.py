@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Codec binário do frame LoRa
+===========================
+
+Alternativa ao formato compacto em JSON (~150 bytes) com layout fixo
+de ~20 bytes, decodificada direto para o mesmo dicionário compacto
+(``dt``, ``hr``, ``ti``, ``m``, ``cm``, ``cmin``, ``cmax``, ``op``,
+``dg``, ``id``) usado por ``expand_lora_payload``.
+
+Layout (little-endian):
+
+    byte 0      cabeçalho: versão (4 bits altos) | flags (4 bits baixos)
+                  bit 0 = dg.oe, bit 1 = dg.an, bit 2 = id por índice
+    bytes 1-4   data/hora: segundos desde 2000-01-01 00:00:00 (uint32)
+    bytes 5-10  cm, cmin, cmax (uint16, x1000)
+    bytes 11-12 op (uint16, x100)
+    varint      ti (ms)
+    varint      m (total de moscas)
+    id          índice (varint) na tabela de dispositivos, se bit 2;
+                senão tamanho (1 byte) + id em UTF-8
+
+O gateway envia o frame em ``lora_data`` codificado em base64, ou o
+frame bruto como corpo de POST /api/messages (application/octet-stream).
+"""
+import struct
+from datetime import date, datetime
+
+VERSION = 1
+
+FLAG_OE = 0x01
+FLAG_AN = 0x02
+FLAG_ID_INDEX = 0x04
+
+_EPOCH = datetime(2000, 1, 1)
+_FIXED = struct.Struct("<BIHHHH")
+_FIXED_SIZE = _FIXED.size
+
+# Cache dias desde _EPOCH -> "ddmmyyyy": os frames de um gateway caem quase
+# todos no mesmo dia, então a data é montada uma vez por dia e não por frame
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+_dates = {}
+_DATES_MAX = 4096
+_TWO_DIGITS = [f"{value:02d}" for value in range(60)]
+
+CONFIDENCE_SCALE = 1000
+OCCUPANCY_SCALE = 100
+
+
+class LoraCodecError(ValueError):
+    """Frame binário inválido"""
+
+
+def _write_varint(value, out):
+    if value < 0:
+        raise LoraCodecError(f"Valor negativo não suportado: {value}")
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(data):
+            raise LoraCodecError("Frame truncado")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+        if shift > 63:
+            raise LoraCodecError("Varint muito longo")
+
+
+def _scaled(value, scale, name):
+    scaled = round((value or 0) * scale)
+    if not 0 <= scaled <= 0xFFFF:
+        raise LoraCodecError(f"Campo {name} fora do intervalo: {value}")
+    return scaled
+
+
+def encode(compact, device_table=None):
+    """
+    Codifica o dicionário compacto (mesmas chaves do JSON LoRa) em bytes
+
+    Se ``device_table`` (lista de ids) contiver o ``id`` do dispositivo,
+    apenas o índice é enviado.
+    """
+    dt = compact.get("dt", "")
+    hr = compact.get("hr", "00:00:00")
+    try:
+        moment = datetime.strptime(f"{dt} {hr}", "%d%m%Y %H:%M:%S")
+    except ValueError:
+        raise LoraCodecError(f"Data/hora inválida: {dt} {hr}")
+    seconds = int((moment - _EPOCH).total_seconds())
+    if not 0 <= seconds <= 0xFFFFFFFF:
+        raise LoraCodecError(f"Data fora do intervalo: {dt}")
+
+    diagnostico = compact.get("dg") or {}
+    flags = (FLAG_OE if diagnostico.get("oe") else 0) | (FLAG_AN if diagnostico.get("an") else 0)
+    device_id = compact.get("id", "UNKNOWN")
+    device_index = None
+    if device_table is not None and device_id in device_table:
+        device_index = device_table.index(device_id)
+        flags |= FLAG_ID_INDEX
+
+    out = bytearray(_FIXED.pack(
+        (VERSION << 4) | flags,
+        seconds,
+        _scaled(compact.get("cm"), CONFIDENCE_SCALE, "cm"),
+        _scaled(compact.get("cmin"), CONFIDENCE_SCALE, "cmin"),
+        _scaled(compact.get("cmax"), CONFIDENCE_SCALE, "cmax"),
+        _scaled(compact.get("op"), OCCUPANCY_SCALE, "op")
+    ))
+    _write_varint(int(compact.get("ti", 0)), out)
+    _write_varint(int(compact.get("m", 0)), out)
+    if device_index is not None:
+        _write_varint(device_index, out)
+    else:
+        encoded_id = device_id.encode("utf-8")
+        if len(encoded_id) > 0xFF:
+            raise LoraCodecError("id do dispositivo muito longo")
+        out.append(len(encoded_id))
+        out += encoded_id
+    return bytes(out)
+
+
+def _date_text(days):
+    """"ddmmyyyy" do dia ``days`` desde _EPOCH (em cache)"""
+    text = _dates.get(days)
+    if text is None:
+        if len(_dates) >= _DATES_MAX:
+            _dates.clear()
+        day = date.fromordinal(_EPOCH_ORDINAL + days)
+        text = _dates[days] = f"{day.day:02d}{day.month:02d}{day.year:04d}"
+    return text
+
+
+def decode(data, device_table=None):
+    """Decodifica um frame binário para o dicionário compacto"""
+    size = len(data)
+    if size < _FIXED_SIZE:
+        raise LoraCodecError("Frame truncado")
+    header, seconds, cm, cmin, cmax, op = _FIXED.unpack_from(data)
+    if header >> 4 != VERSION:
+        raise LoraCodecError(f"Versão de frame não suportada: {header >> 4}")
+
+    # Varints de 1 byte (o caso comum) sem passar por _read_varint
+    offset = _FIXED_SIZE
+    if offset < size and data[offset] < 0x80:
+        ti = data[offset]
+        offset += 1
+    else:
+        ti, offset = _read_varint(data, offset)
+    if offset < size and data[offset] < 0x80:
+        m = data[offset]
+        offset += 1
+    else:
+        m, offset = _read_varint(data, offset)
+    if header & FLAG_ID_INDEX:
+        device_index, offset = _read_varint(data, offset)
+        if device_table is None or device_index >= len(device_table):
+            raise LoraCodecError(f"Índice de dispositivo desconhecido: {device_index}")
+        device_id = device_table[device_index]
+    else:
+        if offset >= size:
+            raise LoraCodecError("Frame truncado")
+        length = data[offset]
+        offset += 1
+        if offset + length > size:
+            raise LoraCodecError("Frame truncado")
+        device_id = str(data[offset:offset + length], "utf-8")
+
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return {
+        "dt": _dates.get(days) or _date_text(days),
+        "hr": f"{_TWO_DIGITS[hours]}:{_TWO_DIGITS[minutes]}:{_TWO_DIGITS[seconds]}",
+        "ti": ti,
+        "m": m,
+        "cm": cm / CONFIDENCE_SCALE,
+        "cmin": cmin / CONFIDENCE_SCALE,
+        "cmax": cmax / CONFIDENCE_SCALE,
+        "op": op / OCCUPANCY_SCALE,
+        "dg": {
+            "oe": bool(header & FLAG_OE),
+            "an": bool(header & FLAG_AN)
+        },
+        "id": device_id
+    }
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Métricas no formato de exposição de texto do Prometheus
+=======================================================
+
+Contadores e histogramas com rótulos, incrementados sem trava no
+caminho de ingestão (cada série usa ``ShardedCounter``, um fragmento por
+thread), e medidores calculados apenas na coleta (``/metrics``).
+
+    registry = Registry()
+    requests = registry.counter("app_requests_total", "Requisições", ("route",))
+    requests.labels("/api/messages").add()
+    print(registry.render())
+
+Séries de um rótulo com valores vindos dos clientes (ex.: gateway) podem
+ser limitadas com ``max_series``; valores novos além do limite são
+contados na série ``"_other"``.
+"""
+import threading
+from bisect import bisect_left
+
+from counters import ShardedCounter
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Segundos; cobre de respostas em memória a lotes grandes
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+OVERFLOW_LABEL = "_other"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+class _Metric:
+    """Família de séries com os mesmos nomes de rótulos"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=(), max_series=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.max_series = max_series
+        self._series = {}
+        self._lock = threading.Lock()
+        if not self.label_names:
+            self._default = self.labels()
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Série com os valores de rótulos informados (criada no primeiro uso)"""
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} espera os rótulos {self.label_names}")
+            with self._lock:
+                series = self._series.get(values)
+                if series is None:
+                    if self.max_series is not None and len(self._series) >= self.max_series:
+                        values = (OVERFLOW_LABEL,) * len(values)
+                        series = self._series.get(values)
+                    if series is None:
+                        series = self._series[values] = self._new_series()
+        return series
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, label_names, values, extra, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(label_names, values, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Contador monotônico (não é zerado pelo DELETE /api/messages)"""
+
+    kind = "counter"
+
+    def _new_series(self):
+        return ShardedCounter()
+
+    def add(self, amount=1):
+        """Incrementa a série sem rótulos"""
+        self._default.add(amount)
+
+    def _samples(self):
+        for values, counter in list(self._series.items()):
+            yield "", self.label_names, values, "", counter.value
+
+
+class _HistogramSeries:
+    __slots__ = ("_bounds", "_buckets", "_sum")
+
+    def __init__(self, bounds):
+        self._bounds = bounds
+        # Um balde por limite mais o +Inf; acumulados só na coleta
+        self._buckets = [ShardedCounter() for _ in range(len(bounds) + 1)]
+        self._sum = ShardedCounter()
+
+    def observe(self, value):
+        self._buckets[bisect_left(self._bounds, value)].add()
+        self._sum.add(value)
+
+    def snapshot(self):
+        counts = [bucket.value for bucket in self._buckets]
+        return counts, self._sum.value
+
+
+class Histogram(_Metric):
+    """Histograma de baldes fixos (ex.: latência por rota)"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS, max_series=None):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels, max_series)
+
+    def _new_series(self):
+        return _HistogramSeries(self.bounds)
+
+    def observe(self, value):
+        """Registra uma observação na série sem rótulos"""
+        self._default.observe(value)
+
+    def _samples(self):
+        for values, series in list(self._series.items()):
+            counts, total = series.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", self.label_names, values, f'le="{_format_value(float(bound))}"', cumulative
+            yield "_sum", self.label_names, values, "", float(total)
+            yield "_count", self.label_names, values, "", cumulative
+
+
+class Gauge(_Metric):
+    """
+    Medidor calculado na coleta
+
+    ``function`` devolve o valor ou, com rótulos, um dicionário
+    {tupla de valores de rótulos: valor}.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, function, labels=()):
+        self.function = function
+        super().__init__(name, documentation, labels)
+
+    def _new_series(self):
+        return None
+
+    def _samples(self):
+        result = self.function()
+        if not self.label_names:
+            yield "", (), (), "", result
+            return
+        for values, value in result.items():
+            yield "", self.label_names, values, "", value
+
+
+class Registry:
+    """Conjunto de métricas exposto em /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=(), max_series=None):
+        return self.register(Counter(name, documentation, labels, max_series))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS, max_series=None):
+        return self.register(Histogram(name, documentation, labels, buckets, max_series))
+
+    def gauge(self, name, documentation, function, labels=()):
+        return self.register(Gauge(name, documentation, function, labels))
+
+    def render(self):
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)"""
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
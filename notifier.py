@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Notificações de alerta pelo Telegram
+====================================
+
+Frames com status ALERTA ou ANORMAL (diagnóstico do servidor, ver
+storage.message_status) entram em uma fila limitada com ``put_nowait``:
+a ingestão nunca espera pelo Telegram, e com a fila cheia o alerta é
+descartado e contado.
+
+Uma thread dedicada consome a fila e agrupa os alertas por dispositivo:
+o primeiro é enviado na hora e abre uma janela de ``window`` segundos; os
+seguintes viram um único resumo (quantidade, pior status, máximos) no fim
+da janela. Uma piora (ALERTA → ANORMAL) dentro da janela é enviada na hora.
+
+Os envios reutilizam uma conexão HTTP persistente (keep-alive) com a Bot
+API e são repetidos com espera exponencial em falhas de rede, 429
+(respeitando ``retry_after``) e 5xx. ``api_url`` permite apontar para um
+servidor local de teste (ver benchmarks/telegram_stub.py).
+"""
+import http.client
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from urllib.parse import urlsplit
+
+from counters import ShardedCounter
+from storage import message_status
+
+logger = logging.getLogger(__name__)
+
+_RANKS = {"alerta": 1, "anormal": 2}
+_ICONS = {"alerta": "🟡", "anormal": "🔴"}
+
+# Marcador na fila: envia os resumos pendentes e encerra a thread
+_STOP = object()
+
+# Espera máxima entre tentativas (segundos)
+_MAX_BACKOFF = 60.0
+
+
+class _Window:
+    """Janela de agrupamento de um dispositivo: último status enviado e alertas acumulados"""
+
+    __slots__ = ("until", "sent_rank", "count", "worst", "max_flies", "max_occupancy", "first", "last", "gateway")
+
+    def __init__(self, until, sent_rank):
+        self.until = until
+        self.sent_rank = sent_rank
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self.worst = None
+        self.max_flies = None
+        self.max_occupancy = None
+        self.first = None
+        self.last = None
+        self.gateway = None
+
+    def add(self, alert):
+        status, _, gateway, flies, occupancy, timestamp = alert
+        self.count += 1
+        if self.worst is None or _RANKS[status] > _RANKS[self.worst]:
+            self.worst = status
+        if flies is not None and (self.max_flies is None or flies > self.max_flies):
+            self.max_flies = flies
+        if occupancy is not None and (self.max_occupancy is None or occupancy > self.max_occupancy):
+            self.max_occupancy = occupancy
+        if self.first is None:
+            self.first = timestamp
+        self.last = timestamp
+        self.gateway = gateway
+
+
+def _alert(message, status):
+    """Campos do alerta: (status, dispositivo, gateway, moscas, ocupação, horário)"""
+    deteccoes = message.get("deteccoes")
+    if not isinstance(deteccoes, dict):
+        deteccoes = {}
+    return (
+        status, message.get("lora_id"), message.get("gateway_id"),
+        deteccoes.get("total"), deteccoes.get("ocupacao_pct"), message.get("timestamp")
+    )
+
+
+def format_alert(alert):
+    """Texto de um alerta individual"""
+    status, device, gateway, flies, occupancy, timestamp = alert
+    lines = [f"{_ICONS[status]} {status.upper()} | {device}" + (f" ({gateway})" if gateway else "")]
+    details = []
+    if flies is not None:
+        details.append(f"{flies} moscas")
+    if occupancy is not None:
+        details.append(f"ocupação {occupancy}%")
+    if details:
+        lines.append(" · ".join(details))
+    if timestamp:
+        lines.append(str(timestamp))
+    return "\n".join(lines)
+
+
+def format_summary(device, window, seconds):
+    """Texto do resumo dos alertas agrupados na janela"""
+    lines = [
+        f"{_ICONS[window.worst]} {window.worst.upper()} | {device}"
+        + (f" ({window.gateway})" if window.gateway else "")
+        + f": mais {window.count} alerta(s) em {seconds:g} s"
+    ]
+    details = []
+    if window.max_flies is not None:
+        details.append(f"máx. {window.max_flies} moscas")
+    if window.max_occupancy is not None:
+        details.append(f"ocupação máx. {window.max_occupancy}%")
+    if details:
+        lines.append(" · ".join(details))
+    if window.first:
+        lines.append(f"{window.first} … {window.last}" if window.last != window.first else str(window.first))
+    return "\n".join(lines)
+
+
+class TelegramNotifier:
+    """Envio assíncrono de alertas para um chat do Telegram, agrupados por dispositivo"""
+
+    def __init__(self, token, chat_id, api_url="https://api.telegram.org", window=300.0,
+                 queue_size=1000, timeout=10.0, max_retries=5, backoff=1.0):
+        url = urlsplit(api_url)
+        if url.scheme not in ("http", "https") or not url.hostname:
+            raise ValueError(f"URL da Bot API inválida: {api_url}")
+        self._connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        self._host = url.hostname
+        self._port = url.port
+        self._path = f"{url.path.rstrip('/')}/bot{token}/sendMessage"
+        self.chat_id = chat_id
+        self.window = float(window)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._queue = queue.Queue(queue_size)
+        self._windows = {}
+        self._connection = None
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        # Incrementados pelas threads de ingestão
+        self._queued = ShardedCounter()
+        self._dropped = ShardedCounter()
+        self._sent = 0
+        self._coalesced = 0
+        self._retries = 0
+        self._failed = 0
+
+    # ------------------------------------------------------------------
+    # Ingestão (nunca bloqueia)
+
+    def notify(self, message):
+        """Enfileira a mensagem se ela for um alerta; retorna False se ignorada ou descartada"""
+        status = message_status(message)
+        if status not in _RANKS:
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((time.monotonic(), _alert(message, status)))
+        except queue.Full:
+            self._dropped.add()
+            return False
+        self._queued.add()
+        return True
+
+    def _ensure_started(self):
+        # Início preguiçoso: workers criados por fork (gunicorn) abrem a própria thread
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._connection = None
+                self._thread = threading.Thread(target=self._run, name="telegram", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def close(self, timeout=10):
+        """Envia os resumos pendentes e encerra a thread"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            self._stopping.set()
+        self._thread.join(timeout)
+
+    # ------------------------------------------------------------------
+    # Thread de envio
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self._next_timeout())
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._flush(None)
+                return
+            if item is not None:
+                self._handle(*item)
+            self._flush(time.monotonic())
+
+    def _next_timeout(self):
+        """Segundos até o fim da primeira janela com alertas acumulados (None = esperar o próximo alerta)"""
+        pending = [window.until for window in self._windows.values()]
+        if not pending:
+            return None
+        return max(min(pending) - time.monotonic(), 0.01)
+
+    def _handle(self, now, alert):
+        status = alert[0]
+        device = alert[1]
+        rank = _RANKS[status]
+        window = self._windows.get(device)
+        if window is None or now >= window.until:
+            if window is not None and window.count:
+                self._send(format_summary(device, window, self.window))
+            self._windows[device] = _Window(now + self.window, rank)
+            self._send(format_alert(alert))
+        elif rank > window.sent_rank:
+            # Piora dentro da janela: não espera o resumo
+            window.sent_rank = rank
+            self._send(format_alert(alert))
+        else:
+            window.add(alert)
+            self._coalesced += 1
+
+    def _flush(self, now):
+        """Envia os resumos das janelas encerradas (todas, com now=None) e descarta as vazias"""
+        for device, window in list(self._windows.items()):
+            if now is not None and now < window.until:
+                continue
+            if window.count:
+                self._send(format_summary(device, window, self.window))
+            if now is None or not window.count:
+                del self._windows[device]
+            else:
+                # Resumo enviado: nova janela para continuar agrupando
+                window.clear()
+                window.until = now + self.window
+
+    def _send(self, text):
+        body = json.dumps({"chat_id": self.chat_id, "text": text, "disable_web_page_preview": True}).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                if self._connection is None:
+                    self._connection = self._connection_class(self._host, self._port, timeout=self.timeout)
+                self._connection.request("POST", self._path, body, headers)
+                response = self._connection.getresponse()
+                data = response.read()
+                if response.status == 200:
+                    self._sent += 1
+                    return True
+                if response.status != 429 and response.status < 500:
+                    self._failed += 1
+                    logger.error("[TELEGRAM] Envio recusado (HTTP %s): %s", response.status, data[:200])
+                    return False
+                if response.status == 429:
+                    try:
+                        retry_after = json.loads(data)["parameters"]["retry_after"]
+                    except (ValueError, KeyError, TypeError):
+                        pass
+                logger.warning("[TELEGRAM] HTTP %s (tentativa %s)", response.status, attempt + 1)
+            except (OSError, http.client.HTTPException) as e:
+                # Conexão persistente caiu: reabrir na próxima tentativa
+                if self._connection is not None:
+                    self._connection.close()
+                self._connection = None
+                logger.warning("[TELEGRAM] Falha de conexão (tentativa %s): %s", attempt + 1, e)
+            if attempt == self.max_retries:
+                break
+            self._retries += 1
+            delay = retry_after if retry_after is not None else min(self.backoff * 2 ** attempt, _MAX_BACKOFF)
+            if self._stopping.wait(delay):
+                break
+        self._failed += 1
+        logger.error("[TELEGRAM] Alerta descartado após %s tentativas", self.max_retries + 1)
+        return False
+
+    def stats(self):
+        return {
+            "type": "telegram",
+            "window_seconds": self.window,
+            "queued": self._queued.value,
+            "pending": self._queue.qsize(),
+            "dropped": self._dropped.value,
+            "sent": self._sent,
+            "coalesced": self._coalesced,
+            "retries": self._retries,
+            "failed": self._failed
+        }
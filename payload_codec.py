@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Codificação/decodificação JSON dos payloads recebidos
+=====================================================
+
+Usa o backend mais rápido instalado (orjson, depois msgspec), com
+fallback para o módulo ``json`` da biblioteca padrão. O backend pode ser
+forçado com a variável de ambiente ``PAYLOAD_CODEC`` (orjson, msgspec ou
+json) ou com ``set_backend()``.
+
+``decode_body()`` decodifica o envelope do gateway e o frame compacto
+dentro de ``lora_data`` na mesma chamada, de modo que o ``lora_data``
+já chega como dicionário em ``expand_lora_payload``. Com msgspec, o
+frame compacto é validado contra uma Struct tipada (tipos errados
+invalidam o frame); a conversão da Struct de volta para dicionário o
+deixa um pouco mais lento que orjson, por isso orjson é o padrão.
+"""
+import json
+import logging
+import os
+from datetime import date, datetime, time
+from typing import Optional, Union
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - dependência opcional
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência opcional
+    orjson = None
+
+Number = Union[int, float, None]
+
+
+class PayloadDecodeError(ValueError):
+    """Payload JSON inválido"""
+
+
+def available_backends():
+    """Backends instalados, do mais rápido para o mais lento"""
+    backends = []
+    if orjson is not None:
+        backends.append("orjson")
+    if msgspec is not None:
+        backends.append("msgspec")
+    backends.append("json")
+    return backends
+
+
+# ----------------------------------------------------------------------
+# Biblioteca padrão
+
+def _json_loads(data):
+    try:
+        return json.loads(data)
+    except (ValueError, TypeError) as e:
+        raise PayloadDecodeError(str(e))
+
+
+def _json_default(obj):
+    # ISO 8601, como orjson e msgspec: a mesma saída em qualquer backend
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _json_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+
+# ----------------------------------------------------------------------
+# orjson
+
+def _orjson_loads(data):
+    try:
+        return orjson.loads(data)
+    except (orjson.JSONDecodeError, TypeError) as e:
+        raise PayloadDecodeError(str(e))
+
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj)
+
+
+# ----------------------------------------------------------------------
+# msgspec
+
+if msgspec is not None:
+    class _Diagnostico(msgspec.Struct):
+        oe: Optional[bool] = False
+        an: Optional[bool] = False
+
+    class _Compact(msgspec.Struct):
+        """Frame compacto LoRa (chaves desconhecidas são ignoradas)"""
+        dt: str = ""
+        hr: str = "00:00:00"
+        ti: Number = 0
+        m: Number = 0
+        cm: Number = 0
+        cmin: Number = 0
+        cmax: Number = 0
+        op: Number = 0
+        dg: _Diagnostico = msgspec.field(default_factory=_Diagnostico)
+        id: str = "UNKNOWN"
+
+    _msgspec_decoder = msgspec.json.Decoder()
+    _msgspec_compact_decoder = msgspec.json.Decoder(_Compact)
+    _msgspec_encoder = msgspec.json.Encoder()
+
+
+def _msgspec_loads(data):
+    try:
+        return _msgspec_decoder.decode(data)
+    except (msgspec.DecodeError, TypeError) as e:
+        raise PayloadDecodeError(str(e))
+
+
+def _msgspec_decode_compact(data):
+    try:
+        frame = _msgspec_compact_decoder.decode(data)
+    except (msgspec.DecodeError, TypeError) as e:
+        raise PayloadDecodeError(str(e))
+    dg = frame.dg
+    return {
+        "dt": frame.dt,
+        "hr": frame.hr,
+        "ti": frame.ti,
+        "m": frame.m,
+        "cm": frame.cm,
+        "cmin": frame.cmin,
+        "cmax": frame.cmax,
+        "op": frame.op,
+        "dg": {"oe": dg.oe, "an": dg.an},
+        "id": frame.id
+    }
+
+
+def _msgspec_dumps(obj):
+    return _msgspec_encoder.encode(obj)
+
+
+# ----------------------------------------------------------------------
+# Seleção do backend
+
+_BACKENDS = {
+    "msgspec": (_msgspec_loads, _msgspec_decode_compact, _msgspec_dumps),
+    "orjson": (_orjson_loads, _orjson_loads, _orjson_dumps),
+    "json": (_json_loads, _json_loads, _json_dumps)
+}
+
+BACKEND = None
+loads = decode_compact = dumps = None
+
+
+def set_backend(name=None):
+    """
+    Seleciona o backend (None = o mais rápido instalado)
+
+    loads(data) decodifica JSON de str/bytes, decode_compact(data) decodifica
+    o frame compacto LoRa e dumps(obj) devolve bytes UTF-8 (datetime, date
+    e time em ISO 8601, iguais em todos os backends). Erros de
+    decodificação levantam PayloadDecodeError.
+    """
+    global BACKEND, loads, decode_compact, dumps
+    installed = available_backends()
+    if not name:
+        name = installed[0]
+    elif name not in installed:
+        logger.warning(f"[CODEC] Backend {name} indisponível, usando {installed[0]}")
+        name = installed[0]
+    BACKEND = name
+    loads, decode_compact, dumps = _BACKENDS[name]
+    return name
+
+
+set_backend(os.getenv("PAYLOAD_CODEC", ""))
+
+
+def decode_body(body):
+    """
+    Decodifica o corpo de uma requisição (payload, envelope do gateway ou lista deles)
+
+    Se o payload é um envelope com ``lora_data`` em JSON, o frame compacto
+    também é decodificado e substitui a string. Um ``lora_data`` inválido
+    é mantido como está, para ser reportado pela expansão.
+    """
+    payload = loads(body)
+    if isinstance(payload, dict):
+        _decode_lora_data(payload)
+    elif isinstance(payload, list):
+        for item in payload:
+            if isinstance(item, dict):
+                _decode_lora_data(item)
+    return payload
+
+
+def _decode_lora_data(payload):
+    lora_data = payload.get("lora_data")
+    if isinstance(lora_data, str) and lora_data[:1] == "{":
+        try:
+            payload["lora_data"] = decode_compact(lora_data)
+        except PayloadDecodeError:
+            pass
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Limite de taxa por gateway (token bucket)
+=========================================
+
+Cada chave (``client_id`` do gateway ou IP de origem) tem um balde com
+até ``burst`` fichas, reabastecido a ``rate`` fichas por segundo; cada
+frame consome uma ficha. Sem fichas, a requisição é recusada e
+``acquire()`` informa em quantos segundos haverá fichas suficientes
+(cabeçalho Retry-After do 429). Um lote usa ``acquire_up_to()``: passam
+tantos frames quantas forem as fichas, e o restante é recusado.
+
+O reabastecimento é calculado na própria consulta (sem thread), e o
+número de chaves é limitado: chaves ociosas (balde cheio) são
+descartadas primeiro.
+"""
+import threading
+import time
+
+
+class RateLimiter:
+    """Token bucket por chave"""
+
+    def __init__(self, rate, burst, max_keys=10000):
+        if rate <= 0 or burst <= 0:
+            raise ValueError("rate e burst devem ser positivos")
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._limited = {}
+        self._allowed = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, key, cost=1):
+        """
+        Consome ``cost`` fichas da chave (tudo ou nada)
+
+        Retorna 0 se permitido, ou os segundos até haver fichas suficientes.
+        Um custo maior que ``burst`` nunca é permitido.
+        """
+        granted, wait = self._take(key, cost, partial=False)
+        return wait
+
+    def acquire_up_to(self, key, cost):
+        """
+        Consome até ``cost`` fichas da chave
+
+        Retorna (fichas concedidas, segundos até haver fichas para o restante,
+        até ``burst``, ou 0 se tudo foi concedido).
+        """
+        return self._take(key, cost, partial=True)
+
+    def _take(self, key, cost, partial):
+        burst = self.burst
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._prune(now)
+                bucket = self._buckets[key] = [burst, now]
+            tokens = bucket[0] + (now - bucket[1]) * self.rate
+            if tokens > burst:
+                tokens = burst
+            bucket[1] = now
+            if tokens >= cost:
+                bucket[0] = tokens - cost
+                self._allowed += 1
+                return cost, 0
+            granted = int(tokens) if partial else 0
+            bucket[0] = tokens - granted
+            self._rejected += 1
+            self._limited[key] = self._limited.get(key, 0) + 1
+            missing = min(cost - granted, burst) if partial else cost
+            return granted, (missing - bucket[0]) / self.rate
+
+    def _prune(self, now):
+        """Descarta chaves com o balde cheio (ociosas); se não bastar, todas"""
+        idle = [
+            key for key, (tokens, last) in self._buckets.items()
+            if tokens + (now - last) * self.rate >= self.burst
+        ]
+        for key in idle:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_keys:
+            self._buckets.clear()
+        if len(self._limited) >= self.max_keys:
+            self._limited.clear()
+
+    def stats(self, top=10):
+        """Configuração, contadores e as chaves mais limitadas"""
+        with self._lock:
+            limited = sorted(self._limited.items(), key=lambda item: item[1], reverse=True)[:top]
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "tracked_keys": len(self._buckets),
+                "allowed": self._allowed,
+                "rejected": self._rejected,
+                "top_limited": dict(limited)
+            }
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+            self._limited.clear()
+            self._allowed = 0
+            self._rejected = 0
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Anel de mensagens em memória compartilhada entre processos
+==========================================================
+
+Permite rodar vários workers (gunicorn/uvicorn) sobre o mesmo conjunto
+de mensagens: todos anexam e leem do mesmo segmento de
+``multiprocessing.shared_memory``, com slots de tamanho fixo.
+
+Layout do segmento:
+
+    cabeçalho   magic, versão, capacidade, tamanho do slot, seqlock,
+                próximo seq, seq mínimo (apagamento) e contadores
+    slots       capacidade x [seq (int64) | tamanho (uint32) | dados]
+
+O slot do seq ``n`` é ``n % capacidade``. Os escritores são serializados
+por ``flock`` num arquivo de trava (entre processos) e por um
+``threading.Lock`` (entre threads do mesmo processo). Os leitores nunca
+bloqueiam: o cabeçalho é lido sob um seqlock (contador ímpar durante a
+escrita; leitura repetida se o contador mudou) e cada slot é validado
+pelo seq gravado nele antes e depois da cópia dos dados. Um slot
+sobrescrito durante a leitura pertence a uma mensagem já despejada e é
+simplesmente ignorado.
+
+O segmento sobrevive à reinicialização dos workers; ``unlink()`` o remove.
+"""
+import fcntl
+import os
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+_MAGIC = b"TRAPRNG1"
+# magic, versão, capacidade, tamanho do slot, número de contadores
+_LAYOUT = struct.Struct("<8sIIII")
+# seqlock, próximo seq, seq mínimo
+_STATE = struct.Struct("<qqq")
+_STATE_AT = 32
+_COUNTER = struct.Struct("<q")
+_SLOT = struct.Struct("<qI")
+
+# Seq gravado num slot enquanto ele está sendo escrito
+_WRITING = -1
+
+# Tentativas de leitura do cabeçalho antes de esperar pela trava
+_MAX_SPINS = 1000
+
+
+def _attach(name, size):
+    """Cria ou abre o segmento sem que o resource_tracker o apague na saída do processo"""
+    try:
+        segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+        created = True
+    except FileExistsError:
+        segment = shared_memory.SharedMemory(name=name)
+        created = False
+    try:
+        resource_tracker.unregister(segment._name, "shared_memory")
+    except Exception:
+        pass
+    return segment, created
+
+
+class SharedRing:
+    """
+    Buffer circular de registros binários (seq, bytes) compartilhado entre processos
+
+    ``counters`` nomeia contadores inteiros mantidos no cabeçalho (ex.:
+    estatísticas globais). ``next_seq`` só é usado quando o segmento é
+    criado; ``version`` identifica o formato dos dados e um segmento de
+    outra versão ou geometria é recriado.
+    """
+
+    def __init__(self, name, capacity, slot_bytes=1024, version=0, counters=(), next_seq=1):
+        if capacity <= 0:
+            raise ValueError("capacity deve ser positivo")
+        if slot_bytes <= _SLOT.size:
+            raise ValueError(f"slot_bytes deve ser maior que {_SLOT.size}")
+        self.name = name
+        self.capacity = capacity
+        self.slot_bytes = slot_bytes
+        self.version = version
+        self.counter_names = tuple(counters)
+        self._counter_at = {
+            counter: _STATE_AT + _STATE.size + index * _COUNTER.size
+            for index, counter in enumerate(self.counter_names)
+        }
+        header = _STATE_AT + _STATE.size + len(self.counter_names) * _COUNTER.size
+        self._slots_at = (header + 63) // 64 * 64
+        self.max_payload = slot_bytes - _SLOT.size
+
+        self._thread_lock = threading.Lock()
+        self._lock_path = os.path.join(
+            "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), f"{name}.lock"
+        )
+        self._lock_fd = None
+        self._lock_pid = None
+
+        with self._locked():
+            self._open(next_seq)
+
+    # ------------------------------------------------------------------
+    # Abertura e trava
+
+    def _open(self, next_seq):
+        size = self._slots_at + self.capacity * self.slot_bytes
+        segment, created = _attach(self.name, size)
+        if not created and not self._compatible(segment):
+            # Geometria ou formato diferente (ex.: MAX_MESSAGES alterado): recriar
+            segment.close()
+            segment.unlink()
+            segment, created = _attach(self.name, size)
+        self._segment = segment
+        self._buffer = segment.buf
+        self.created = created
+        if created:
+            self._buffer[:self._slots_at] = bytes(self._slots_at)
+            for slot in range(self.capacity):
+                _SLOT.pack_into(self._buffer, self._slot_offset(slot), 0, 0)
+            _STATE.pack_into(self._buffer, _STATE_AT, 0, next_seq, next_seq)
+            # Magic por último: segmento só é válido depois de inicializado
+            _LAYOUT.pack_into(
+                self._buffer, 0, _MAGIC, self.version, self.capacity, self.slot_bytes, len(self.counter_names)
+            )
+
+    def _compatible(self, segment):
+        if segment.size < self._slots_at + self.capacity * self.slot_bytes:
+            return False
+        magic, version, capacity, slot_bytes, counters = _LAYOUT.unpack_from(segment.buf)
+        return (magic, version, capacity, slot_bytes, counters) == (
+            _MAGIC, self.version, self.capacity, self.slot_bytes, len(self.counter_names)
+        )
+
+    @contextmanager
+    def _locked(self):
+        """Trava exclusiva entre threads e processos (reaberta após fork)"""
+        with self._thread_lock:
+            if self._lock_pid != os.getpid():
+                self._lock_fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+                self._lock_pid = os.getpid()
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _slot_offset(self, slot):
+        return self._slots_at + slot * self.slot_bytes
+
+    # ------------------------------------------------------------------
+    # Cabeçalho (seqlock)
+
+    def _state(self):
+        """(próximo seq, seq mínimo) lidos de forma consistente"""
+        buffer = self._buffer
+        for _ in range(_MAX_SPINS):
+            version, next_seq, floor_seq = _STATE.unpack_from(buffer, _STATE_AT)
+            if not version & 1 and _STATE.unpack_from(buffer, _STATE_AT)[0] == version:
+                return next_seq, floor_seq
+        # Escritor ainda ativo ou encerrado no meio da atualização: esperar a trava
+        with self._locked():
+            return self._state_locked()
+
+    def _state_locked(self):
+        """Cabeçalho lido com a trava adquirida; corrige um seqlock deixado ímpar por um escritor encerrado"""
+        version, next_seq, floor_seq = _STATE.unpack_from(self._buffer, _STATE_AT)
+        if version & 1:
+            struct.pack_into("<q", self._buffer, _STATE_AT, version + 1)
+        return next_seq, floor_seq
+
+    def _write_state(self, next_seq, floor_seq):
+        version = _STATE.unpack_from(self._buffer, _STATE_AT)[0]
+        struct.pack_into("<q", self._buffer, _STATE_AT, version + 1)
+        struct.pack_into("<qq", self._buffer, _STATE_AT + 8, next_seq, floor_seq)
+        struct.pack_into("<q", self._buffer, _STATE_AT, version + 2)
+
+    @property
+    def next_seq(self):
+        return self._state()[0]
+
+    @property
+    def floor_seq(self):
+        """Seq a partir do qual os registros valem (avança a cada clear())"""
+        return self._state()[1]
+
+    @property
+    def first_seq(self):
+        """Menor seq ainda disponível (None se vazio)"""
+        next_seq, floor_seq = self._state()
+        first = max(floor_seq, next_seq - self.capacity)
+        return first if first < next_seq else None
+
+    def __len__(self):
+        next_seq, floor_seq = self._state()
+        return next_seq - max(floor_seq, next_seq - self.capacity)
+
+    # ------------------------------------------------------------------
+    # Escrita
+
+    def append(self, payloads):
+        """
+        Anexa os registros, atribuindo seqs consecutivos
+
+        Retorna o seq do primeiro registro. Levanta ValueError se algum
+        registro não couber no slot (``max_payload`` bytes).
+        """
+        for payload in payloads:
+            if len(payload) > self.max_payload:
+                raise ValueError(f"Registro de {len(payload)} bytes excede o slot ({self.max_payload} bytes)")
+        buffer = self._buffer
+        with self._locked():
+            next_seq, floor_seq = self._state_locked()
+            first_seq = next_seq
+            for payload in payloads:
+                offset = self._slot_offset(next_seq % self.capacity)
+                _SLOT.pack_into(buffer, offset, _WRITING, len(payload))
+                start = offset + _SLOT.size
+                buffer[start:start + len(payload)] = payload
+                struct.pack_into("<q", buffer, offset, next_seq)
+                next_seq += 1
+            self._write_state(next_seq, floor_seq)
+        return first_seq
+
+    def clear(self):
+        """Descarta todos os registros (a sequência de seqs continua)"""
+        with self._locked():
+            next_seq, _ = self._state_locked()
+            self._write_state(next_seq, next_seq)
+
+    # ------------------------------------------------------------------
+    # Leitura
+
+    def read(self, since=None, limit=None):
+        """
+        Registros (seq, bytes) com seq > since, em ordem crescente
+
+        Registros sobrescritos durante a leitura (despejados) são omitidos,
+        então o resultado é sempre contíguo.
+        """
+        next_seq, floor_seq = self._state()
+        low = max(floor_seq, next_seq - self.capacity)
+        if since is not None:
+            low = max(low, since + 1)
+        high = next_seq if limit is None else min(next_seq, low + limit)
+
+        buffer = self._buffer
+        records = []
+        for seq in range(low, high):
+            offset = self._slot_offset(seq % self.capacity)
+            stamp, length = _SLOT.unpack_from(buffer, offset)
+            if stamp != seq:
+                records.clear()
+                continue
+            start = offset + _SLOT.size
+            payload = bytes(buffer[start:start + length])
+            if struct.unpack_from("<q", buffer, offset)[0] != seq:
+                records.clear()
+                continue
+            records.append((seq, payload))
+        return records
+
+    # ------------------------------------------------------------------
+    # Contadores
+
+    def add(self, counter, amount=1):
+        offset = self._counter_at[counter]
+        with self._locked():
+            value = _COUNTER.unpack_from(self._buffer, offset)[0]
+            _COUNTER.pack_into(self._buffer, offset, value + amount)
+
+    def counters(self):
+        """Valores atuais dos contadores (leituras de 8 bytes alinhados, sem trava)"""
+        return {
+            counter: _COUNTER.unpack_from(self._buffer, offset)[0]
+            for counter, offset in self._counter_at.items()
+        }
+
+    def reset_counters(self):
+        with self._locked():
+            for offset in self._counter_at.values():
+                _COUNTER.pack_into(self._buffer, offset, 0)
+
+    # ------------------------------------------------------------------
+
+    def close(self):
+        self._buffer = None
+        self._segment.close()
+        if self._lock_fd is not None and self._lock_pid == os.getpid():
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def unlink(self):
+        """Remove o segmento do sistema (os processos que o têm aberto continuam usando)"""
+        self._segment.unlink()
+        try:
+            os.remove(self._lock_path)
+        except OSError:
+            pass
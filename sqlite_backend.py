@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Armazenamento persistente de detecções em SQLite
+================================================
+
+Guarda todo o histórico, sem o limite de MAX_MESSAGES do armazenamento
+em memória, que passa a funcionar como cache das mensagens recentes.
+
+As escritas são enfileiradas pelo ingest e gravadas em lote por uma
+thread dedicada (uma transação por lote, ``executemany`` com instrução
+preparada). O banco usa journal WAL, então as leituras de outras
+threads não bloqueiam as escritas. Dispositivo, gateway e horário da
+detecção são indexados para consultas por filtro.
+"""
+import json
+import logging
+import queue
+import sqlite3
+import threading
+
+from storage import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY,
+    ts INTEGER,
+    lora_id TEXT,
+    gateway_id TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_lora_ts ON messages (lora_id, ts);
+CREATE INDEX IF NOT EXISTS idx_messages_gateway_ts ON messages (gateway_id, ts);
+CREATE INDEX IF NOT EXISTS idx_messages_ts ON messages (ts);
+"""
+
+# Filtro status (mesma regra de storage.message_status), avaliado sobre o JSON da mensagem:
+# diagnóstico do servidor, se houver, senão o do dispositivo
+_ABNORMAL = (
+    "COALESCE(json_extract(data, '$.diagnostico_servidor.anormal'), "
+    "json_extract(data, '$.diagnostico.anormal'), 0)"
+)
+_EXCESS = (
+    "COALESCE(json_extract(data, '$.diagnostico_servidor.ocupacao_excessiva'), "
+    "json_extract(data, '$.diagnostico.ocupacao_excessiva'), 0)"
+)
+_STATUS_CONDITIONS = {
+    "anormal": f"{_ABNORMAL} != 0",
+    "alerta": f"{_ABNORMAL} = 0 AND {_EXCESS} != 0",
+    "normal": f"{_ABNORMAL} = 0 AND {_EXCESS} = 0"
+}
+
+# Reavaliação do diagnóstico do servidor (mesma regra de diagnosis.diagnose: não numérico conta como 0)
+_NUMBER = (
+    "(CASE WHEN json_type(data, '$.deteccoes.{0}') IN ('integer', 'real') "
+    "THEN json_extract(data, '$.deteccoes.{0}') ELSE 0 END)"
+)
+_REDIAGNOSE = f"""
+UPDATE messages SET data = json_set(data, '$.diagnostico_servidor', json_object(
+    'ocupacao_excessiva', json(CASE WHEN {_NUMBER.format('ocupacao_pct')} > :ocupacao_excessiva THEN 'true' ELSE 'false' END),
+    'anormal', json(CASE WHEN {_NUMBER.format('ocupacao_pct')} > :anormal_ocupacao
+                          OR {_NUMBER.format('total')} > :anormal_moscas THEN 'true' ELSE 'false' END)
+))
+"""
+
+_INSERT = "INSERT OR REPLACE INTO messages (seq, ts, lora_id, gateway_id, data) VALUES (?, ?, ?, ?, ?)"
+
+# Marcadores na fila: libera quem espera em flush(); executa uma tarefa na thread de escrita
+_FLUSH = object()
+_TASK = object()
+
+
+class SQLiteBackend:
+    """Histórico completo de mensagens em um banco SQLite"""
+
+    def __init__(self, path, batch_size=500, flush_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._written = 0
+        self._errors = 0
+
+        connection = self._connect()
+        connection.executescript(_SCHEMA)
+        connection.commit()
+
+        self._writer = threading.Thread(target=self._write_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _reader(self):
+        """Conexão de leitura da thread atual"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    # ------------------------------------------------------------------
+    # Escrita
+
+    def write(self, messages):
+        """Enfileira mensagens (já com seq) para gravação em lote"""
+        if messages:
+            self._queue.put([
+                (
+                    message["seq"],
+                    parse_timestamp(message.get("timestamp")),
+                    message.get("lora_id"),
+                    message.get("gateway_id"),
+                    json.dumps(
+                        {key: value for key, value in message.items() if key != "seq"},
+                        ensure_ascii=False, separators=(",", ":")
+                    )
+                )
+                for message in messages
+            ])
+
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            batch = []
+            waiters = []
+            task = None
+            item = self._queue.get()
+            while True:
+                if item is None:
+                    self._insert(connection, batch)
+                    for waiter in waiters:
+                        waiter.set()
+                    connection.close()
+                    return
+                if isinstance(item, tuple) and item[0] is _FLUSH:
+                    waiters.append(item[1])
+                elif isinstance(item, tuple) and item[0] is _TASK:
+                    # Na ordem da fila: depois das mensagens enfileiradas antes dela
+                    task = item
+                    break
+                else:
+                    batch.extend(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=self.flush_interval if not waiters else 0)
+                except queue.Empty:
+                    break
+            self._insert(connection, batch)
+            for waiter in waiters:
+                waiter.set()
+            if task is not None:
+                self._run_task(connection, task)
+
+    @staticmethod
+    def _run_task(connection, task):
+        _, function, done, outcome = task
+        try:
+            outcome.append(function(connection))
+        except sqlite3.Error as e:
+            outcome.append(e)
+        finally:
+            done.set()
+
+    def _insert(self, connection, rows):
+        if not rows:
+            return
+        try:
+            with connection:
+                connection.executemany(_INSERT, rows)
+            self._written += len(rows)
+        except sqlite3.Error as e:
+            self._errors += len(rows)
+            logger.error(f"[SQLITE] Erro ao gravar {len(rows)} mensagens: {e}")
+
+    def flush(self, timeout=None):
+        """Aguarda a gravação de tudo que foi enfileirado até agora"""
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        return done.wait(timeout)
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join(timeout=10)
+
+    def clear(self):
+        """Apaga todo o histórico"""
+        self.flush()
+        connection = self._reader()
+        with connection:
+            connection.execute("DELETE FROM messages")
+
+    def rediagnose(self, thresholds, chunk=10000):
+        """
+        Regrava o ``diagnostico_servidor`` de todo o histórico com novos limiares (diagnosis.Thresholds)
+
+        Roda na thread de escrita, depois das mensagens já enfileiradas, em
+        transações de ``chunk`` seqs: ``write()`` continua só enfileirando
+        enquanto o histórico é regravado. Retorna o número de linhas.
+        """
+        params = thresholds._asdict()
+
+        def update(connection):
+            low, high = connection.execute("SELECT MIN(seq), MAX(seq) FROM messages").fetchone()
+            count = 0
+            for start in range(low - 1, high, chunk) if low is not None else ():
+                with connection:
+                    count += connection.execute(
+                        _REDIAGNOSE + "WHERE seq > :start AND seq <= :end", {**params, "start": start, "end": start + chunk}
+                    ).rowcount
+            return count
+
+        return self._run(update)
+
+    def _run(self, function):
+        """Executa ``function(conexão)`` na thread de escrita, na ordem da fila, e retorna o resultado"""
+        done = threading.Event()
+        outcome = []
+        self._queue.put((_TASK, function, done, outcome))
+        done.wait()
+        if isinstance(outcome[0], sqlite3.Error):
+            raise outcome[0]
+        return outcome[0]
+
+    # ------------------------------------------------------------------
+    # Leitura
+
+    def query(self, since=None, before=None, limit=None, device=None, gateway=None, start=None, end=None, status=None):
+        """
+        Mensagens por filtros, em ordem de seq
+
+        ``start``/``end`` são segundos desde a época (inclusive) sobre o
+        horário da detecção e ``status`` é normal, alerta ou anormal (não
+        indexado: conferido nas linhas selecionadas pelos demais filtros).
+        Com limit e sem since, retorna as mais recentes que atendem aos
+        filtros.
+        """
+        conditions = []
+        params = []
+        for condition, value in (
+            ("seq > ?", since), ("seq < ?", before),
+            ("lora_id = ?", device), ("gateway_id = ?", gateway),
+            ("ts >= ?", start), ("ts <= ?", end)
+        ):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        if status is not None:
+            conditions.append(_STATUS_CONDITIONS[status])
+
+        newest_first = limit is not None and since is None
+        sql = "SELECT seq, data FROM messages"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY seq DESC" if newest_first else " ORDER BY seq"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        rows = self._reader().execute(sql, params).fetchall()
+        if newest_first:
+            rows.reverse()
+        messages = []
+        for seq, data in rows:
+            message = json.loads(data)
+            message["seq"] = seq
+            messages.append(message)
+        return messages
+
+    def last(self, count):
+        """As últimas ``count`` mensagens gravadas, em ordem de seq"""
+        return self.query(limit=count)
+
+    def max_seq(self):
+        row = self._reader().execute("SELECT MAX(seq) FROM messages").fetchone()
+        return row[0]
+
+    def stats(self):
+        return {
+            "type": "sqlite",
+            "path": self.path,
+            "written": self._written,
+            "errors": self._errors,
+            "pending": self._queue.qsize()
+        }
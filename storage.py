@@ -0,0 +1,1079 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Armazenamento compacto de detecções em memória
+==============================================
+
+As mensagens expandidas (dicts aninhados com ``deteccoes`` e
+``diagnostico``) ocupam alguns KB cada. O ``MessageStore`` guarda os
+campos do formato LoRa em colunas ``array`` de tamanho fixo, com os
+identificadores (dispositivo, gateway, IP, formato) internados, e
+reconstrói o dict expandido apenas na leitura.
+
+Campos que não cabem no esquema (valores fora do padrão do formato
+compacto, chaves extras do formato legado) são guardados à parte por
+mensagem, então a reconstrução devolve exatamente o que foi armazenado.
+
+O horário da detecção (segundos desde a época, coluna ``timestamp``)
+também é mantido num índice ordenado, atualizado na inserção, e cada
+dispositivo, gateway e status do diagnóstico (normal, alerta, anormal)
+tem sua lista de seqs: consultas filtradas (``select()``) fazem busca
+binária nesses índices em vez de decodificar todas as mensagens, e
+frames atrasados entram na posição certa do horário.
+
+O diagnóstico do servidor (``diagnostico_servidor``, ver diagnosis.py)
+é derivado da ocupação e do total de moscas e ocupa três bits reservados
+da coluna ``bits``, fora do esquema: ``rediagnose()`` o recalcula para
+todas as mensagens de uma vez, direto nas colunas.
+"""
+import json
+import struct
+import threading
+import zlib
+from array import array
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+import diagnosis
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Números decimais (confiança, ocupação, RSSI, SNR) são guardados como inteiros escalados
+_SCALE = 10000
+
+# Tipos de campo
+_STRING = 0     # string internada (coluna 'I')
+_INT = 1        # inteiro (coluna 'i')
+_NUMBER = 2     # int ou float com até 4 casas decimais (coluna 'i', escalado)
+_BOOL = 3       # bool (apenas bits na máscara)
+_CONST = 4      # valor fixo do formato compacto (apenas presença)
+_TIMESTAMP = 5  # "YYYY-MM-DD HH:MM:SS" como segundos desde a época (coluna 'q')
+_ISOTIME = 6    # datetime.isoformat() como microssegundos desde a época (coluna 'q')
+
+_GROUPS = ("deteccoes", "diagnostico")
+
+# (grupo, chave, tipo, typecode da coluna, valor constante)
+_SCHEMA = (
+    (None, "timestamp", _TIMESTAMP, "q", None),
+    (None, "received_at", _ISOTIME, "q", None),
+    (None, "lora_id", _STRING, "I", None),
+    (None, "gateway_id", _STRING, "I", None),
+    (None, "source_ip", _STRING, "I", None),
+    (None, "original_format", _STRING, "I", None),
+    (None, "message_id", _INT, "i", None),
+    (None, "rssi", _NUMBER, "i", None),
+    (None, "snr", _NUMBER, "i", None),
+    (None, "tempo_inferencia_ms", _NUMBER, "i", None),
+    (None, "processed", _CONST, None, True),
+    ("deteccoes", "total", _INT, "i", None),
+    ("deteccoes", "limiar_confianca", _CONST, None, 0.5),
+    ("deteccoes", "confianca_media", _NUMBER, "i", None),
+    ("deteccoes", "confianca_min", _NUMBER, "i", None),
+    ("deteccoes", "confianca_max", _NUMBER, "i", None),
+    ("deteccoes", "ocupacao_pct", _NUMBER, "i", None),
+    ("deteccoes", "area_total_px", _CONST, None, 0),
+    ("deteccoes", "itens", _CONST, None, []),
+    ("diagnostico", "ocupacao_excessiva", _BOOL, None, None),
+    ("diagnostico", "anormal", _BOOL, None, None),
+)
+
+_LIMITS = {
+    "q": (-2 ** 63, 2 ** 63 - 1),
+    "i": (-2 ** 31, 2 ** 31 - 1),
+    "I": (0, 2 ** 32 - 1),
+    None: (0, 0),
+}
+
+# Esquema pré-processado: (índice, grupo, chave, tipo, bit, mínimo, máximo, constante)
+_FIELDS = tuple(
+    (index, group, key, kind, 1 << index) + _LIMITS[typecode] + (constant,)
+    for index, (group, key, kind, typecode, constant) in enumerate(_SCHEMA)
+)
+_TOP_KEYS = frozenset(["seq"] + [key for group, key, _, _, _ in _SCHEMA if group is None])
+_GROUP_KEYS = {
+    group: frozenset(key for field_group, key, _, _, _ in _SCHEMA if field_group == group)
+    for group in _GROUPS
+}
+
+# Bits da máscara de presença (coluna 'I'): um por campo do esquema, depois um por grupo
+_GROUP_BITS = {group: 1 << (len(_SCHEMA) + index) for index, group in enumerate(_GROUPS)}
+
+# Bits reservados da coluna bits: diagnóstico do servidor (calculado, ocupação excessiva, anormal)
+_DIAGNOSED_BIT = 1 << 29
+_SERVER_EXCESS_BIT = 1 << 30
+_SERVER_ABNORMAL_BIT = 1 << 31
+_SERVER_BITS = _DIAGNOSED_BIT | _SERVER_EXCESS_BIT | _SERVER_ABNORMAL_BIT
+assert len(_SCHEMA) < 29
+
+_MISSING = object()
+
+# Strings maiores vão para os extras (o formato empacotado usa tamanho em 16 bits)
+_MAX_STRING_LENGTH = 16000
+
+# Formato empacotado de uma linha (usado pelo WAL): presença, bits, colunas numéricas e
+# tamanhos das strings (16 bits), seguidos das strings e, se houver, dos extras em JSON
+_NUMERIC_COLUMNS = tuple(
+    index for index, (_, _, kind, typecode, _) in enumerate(_SCHEMA) if typecode and kind != _STRING
+)
+_STRING_COLUMNS = tuple(index for index, (_, _, kind, _, _) in enumerate(_SCHEMA) if kind == _STRING)
+_ROW = struct.Struct(
+    "<II" + "".join(_SCHEMA[index][3] for index in _NUMERIC_COLUMNS) + "H" * len(_STRING_COLUMNS)
+)
+_STRINGS_AT = 2 + len(_NUMERIC_COLUMNS)
+
+# Muda sempre que o esquema muda; linhas empacotadas com outra versão não são legíveis
+PACK_VERSION = zlib.crc32(repr(_SCHEMA).encode("utf-8"))
+
+# Datas ("YYYY-MM-DD") já convertidas, nos dois sentidos; limitadas por _DATE_CACHE_SIZE
+_DATE_CACHE_SIZE = 4096
+
+# Chave do índice de horário (inteiro de 64 bits): segundos nos bits altos e os bits
+# baixos do seq, suficientes para distinguir os seqs armazenados e os obsoletos
+_MIN_SEQ_BITS = 24
+_TIMESTAMP_COLUMN = next(index for index, field in enumerate(_SCHEMA) if field[2] == _TIMESTAMP)
+_TIMESTAMP_BIT = 1 << _TIMESTAMP_COLUMN
+
+# Despejos tolerados antes de reconstruir os índices (também limitados pela capacidade)
+_MIN_STALE_KEYS = 1024
+
+# Status do diagnóstico, do menos ao mais grave
+STATUSES = ("normal", "alerta", "anormal")
+
+# Colunas com lista de seqs por valor (string internada)
+_POSTING_COLUMNS = tuple(
+    (name, next(index for index, field in enumerate(_SCHEMA) if field[:2] == (None, key)))
+    for name, key in (("device", "lora_id"), ("gateway", "gateway_id"))
+)
+_OCCUPANCY_COLUMN, _FLIES_COLUMN = (
+    next(index for index, field in enumerate(_SCHEMA) if field[:2] == ("deteccoes", key))
+    for key in ("ocupacao_pct", "total")
+)
+_EXCESS_BIT, _ABNORMAL_BIT = (
+    1 << next(index for index, field in enumerate(_SCHEMA) if field[:2] == ("diagnostico", key))
+    for key in ("ocupacao_excessiva", "anormal")
+)
+
+
+def diagnostic_status(diagnostico):
+    """normal, alerta (ocupação excessiva) ou anormal, a partir do dict ``diagnostico``"""
+    if not isinstance(diagnostico, dict):
+        return "normal"
+    if diagnostico.get("anormal"):
+        return "anormal"
+    return "alerta" if diagnostico.get("ocupacao_excessiva") else "normal"
+
+
+def message_status(message):
+    """Status da mensagem: diagnóstico do servidor, se houver, senão o do dispositivo"""
+    server = message.get("diagnostico_servidor")
+    return diagnostic_status(server if isinstance(server, dict) else message.get("diagnostico"))
+
+
+def _server_diagnosis(value):
+    """Bits do ``diagnostico_servidor`` da mensagem, ou None se não couber nos bits reservados"""
+    if type(value) is not dict or len(value) != 2:
+        return None
+    excessive = value.get("ocupacao_excessiva")
+    abnormal = value.get("anormal")
+    if type(excessive) is not bool or type(abnormal) is not bool:
+        return None
+    return _DIAGNOSED_BIT | (_SERVER_EXCESS_BIT if excessive else 0) | (_SERVER_ABNORMAL_BIT if abnormal else 0)
+
+
+def _row_status(present, bits, residual):
+    """Mesmo que ``message_status`` para uma linha codificada"""
+    if bits & _DIAGNOSED_BIT:
+        return "anormal" if bits & _SERVER_ABNORMAL_BIT else "alerta" if bits & _SERVER_EXCESS_BIT else "normal"
+    nested = residual[1].get("diagnostico", {}) if residual is not None else {}
+    abnormal = bits & _ABNORMAL_BIT if present & _ABNORMAL_BIT else nested.get("anormal")
+    if abnormal:
+        return "anormal"
+    excess = bits & _EXCESS_BIT if present & _EXCESS_BIT else nested.get("ocupacao_excessiva")
+    return "alerta" if excess else "normal"
+
+
+def _row_flags(present, bits, residual):
+    """(ocupacao_excessiva, anormal) de uma linha codificada, pela mesma regra de ``_row_status``"""
+    if bits & _DIAGNOSED_BIT:
+        return bool(bits & _SERVER_EXCESS_BIT), bool(bits & _SERVER_ABNORMAL_BIT)
+    nested = residual[1].get("diagnostico", {}) if residual is not None else {}
+    excess = bits & _EXCESS_BIT if present & _EXCESS_BIT else nested.get("ocupacao_excessiva")
+    abnormal = bits & _ABNORMAL_BIT if present & _ABNORMAL_BIT else nested.get("anormal")
+    return bool(excess), bool(abnormal)
+
+
+def _posting_keys(values, present, bits, residual):
+    """Chaves de ``_Columns.postings`` de uma linha codificada"""
+    keys = [("status", _row_status(present, bits, residual))]
+    for name, column in _POSTING_COLUMNS:
+        if present & (1 << column):
+            keys.append((name, values[column]))
+    return keys
+_days_by_date = {}
+_date_by_days = {}
+
+
+def format_timestamp(seconds):
+    """"YYYY-MM-DD HH:MM:SS" a partir de segundos desde a época"""
+    days, seconds = divmod(seconds, 86400)
+    date = _date_by_days.get(days)
+    if date is None:
+        if len(_date_by_days) >= _DATE_CACHE_SIZE:
+            _date_by_days.clear()
+        date = _date_by_days[days] = (_EPOCH + timedelta(days=days)).strftime("%Y-%m-%d")
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f"{date} {hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def parse_timestamp(value):
+    """Segundos desde a época de "YYYY-MM-DD HH:MM:SS" ou None se não for exato"""
+    if type(value) is not str or len(value) != 19 or value[10] != " ":
+        return None
+    date = value[:10]
+    days = _days_by_date.get(date)
+    if days is None:
+        if date[4] != "-" or date[7] != "-" or not (date[:4] + date[5:7] + date[8:]).isascii():
+            return None
+        try:
+            moment = datetime(int(date[:4]), int(date[5:7]), int(date[8:]))
+        except ValueError:
+            return None
+        if moment.strftime("%Y-%m-%d") != date:
+            return None
+        if len(_days_by_date) >= _DATE_CACHE_SIZE:
+            _days_by_date.clear()
+        days = _days_by_date[date] = (moment - _EPOCH).days
+
+    clock = value[11:13] + value[14:16] + value[17:19]
+    if value[13] != ":" or value[16] != ":" or not (clock.isascii() and clock.isdigit()):
+        return None
+    hours, minutes, seconds = int(clock[0:2]), int(clock[2:4]), int(clock[4:6])
+    if hours > 23 or minutes > 59 or seconds > 59:
+        return None
+    return days * 86400 + hours * 3600 + minutes * 60 + seconds
+
+
+def _parse_isotime(value):
+    """Microssegundos desde a época de um datetime.isoformat() ou None se não for exato"""
+    if type(value) is not str:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if moment.tzinfo is not None or moment.isoformat() != value:
+        return None
+    return (moment - _EPOCH) // timedelta(microseconds=1)
+
+
+class _StringTable:
+    """Tabela de internação de strings (índice 0 = ausente)"""
+
+    def __init__(self):
+        self._strings = [None]
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def intern(self, value):
+        index = self._index.get(value)
+        if index is None:
+            with self._lock:
+                index = self._index.get(value)
+                if index is None:
+                    # Publica a string antes do índice: quem vê o índice sempre a encontra
+                    self._strings.append(value)
+                    index = self._index[value] = len(self._strings) - 1
+        return index
+
+    def lookup(self, index):
+        return self._strings[index]
+
+    def find(self, value):
+        """Índice da string já internada, ou None"""
+        return self._index.get(value)
+
+    def __len__(self):
+        return len(self._strings) - 1
+
+    def nbytes(self):
+        return sum(len(value) for value in self._strings[1:]) + 16 * len(self._strings)
+
+
+class _Columns:
+    """
+    Colunas do buffer circular e sua cabeça ``(início, quantidade, próximo seq)``
+
+    ``clear()`` substitui o objeto inteiro, então um leitor que pegou a
+    referência continua vendo um conjunto consistente de colunas.
+
+    ``time_index`` é o array ordenado de chaves ``segundos << bits | seq``
+    (bits baixos do seq) e ``postings`` associa ``("device", string)``,
+    ``("gateway", string)`` e ``("status", nome)`` ao array crescente dos
+    seqs. Mensagens despejadas continuam nos índices até a próxima
+    reconstrução e são ignoradas na leitura; ``stale_keys`` conta
+    despejos e alterações de campos indexados desde a última reconstrução.
+    """
+
+    __slots__ = ("seq", "present", "bits", "values", "extras", "head", "time_index", "postings", "stale_keys")
+
+    def __init__(self, next_seq):
+        self.seq = array("q")
+        self.present = array("I")
+        self.bits = array("I")
+        self.values = [array(typecode) if typecode else None for _, _, _, typecode, _ in _SCHEMA]
+        self.extras = {}
+        self.head = (0, 0, next_seq)
+        self.time_index = array("q")
+        self.postings = {}
+        self.stale_keys = 0
+
+
+class MessageStore:
+    """
+    Buffer circular de mensagens em colunas compactas
+
+    Mantém no máximo ``maxlen`` mensagens; ao ultrapassar, as mais antigas
+    são descartadas como em ``deque(maxlen=...)``. Cada mensagem recebe um
+    ``seq`` monotônico na inserção, e como os seqs armazenados são
+    contíguos, a posição de qualquer seq é calculada por subtração.
+
+    Seguro entre threads: escritas são serializadas por uma trava e as
+    leituras nunca a adquirem. O escritor invalida o seq gravado na
+    posição antes de sobrescrevê-la e só publica a nova cabeça (uma tupla,
+    atribuída de uma vez) depois de gravar a linha; o leitor confere o seq
+    da posição antes e depois de decodificá-la e descarta linhas
+    sobrescritas durante a leitura (mensagens despejadas).
+    """
+
+    def __init__(self, maxlen):
+        if maxlen <= 0:
+            raise ValueError("maxlen deve ser positivo")
+        self.maxlen = maxlen
+        # Bits do seq nas chaves do índice de horário: cobrem o dobro dos seqs
+        # armazenados mais os despejos tolerados até a reconstrução
+        self._seq_bits = max(_MIN_SEQ_BITS, (2 * maxlen + _MIN_STALE_KEYS).bit_length() + 1)
+        if self._seq_bits > 31:
+            raise ValueError("maxlen muito grande")
+        self._strings = _StringTable()
+        self._lock = threading.RLock()
+        self._data = _Columns(1)
+
+    # ------------------------------------------------------------------
+    # Codificação
+
+    def _encode(self, message):
+        """Converte a mensagem em (valores das colunas, presença, bits, extras)"""
+        values = [0] * len(_FIELDS)
+        present = 0
+        bits = 0
+        extras = {}
+        nested_extras = {}
+        containers = {None: message}
+        for group in _GROUPS:
+            container = message.get(group)
+            if type(container) is dict:
+                containers[group] = container
+                present |= _GROUP_BITS[group]
+
+        intern = self._strings.intern
+        for index, group, key, kind, bit, low, high, constant in _FIELDS:
+            container = containers.get(group)
+            if container is None:
+                continue
+            value = container.get(key, _MISSING)
+            if value is _MISSING:
+                continue
+            value_type = type(value)
+            encoded = None
+
+            if kind == _NUMBER:
+                if value_type is float:
+                    scaled = round(value * _SCALE)
+                    if low <= scaled <= high and scaled / _SCALE == value:
+                        encoded = scaled
+                elif value_type is int:
+                    scaled = value * _SCALE
+                    if low <= scaled <= high:
+                        encoded = scaled
+                        bits |= bit
+            elif kind == _STRING:
+                if value_type is str and len(value) <= _MAX_STRING_LENGTH:
+                    encoded = intern(value)
+            elif kind == _INT:
+                if value_type is int and low <= value <= high:
+                    encoded = value
+            elif kind == _BOOL:
+                if value_type is bool:
+                    encoded = 0
+                    if value:
+                        bits |= bit
+            elif kind == _CONST:
+                if value_type is type(constant) and value == constant:
+                    encoded = 0
+            elif kind == _TIMESTAMP:
+                encoded = parse_timestamp(value)
+            else:
+                encoded = _parse_isotime(value)
+
+            if encoded is None:
+                if group is None:
+                    extras[key] = value
+                else:
+                    nested_extras.setdefault(group, {})[key] = value
+            else:
+                values[index] = encoded
+                present |= bit
+
+        server = _server_diagnosis(message.get("diagnostico_servidor", _MISSING))
+        if server is not None:
+            bits |= server
+
+        # Chaves fora do esquema
+        for key in message:
+            if key not in _TOP_KEYS and key not in containers:
+                if key == "diagnostico_servidor" and server is not None:
+                    continue
+                extras[key] = message[key]
+        for group in _GROUPS:
+            container = containers.get(group)
+            if container is not None:
+                group_keys = _GROUP_KEYS[group]
+                for key in container:
+                    if key not in group_keys:
+                        nested_extras.setdefault(group, {})[key] = container[key]
+
+        residual = (extras, nested_extras) if extras or nested_extras else None
+        return values, present, bits, residual
+
+    def _decode(self, data, position, seq):
+        """Reconstrói o dict expandido da mensagem na posição, ou None se ela foi sobrescrita"""
+        if data.seq[position] != seq:
+            return None
+        present = data.present[position]
+        bits = data.bits[position]
+        columns = data.values
+        message = {}
+        containers = {None: message}
+        for group in _GROUPS:
+            if present & _GROUP_BITS[group]:
+                containers[group] = message[group] = {}
+
+        lookup = self._strings.lookup
+        for index, group, key, kind, bit, _, _, constant in _FIELDS:
+            if not present & bit:
+                continue
+            if kind == _NUMBER:
+                scaled = columns[index][position]
+                value = scaled // _SCALE if bits & bit else scaled / _SCALE
+            elif kind == _STRING:
+                value = lookup(columns[index][position])
+            elif kind == _INT:
+                value = columns[index][position]
+            elif kind == _BOOL:
+                value = bool(bits & bit)
+            elif kind == _CONST:
+                value = list(constant) if type(constant) is list else constant
+            elif kind == _TIMESTAMP:
+                value = format_timestamp(columns[index][position])
+            else:
+                value = (_EPOCH + timedelta(microseconds=columns[index][position])).isoformat()
+            containers[group][key] = value
+
+        if bits & _DIAGNOSED_BIT:
+            message["diagnostico_servidor"] = {
+                "ocupacao_excessiva": bool(bits & _SERVER_EXCESS_BIT),
+                "anormal": bool(bits & _SERVER_ABNORMAL_BIT)
+            }
+
+        residual = data.extras.get(seq)
+        if data.seq[position] != seq:
+            return None
+        if residual is not None:
+            extras, nested_extras = residual
+            message.update(extras)
+            for group, fields in nested_extras.items():
+                containers[group].update(fields)
+        message["seq"] = seq
+        return message
+
+    # ------------------------------------------------------------------
+    # Escrita
+
+    def extend(self, messages):
+        """
+        Armazena as mensagens, atribuindo ``seq`` a cada uma
+
+        Retorna a lista das mensagens descartadas para abrir espaço
+        (incluindo mensagens do próprio lote, se ele for maior que maxlen).
+        """
+        evicted = []
+        with self._lock:
+            for message in messages:
+                message["seq"] = self._data.head[2]
+                self._insert(self._encode(message), evicted)
+        return evicted
+
+    def append(self, message):
+        return self.extend([message])
+
+    def restore(self, rows, next_seq=None):
+        """
+        Recarrega linhas empacotadas por ``pack()`` (ex.: replay do WAL)
+
+        ``rows`` é uma sequência de (seq, bytes) em ordem crescente de seq;
+        uma lacuna descarta o que foi carregado antes dela, preservando a
+        contiguidade dos seqs. ``next_seq`` define o seq da próxima
+        mensagem inserida.
+        """
+        # Só as últimas maxlen linhas contíguas sobrevivem à carga
+        rows = list(rows)
+        start = max(0, len(rows) - self.maxlen)
+        for index in range(len(rows) - 1, start, -1):
+            if rows[index][0] != rows[index - 1][0] + 1:
+                start = index
+                break
+        rows = rows[start:]
+
+        evicted = []
+        with self._lock:
+            if rows and self._data.head[1] and rows[0][0] != self._data.head[2]:
+                self.clear()
+            if rows and not self._data.head[1]:
+                self._load_rows(rows)
+            else:
+                for seq, payload in rows:
+                    self._insert(self._unpack(payload), evicted)
+            self._set_next_seq(next_seq)
+        return evicted
+
+    def load(self, messages, next_seq=None):
+        """
+        Recarrega mensagens expandidas que já têm ``seq`` (ex.: do SQLite)
+
+        Mesmas regras de ``restore()``: seqs em ordem crescente, uma
+        lacuna descarta o que foi carregado antes dela.
+        """
+        evicted = []
+        with self._lock:
+            for message in messages:
+                self._set_next_seq(message["seq"])
+                self._insert(self._encode(message), evicted)
+            self._set_next_seq(next_seq)
+        return evicted
+
+    def _set_next_seq(self, next_seq):
+        """Redefine o próximo seq; uma lacuna em relação ao armazenado descarta tudo"""
+        if next_seq is None:
+            return
+        start, count, current = self._data.head
+        if count and next_seq != current:
+            self.clear()
+            start, count = 0, 0
+        self._data.head = (start, count, next_seq)
+
+    def _unpack(self, payload):
+        """Converte uma linha empacotada em (valores das colunas, presença, bits, extras)"""
+        row = _ROW.unpack_from(payload)
+        present = row[0]
+        values = [0] * len(_FIELDS)
+        for index, value in zip(_NUMERIC_COLUMNS, row[2:_STRINGS_AT]):
+            values[index] = value
+        offset = _ROW.size
+        intern = self._strings.intern
+        for index, length in zip(_STRING_COLUMNS, row[_STRINGS_AT:]):
+            if present & (1 << index):
+                values[index] = intern(payload[offset:offset + length].decode("utf-8"))
+            offset += length
+        residual = tuple(json.loads(payload[offset:])) if offset < len(payload) else None
+        return values, present, row[1], residual
+
+    def _load_rows(self, rows):
+        """Carga em bloco, coluna a coluna, de linhas contíguas num armazenamento vazio"""
+        data = _Columns(rows[0][0])
+        intern = self._strings.intern
+        interned = {}
+        string_bits = [1 << index for index in _STRING_COLUMNS]
+        row_size = _ROW.size
+        unpack_from = _ROW.unpack_from
+        headers = []
+        strings = []
+        for seq, payload in rows:
+            row = unpack_from(payload)
+            present = row[0]
+            offset = row_size
+            for bit, length in zip(string_bits, row[_STRINGS_AT:]):
+                if not present & bit:
+                    strings.append(0)
+                    continue
+                raw = payload[offset:offset + length]
+                offset += length
+                index = interned.get(raw)
+                if index is None:
+                    index = interned[raw] = intern(raw.decode("utf-8"))
+                strings.append(index)
+            if offset < len(payload):
+                data.extras[seq] = tuple(json.loads(payload[offset:]))
+            headers.append(row)
+
+        first_seq = rows[0][0]
+        data.seq.extend(range(first_seq, first_seq + len(rows)))
+        header_columns = list(zip(*headers))
+        data.present.extend(header_columns[0])
+        data.bits.extend(header_columns[1])
+        for index, column_values in zip(_NUMERIC_COLUMNS, header_columns[2:_STRINGS_AT]):
+            data.values[index].extend(column_values)
+        for offset, index in enumerate(_STRING_COLUMNS):
+            data.values[index].extend(strings[offset::len(_STRING_COLUMNS)])
+        data.head = (0, len(rows), first_seq + len(rows))
+        self._rebuild_indexes(data)
+        self._data = data
+
+    def pack(self, seq):
+        """Linha do seq informado em formato binário compacto, ou None se não estiver armazenada"""
+        data = self._data
+        position = self._position(data, seq)
+        if position is None:
+            return None
+        values = [column[position] if column is not None else 0 for column in data.values]
+        present = data.present[position]
+        bits = data.bits[position]
+        residual = data.extras.get(seq)
+        if data.seq[position] != seq:
+            return None
+        return self._pack_row(values, present, bits, residual)
+
+    def pack_message(self, message, residual=True):
+        """
+        Empacota uma mensagem expandida sem armazená-la (mesmo formato de ``pack()``)
+
+        Com ``residual=False`` os campos fora do esquema são descartados,
+        limitando o tamanho da linha.
+        """
+        values, present, bits, extras = self._encode(message)
+        return self._pack_row(values, present, bits, extras if residual else None)
+
+    def _pack_row(self, values, present, bits, residual):
+        lookup = self._strings.lookup
+        strings = [
+            lookup(values[index]).encode("utf-8") if present & (1 << index) else b""
+            for index in _STRING_COLUMNS
+        ]
+        parts = [_ROW.pack(
+            present, bits,
+            *[values[index] for index in _NUMERIC_COLUMNS],
+            *[len(value) for value in strings]
+        )]
+        parts.extend(strings)
+        if residual is not None:
+            parts.append(json.dumps(residual, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        return b"".join(parts)
+
+    def _insert(self, encoded, evicted):
+        data = self._data
+        start, count, seq = data.head
+        values, present, bits, residual = encoded
+        if residual is not None:
+            data.extras[seq] = residual
+        if present & _TIMESTAMP_BIT:
+            insort(data.time_index, self._time_key(values[_TIMESTAMP_COLUMN], seq))
+        postings = data.postings
+        for key in _posting_keys(values, present, bits, residual):
+            seqs = postings.get(key)
+            if seqs is None:
+                postings[key] = array("q", (seq,))
+            else:
+                seqs.append(seq)
+
+        if count < self.maxlen:
+            data.present.append(present)
+            data.bits.append(bits)
+            for column, value in zip(data.values, values):
+                if column is not None:
+                    column.append(value)
+            data.seq.append(seq)
+            data.head = (start, count + 1, seq + 1)
+        else:
+            position = start
+            old_seq = data.seq[position]
+            evicted.append(self._decode(data, position, old_seq))
+            data.stale_keys += 1
+            # Invalida a posição antes de sobrescrever (leitores descartam a linha)
+            data.seq[position] = -1
+            data.extras.pop(old_seq, None)
+            data.present[position] = present
+            data.bits[position] = bits
+            for column, value in zip(data.values, values):
+                if column is not None:
+                    column[position] = value
+            data.seq[position] = seq
+            data.head = ((position + 1) % self.maxlen, count, seq + 1)
+            if data.stale_keys > max(_MIN_STALE_KEYS, count):
+                self._rebuild_indexes(data)
+
+    def _time_key(self, seconds, seq):
+        return seconds << self._seq_bits | seq & ((1 << self._seq_bits) - 1)
+
+    def _rebuild_indexes(self, data):
+        """Reconstrói os índices de horário e de valores a partir das colunas, sem entradas obsoletas"""
+        start, count, next_seq = data.head
+        first_seq = next_seq - count
+        maxlen = self.maxlen
+        present = data.present
+        bits = data.bits
+        columns = data.values
+        timestamps = columns[_TIMESTAMP_COLUMN]
+        extras = data.extras
+        keys = []
+        postings = {}
+        for offset in range(count):
+            position = (start + offset) % maxlen
+            seq = first_seq + offset
+            row_present = present[position]
+            if row_present & _TIMESTAMP_BIT:
+                keys.append(self._time_key(timestamps[position], seq))
+            values = [column[position] if column is not None else 0 for column in columns]
+            for key in _posting_keys(values, row_present, bits[position], extras.get(seq)):
+                postings.setdefault(key, []).append(seq)
+        keys.sort()
+        # Substituídos de uma vez: leitores com os índices anteriores continuam consistentes
+        data.time_index = array("q", keys)
+        data.postings = {key: array("q", seqs) for key, seqs in postings.items()}
+        data.stale_keys = 0
+
+    def update(self, seq, fields):
+        """
+        Altera campos de uma mensagem armazenada, mantendo o seq
+
+        Retorna a mensagem atualizada, ou None se ela não estiver mais
+        armazenada. Cada coluna é gravada de uma vez; um leitor
+        concorrente pode ver parte dos campos antes da atualização.
+        """
+        with self._lock:
+            data = self._data
+            position = self._position(data, seq)
+            message = None if position is None else self._decode(data, position, seq)
+            if message is None:
+                return None
+            message.update(fields)
+            values, present, bits, residual = self._encode(message)
+            old_present = data.present[position]
+            old_seconds = data.values[_TIMESTAMP_COLUMN][position]
+            if (present & _TIMESTAMP_BIT, values[_TIMESTAMP_COLUMN]) != (old_present & _TIMESTAMP_BIT, old_seconds):
+                data.stale_keys += 1
+                if present & _TIMESTAMP_BIT:
+                    insort(data.time_index, self._time_key(values[_TIMESTAMP_COLUMN], seq))
+            old_values = [column[position] if column is not None else 0 for column in data.values]
+            old_keys = _posting_keys(old_values, old_present, data.bits[position], data.extras.get(seq))
+            for key in _posting_keys(values, present, bits, residual):
+                if key not in old_keys:
+                    data.stale_keys += 1
+                    seqs = data.postings.get(key)
+                    if seqs is None:
+                        data.postings[key] = array("q", (seq,))
+                    else:
+                        insort(seqs, seq)
+            data.present[position] = present
+            data.bits[position] = bits
+            for column, value in zip(data.values, values):
+                if column is not None:
+                    column[position] = value
+            if residual is None:
+                data.extras.pop(seq, None)
+            else:
+                data.extras[seq] = residual
+            return message
+
+    def rediagnose(self, thresholds, changed=None):
+        """
+        Recalcula o ``diagnostico_servidor`` de todas as mensagens com novos limiares
+
+        Uma passada vetorizada (NumPy, se instalado) sobre as colunas de
+        ocupação e total de moscas, que grava os bits reservados e refaz as
+        listas de status. Mensagens com esses campos fora do esquema (nos
+        extras) são diagnosticadas uma a uma. Leitores concorrentes podem
+        ver parte das linhas com o diagnóstico anterior. Retorna o número
+        de mensagens reavaliadas.
+
+        Se ``changed`` for uma lista, recebe (seq, ocupacao_excessiva, anormal)
+        anteriores de cada mensagem cujo diagnóstico do servidor mudou.
+        """
+        with self._lock:
+            data = self._data
+            start, count, next_seq = data.head
+            if not count:
+                return 0
+            first_seq = next_seq - count
+            occupancy_bit = 1 << _OCCUPANCY_COLUMN
+            flies_bit = 1 << _FLIES_COLUMN
+            # Linhas em ordem de seq (o buffer circular começa em start)
+            if diagnosis.numpy is not None:
+                np = diagnosis.numpy
+                present = np.roll(np.frombuffer(data.present, dtype=np.uint32), -start)
+                occupancy = np.roll(np.frombuffer(data.values[_OCCUPANCY_COLUMN], dtype=np.int32), -start)
+                flies = np.roll(np.frombuffer(data.values[_FLIES_COLUMN], dtype=np.int32), -start)
+                occupancy = np.where(present & occupancy_bit, occupancy / _SCALE, 0.0)
+                flies = np.where(present & flies_bit, flies, 0)
+            else:
+                order = [(start + offset) % self.maxlen for offset in range(count)]
+                present = [data.present[position] for position in order]
+                occupancy_column = data.values[_OCCUPANCY_COLUMN]
+                flies_column = data.values[_FLIES_COLUMN]
+                occupancy = [
+                    occupancy_column[position] / _SCALE if row_present & occupancy_bit else 0.0
+                    for position, row_present in zip(order, present)
+                ]
+                flies = [
+                    flies_column[position] if row_present & flies_bit else 0
+                    for position, row_present in zip(order, present)
+                ]
+            excessive, abnormal = diagnosis.evaluate(occupancy, flies, thresholds)
+
+            # Ocupação ou total fora do esquema (ex.: mais de 4 casas decimais)
+            for seq, (_, nested_extras) in list(data.extras.items()):
+                fields = nested_extras.get("deteccoes")
+                if not fields or ("ocupacao_pct" not in fields and "total" not in fields):
+                    continue
+                position = self._position(data, seq)
+                message = None if position is None else self._decode(data, position, seq)
+                if message is not None:
+                    verdict = diagnosis.diagnose(message, thresholds)
+                    excessive[seq - first_seq] = verdict["ocupacao_excessiva"]
+                    abnormal[seq - first_seq] = verdict["anormal"]
+
+            if diagnosis.numpy is not None:
+                bits = np.frombuffer(data.bits, dtype=np.uint32)
+                server = np.roll(
+                    _DIAGNOSED_BIT
+                    | np.where(excessive, _SERVER_EXCESS_BIT, 0).astype(np.uint32)
+                    | np.where(abnormal, _SERVER_ABNORMAL_BIT, 0).astype(np.uint32),
+                    start
+                )
+                if changed is not None:
+                    positions = np.flatnonzero((bits & np.uint32(_SERVER_BITS)) != server)
+                    for position, row_bits in zip(positions.tolist(), bits[positions].tolist()):
+                        seq = first_seq + (position - start) % self.maxlen
+                        changed.append((seq, *_row_flags(data.present[position], row_bits, data.extras.get(seq))))
+                bits[:] = (bits & ~np.uint32(_SERVER_BITS)) | server
+                del bits
+                statuses = {
+                    "anormal": abnormal,
+                    "alerta": excessive & ~abnormal,
+                    "normal": ~(excessive | abnormal)
+                }
+                status_seqs = {
+                    name: array("q", (np.flatnonzero(mask) + first_seq).astype(np.int64).tobytes())
+                    for name, mask in statuses.items()
+                }
+            else:
+                status_seqs = {name: array("q") for name in STATUSES}
+                for offset, (position, row_excessive, row_abnormal) in enumerate(zip(order, excessive, abnormal)):
+                    server = _DIAGNOSED_BIT
+                    if row_excessive:
+                        server |= _SERVER_EXCESS_BIT
+                    if row_abnormal:
+                        server |= _SERVER_ABNORMAL_BIT
+                    row_bits = data.bits[position]
+                    if changed is not None and row_bits & _SERVER_BITS != server:
+                        seq = first_seq + offset
+                        changed.append((seq, *_row_flags(data.present[position], row_bits, data.extras.get(seq))))
+                    data.bits[position] = row_bits & ~_SERVER_BITS | server
+                    status = "anormal" if row_abnormal else "alerta" if row_excessive else "normal"
+                    status_seqs[status].append(first_seq + offset)
+
+            # Listas de status substituídas de uma vez (leitores veem as anteriores ou as novas)
+            postings = {key: seqs for key, seqs in data.postings.items() if key[0] != "status"}
+            for name, seqs in status_seqs.items():
+                if seqs:
+                    postings[("status", name)] = seqs
+            data.postings = postings
+            return count
+
+    def clear(self):
+        """Remove todas as mensagens (a sequência de seqs continua)"""
+        with self._lock:
+            self._data = _Columns(self._data.head[2])
+
+    # ------------------------------------------------------------------
+    # Leitura
+
+    def __len__(self):
+        return self._data.head[1]
+
+    def __bool__(self):
+        return self._data.head[1] > 0
+
+    @property
+    def first_seq(self):
+        _, count, next_seq = self._data.head
+        return next_seq - count if count else None
+
+    @property
+    def last_seq(self):
+        _, count, next_seq = self._data.head
+        return next_seq - 1 if count else None
+
+    @property
+    def next_seq(self):
+        return self._data.head[2]
+
+    def _position(self, data, seq):
+        """Posição do seq nas colunas, ou None se ele não estiver armazenado"""
+        start, count, next_seq = data.head
+        offset = seq - (next_seq - count)
+        if not 0 <= offset < count:
+            return None
+        return (start + offset) % self.maxlen
+
+    def get(self, seq):
+        """Mensagem com o seq informado ou None se não estiver armazenada"""
+        data = self._data
+        position = self._position(data, seq)
+        return None if position is None else self._decode(data, position, seq)
+
+    def range(self, since=None, before=None, limit=None):
+        """
+        Mensagens com since < seq < before, em ordem de seq
+
+        Com limit e sem since, retorna as mais recentes do intervalo.
+        Mensagens despejadas durante a leitura ficam de fora, e o
+        resultado continua contíguo.
+        """
+        data = self._data
+        start, count, next_seq = data.head
+        if not count or limit == 0:
+            return []
+        first = next_seq - count
+        last = next_seq - 1
+        low = first if since is None else max(first, since + 1)
+        high = last if before is None else min(last, before - 1)
+        if limit is not None:
+            if since is not None:
+                high = min(high, low + limit - 1)
+            else:
+                low = max(low, high - limit + 1)
+        if low > high:
+            return []
+        position = (start + low - first) % self.maxlen
+        maxlen = self.maxlen
+        decode = self._decode
+        messages = []
+        for seq in range(low, high + 1):
+            message = decode(data, position, seq)
+            if message is None:
+                messages.clear()
+            else:
+                messages.append(message)
+            position = (position + 1) % maxlen
+        return messages
+
+    def select(self, since=None, before=None, limit=None, device=None, gateway=None, status=None, start=None, end=None):
+        """
+        Mensagens que atendem aos filtros, em ordem de seq
+
+        ``device``/``gateway`` comparam ``lora_id``/``gateway_id``,
+        ``status`` é um de ``STATUSES`` e ``start``/``end`` limitam o horário
+        da detecção (segundos desde a época, inclusive). Mesmas regras de
+        ``range()`` para since/before/limit.
+
+        Os candidatos vêm do índice mais seletivo (lista de seqs do valor
+        ou busca binária no índice de horário) e os demais filtros são
+        conferidos nas colunas: O(log n) mais o número de candidatos, e
+        apenas as mensagens selecionadas são decodificadas.
+        """
+        if device is None and gateway is None and status is None and start is None and end is None:
+            return self.range(since, before, limit)
+        data = self._data
+        wanted = {}
+        for name, value in (("device", device), ("gateway", gateway)):
+            if value is not None:
+                wanted[name] = self._strings.find(value) if type(value) is str else None
+                if wanted[name] is None:
+                    return []
+
+        candidates = None
+        keys = list(wanted.items())
+        if status is not None:
+            keys.append(("status", status))
+        for key in keys:
+            seqs = data.postings.get(key)
+            if seqs is None:
+                return []
+            low = 0 if since is None else bisect_left(seqs, since + 1)
+            high = len(seqs) if before is None else bisect_left(seqs, before)
+            if candidates is None or high - low < len(candidates):
+                candidates = seqs[low:high]
+        if start is not None or end is not None:
+            timed = self._time_candidates(data, start, end, since, before)
+            if candidates is None or len(timed) < len(candidates):
+                candidates = timed
+
+        present = data.present
+        bits = data.bits
+        columns = data.values
+        timestamps = columns[_TIMESTAMP_COLUMN]
+        checked_columns = [(column, wanted[name]) for name, column in _POSTING_COLUMNS if name in wanted]
+        seqs = []
+        # Entradas obsoletas (mensagem despejada ou campo alterado por update()) não passam na conferência
+        for seq in sorted(set(candidates)):
+            if (since is not None and seq <= since) or (before is not None and seq >= before):
+                continue
+            position = self._position(data, seq)
+            if position is None:
+                continue
+            row_present = present[position]
+            if any(not row_present & (1 << column) or columns[column][position] != value for column, value in checked_columns):
+                continue
+            if status is not None and _row_status(row_present, bits[position], data.extras.get(seq)) != status:
+                continue
+            if start is not None or end is not None:
+                if not row_present & _TIMESTAMP_BIT:
+                    continue
+                seconds = timestamps[position]
+                if (start is not None and seconds < start) or (end is not None and seconds > end):
+                    continue
+            seqs.append(seq)
+        if limit is not None:
+            seqs = seqs[:limit] if since is not None else seqs[max(len(seqs) - limit, 0):] if limit else []
+
+        messages = []
+        for seq in seqs:
+            position = self._position(data, seq)
+            message = None if position is None else self._decode(data, position, seq)
+            if message is not None:
+                messages.append(message)
+        return messages
+
+    def _time_candidates(self, data, start, end, since, before):
+        """Seqs do índice de horário entre start e end (sem conferir as colunas)"""
+        keys = data.time_index
+        bits = self._seq_bits
+        mask = (1 << bits) - 1
+        # Inserções concorrentes só deslocam entradas para a direita: low é
+        # calculado antes e, no máximo, inclui entradas a mais (conferidas depois)
+        low = 0 if start is None else bisect_left(keys, start << bits)
+        high = len(keys) if end is None else bisect_left(keys, (end + 1) << bits)
+        # Seq completo a partir dos bits baixos: o mais próximo do próximo seq
+        base = data.head[2] - (1 << (bits - 1))
+        seqs = []
+        for key in keys[low:high]:
+            seq = base + ((key - base) & mask)
+            if (since is None or seq > since) and (before is None or seq < before):
+                seqs.append(seq)
+        return seqs
+
+    def __iter__(self):
+        return iter(self.range())
+
+    def nbytes(self):
+        """Memória aproximada ocupada pelas colunas, strings internadas, extras e índices"""
+        data = self._data
+        total = sum(column.itemsize * len(column) for column in data.values if column is not None)
+        total += data.seq.itemsize * len(data.seq)
+        total += data.present.itemsize * len(data.present)
+        total += data.bits.itemsize * len(data.bits)
+        total += self._strings.nbytes()
+        total += 512 * len(data.extras)
+        total += data.time_index.itemsize * len(data.time_index)
+        total += sum(seqs.itemsize * len(seqs) + 64 for seqs in data.postings.values())
+        return total
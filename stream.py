@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Distribuição de novas mensagens para assinantes do stream (SSE)
+"""
+import threading
+
+
+class MessageBroker:
+    """
+    Notifica assinantes quando novas mensagens são armazenadas
+
+    O broker não copia mensagens para filas por assinante: ele publica
+    apenas o último seq armazenado e cada assinante lê o que falta
+    diretamente do armazenamento em memória. Assim o custo da publicação
+    no ingest não cresce com o volume de mensagens, assinantes lentos
+    não acumulam memória e a retomada por Last-Event-ID é só um cursor.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._last_seq = 0
+        self._subscribers = 0
+        self._listeners = ()
+
+    @property
+    def last_seq(self):
+        return self._last_seq
+
+    @property
+    def subscribers(self):
+        return self._subscribers
+
+    def publish(self, last_seq):
+        """Registra o último seq armazenado e acorda os assinantes"""
+        with self._condition:
+            self._last_seq = last_seq
+            if self._subscribers:
+                self._condition.notify_all()
+        for listener in self._listeners:
+            listener()
+
+    def wait(self, seq, timeout):
+        """Bloqueia até existir seq maior que o informado ou expirar o timeout"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._last_seq > seq, timeout)
+            return self._last_seq
+
+    def subscribe(self):
+        with self._condition:
+            self._subscribers += 1
+
+    def unsubscribe(self):
+        with self._condition:
+            self._subscribers -= 1
+
+    def add_listener(self, callback):
+        """
+        Registra um callback sem argumentos chamado a cada publicação
+
+        O callback roda na thread que publicou; usado pelo stream ASGI para
+        acordar o event loop (loop.call_soon_threadsafe).
+        """
+        with self._condition:
+            self._listeners = self._listeners + (callback,)
+
+    def remove_listener(self, callback):
+        with self._condition:
+            self._listeners = tuple(listener for listener in self._listeners if listener is not callback)
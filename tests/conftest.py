@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+Configuração dos testes: raiz do projeto no path e servidor sem persistência
+
+As variáveis são definidas antes de importar app.py, que lê a
+configuração na importação.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+for name in ("WAL_DIR", "SQLITE_PATH", "SHM_RING_NAME", "TELEGRAM_TOKEN", "WEBHOOK_URLS"):
+    os.environ[name] = ""
+os.environ["LOG_LEVEL"] = "WARNING"
+os.environ["RATE_LIMIT_RATE"] = "0"
+
+import pytest
+
+
+@pytest.fixture
+def server():
+    """Módulo app com o armazenamento vazio"""
+    import app
+
+    app.app.config["TESTING"] = True
+    response = app.app.test_client().delete("/api/messages")
+    assert response.status_code == 200
+    return app
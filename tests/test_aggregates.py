@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Agregados incrementais (GET /api/aggregates): inserções, despejos e o snapshot em cache"""
+import json
+
+from aggregates import Aggregates, snapshot_delta
+
+
+def message(device, hour, flies, occupancy=10.0, abnormal=False):
+    return {
+        "lora_id": device,
+        "timestamp": f"2025-11-20 {hour}:15:00",
+        "deteccoes": {"total": flies, "ocupacao_pct": occupancy, "confianca_media": 0.8},
+        "diagnostico": {"ocupacao_excessiva": False, "anormal": abnormal}
+    }
+
+
+def test_remove_undoes_add():
+    aggregates = Aggregates()
+    first = message("LORA-1", "06", 10, abnormal=True)
+    aggregates.add(first)
+    aggregates.add(message("LORA-2", "07", 4, occupancy=30.0))
+    snapshot = aggregates.snapshot()
+    assert snapshot["global"]["captures"] == 2
+    assert snapshot["global"]["flies"] == 14
+    assert snapshot["global"]["avg_occupancy"] == 20.0
+    assert snapshot["global"]["count_abnormal"] == 1
+    # Sem alterações, o mesmo objeto
+    assert aggregates.snapshot() is snapshot
+
+    aggregates.remove(first)
+    current = aggregates.snapshot()
+    assert current is not snapshot
+    assert (current["global"]["captures"], current["global"]["flies"], current["global"]["count_abnormal"]) == (1, 4, 0)
+    assert list(current["devices"]) == ["LORA-2"]
+    assert list(current["hourly"]) == ["07:00"]
+    delta = snapshot_delta(snapshot, current)
+    assert (delta["removed_devices"], delta["removed_hours"]) == (["LORA-1"], ["06:00"])
+
+
+def post_batch(server, device, hour, count, flies):
+    items = []
+    for index in range(count):
+        lora_data = {"dt": "20112025", "hr": f"{hour}:{index // 60 % 60:02d}:{index % 60:02d}", "m": flies, "op": 2, "id": device}
+        items.append({"client_id": "gateway-agg", "message_id": f"{device}-{hour}-{index}", "lora_data": json.dumps(lora_data)})
+    response = server.app.test_client().post("/api/messages/batch", json=items)
+    assert response.get_json()["stored"] == count
+
+
+def aggregates_of(server):
+    return server.app.test_client().get("/api/aggregates").get_json()["aggregates"]
+
+
+def test_eviction_lowers_aggregates(server):
+    capacity = server.messages_storage.maxlen
+    post_batch(server, "LORA-OLD", "08", capacity, flies=5)
+    before = aggregates_of(server)
+    assert before["global"]["captures"] == capacity
+    assert before["global"]["flies"] == 5 * capacity
+
+    # Cada mensagem nova despeja uma antiga do MAX_MESSAGES
+    post_batch(server, "LORA-NEW", "09", 10, flies=50)
+    after = aggregates_of(server)
+    assert after["global"]["captures"] == capacity
+    assert after["global"]["flies"] == 5 * (capacity - 10) + 50 * 10
+    assert after["devices"]["LORA-OLD"]["captures"] == capacity - 10
+    assert after["devices"]["LORA-NEW"]["captures"] == 10
+
+    post_batch(server, "LORA-NEW", "10", capacity - 10, flies=1)
+    final = aggregates_of(server)
+    # Todas as mensagens antigas despejadas: dispositivo e hora saem dos agregados
+    assert "LORA-OLD" not in final["devices"]
+    assert "08:00" not in final["hourly"]
+    assert final["global"]["devices"] == 1
+    assert final["global"]["flies"] == 50 * 10 + (capacity - 10)
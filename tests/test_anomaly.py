@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Anomalias por dispositivo (EWMA / z-score) e GET /api/anomalies"""
+import json
+
+from anomaly import AnomalyDetector
+
+
+def frame(device, flies, occupancy=2.0, seq=None):
+    return {"seq": seq, "lora_id": device, "deteccoes": {"total": flies, "ocupacao_pct": occupancy}}
+
+
+def test_warmup_suppresses_flags():
+    detector = AnomalyDetector(sigma=3, alpha=0.1, warmup=5)
+    for _ in range(4):
+        assert detector.observe(frame("LORA-1", 10)) is None
+    # Quatro frames: a linha de base ainda não vale
+    assert detector.score(frame("LORA-1", 500)) is None
+    detector.learn(frame("LORA-1", 10))
+    assert detector.score(frame("LORA-1", 500)) is not None
+    # Dispositivo sem linha de base nunca é marcado
+    assert detector.score(frame("LORA-NOVO", 500)) is None
+
+
+def test_flags_beyond_sigma_in_both_directions():
+    detector = AnomalyDetector(sigma=3, alpha=0.1, warmup=5)
+    for _ in range(30):
+        detector.learn(frame("LORA-1", 10, 2.0))
+    # Leituras constantes: desvio mínimo de 1 mosca e 0,5 ponto de ocupação
+    assert detector.score(frame("LORA-1", 13, 2.0)) is None
+    anomaly = detector.score(frame("LORA-1", 14, 2.0))
+    assert anomaly == {"moscas_z": 4.0, "moscas_media": 10.0, "ocupacao_z": 0.0, "ocupacao_media": 2.0}
+    assert detector.score(frame("LORA-1", 10, 0.0))["ocupacao_z"] == -4.0
+    assert detector.stats()["flagged"] == 2
+
+    # A linha de base acompanha a mudança de nível (EWMA) e deixa de marcar
+    for _ in range(100):
+        detector.learn(frame("LORA-1", 14, 2.0))
+    assert detector.score(frame("LORA-1", 14, 2.0)) is None
+    assert detector.baseline("LORA-1")["moscas_media"] > 13.9
+
+
+def test_idle_devices_pruned():
+    detector = AnomalyDetector(warmup=1, max_devices=4)
+    for device in ("LORA-0", "LORA-1", "LORA-2", "LORA-3", "LORA-0"):
+        detector.learn(frame(device, 5))
+    detector.learn(frame("LORA-4", 7))
+
+    # Os dois mais ociosos saem; os demais mantêm a linha de base
+    stats = detector.stats()
+    assert (stats["tracked_devices"], stats["pruned_devices"]) == (3, 2)
+    assert detector.baseline("LORA-1") is None
+    assert detector.baseline("LORA-2") is None
+    assert detector.baseline("LORA-0")["frames"] == 2
+    assert detector.baseline("LORA-4") == {"frames": 1, "moscas_media": 7, "moscas_desvio": 0, "ocupacao_media": 2, "ocupacao_desvio": 0}
+
+
+def post_frame(server, second, flies):
+    lora_data = {"dt": "20112025", "hr": f"18:{second // 60:02d}:{second % 60:02d}", "m": flies, "op": 2, "id": "LORA-ANOM"}
+    response = server.app.test_client().post("/api/messages", json={
+        "client_id": "gateway-anom", "message_id": second, "lora_data": json.dumps(lora_data)
+    })
+    assert response.status_code == 200
+    return response.get_json()["seq"]
+
+
+def test_anomalies_route(server, monkeypatch):
+    client = server.app.test_client()
+    for second in range(server.anomalies.warmup):
+        post_frame(server, second, flies=5)
+    seq = post_frame(server, 30, flies=90)
+    post_frame(server, 31, flies=5)
+
+    body = client.get("/api/anomalies?device=LORA-ANOM").get_json()
+    assert [entry["seq"] for entry in body["anomalies"]] == [seq]
+    entry = body["anomalies"][0]
+    assert (entry["moscas"], entry["anomalia"]["moscas_media"]) == (90, 5)
+    assert body["next_since"] == seq
+    assert body["baseline"]["frames"] == server.anomalies.warmup + 2
+    assert server.messages_storage.get(seq)["diagnostico"]["anomalia"] == entry["anomalia"]
+
+    assert client.get(f"/api/anomalies?since={seq}").get_json()["count"] == 0
+    assert client.get("/api/anomalies?limit=0").get_json()["anomalies"] == []
+    assert client.get("/api/anomalies?device=LORA-OUTRO").get_json()["baseline"] is None
+    assert client.get("/api/anomalies?limit=-1").status_code == 400
+    monkeypatch.setattr(server, "anomalies", None)
+    assert client.get("/api/anomalies").status_code == 404
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Servidor ASGI: o event loop continua livre durante o stream e a ingestão"""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("a2wsgi")
+
+
+class AsgiLoop:
+    """Event loop numa thread, com uma tarefa que conta ticks enquanto o loop está livre"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.ticks = 0
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+        self.submit(self._ticker())
+
+    async def _ticker(self):
+        while True:
+            self.ticks += 1
+            await asyncio.sleep(0.005)
+
+    def submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def ticks_during(self, seconds):
+        start = self.ticks
+        time.sleep(seconds)
+        return self.ticks - start
+
+    async def _shutdown(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.loop.stop()
+
+    def close(self):
+        # Um loop travado não atende o encerramento: a thread continuaria viva
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+        self._thread.join(2)
+        assert not self._thread.is_alive(), "event loop travado"
+        self.loop.close()
+
+
+class AsgiRequest:
+    """Uma requisição ASGI: corpo enviado de uma vez, desconexão sob demanda"""
+
+    def __init__(self, asgi_loop, application, method, path, body=b"", headers=()):
+        self.sent = []
+        self._events = [{"type": "http.request", "body": body, "more_body": False}]
+        self._disconnect = None
+        scope = {
+            "type": "http",
+            "method": method,
+            "path": path,
+            "query_string": b"",
+            "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+            "client": ("127.0.0.1", 5000)
+        }
+        self.future = asgi_loop.submit(application(scope, self._receive, self._send))
+        self._loop = asgi_loop.loop
+
+    async def _receive(self):
+        if self._events:
+            return self._events.pop(0)
+        self._disconnect = asyncio.Event()
+        await self._disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def _send(self, event):
+        self.sent.append(event)
+
+    @property
+    def status(self):
+        return next((event["status"] for event in self.sent if event["type"] == "http.response.start"), None)
+
+    @property
+    def body(self):
+        return b"".join(event.get("body", b"") for event in self.sent if event["type"] == "http.response.body")
+
+    def events(self, name):
+        events = []
+        for block in self.body.decode("utf-8").split("\n\n"):
+            fields = dict(line.split(": ", 1) for line in block.split("\n") if ": " in line)
+            if fields.get("event") == name:
+                events.append(json.loads(fields["data"]))
+        return events
+
+    def disconnect(self):
+        if self._disconnect is not None:
+            self._loop.call_soon_threadsafe(self._disconnect.set)
+        self.future.result(2)
+
+
+def wait_for(condition, timeout=3):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def frame_body(second):
+    lora_data = {"dt": "20112025", "hr": f"11:00:{second:02d}", "m": 4, "op": 2, "id": "LORA-ASGI"}
+    return json.dumps({"client_id": "gateway-asgi", "message_id": second, "lora_data": json.dumps(lora_data)}).encode()
+
+
+@pytest.fixture
+def asgi(server, monkeypatch):
+    import asgi as asgi_module
+
+    monkeypatch.setattr(asgi_module, "STREAM_AGGREGATES_SECONDS", 0.1)
+    monkeypatch.setattr(asgi_module, "STREAM_KEEPALIVE_SECONDS", 15)
+    asgi_loop = AsgiLoop()
+    yield asgi_loop, asgi_module.application
+    asgi_loop.close()
+
+
+def post(asgi_loop, application, second):
+    request = AsgiRequest(asgi_loop, application, "POST", "/api/messages", frame_body(second),
+                          [("Content-Type", "application/json")])
+    return request
+
+
+def test_stream_resumed_after_delete_does_not_block_loop(server, asgi):
+    asgi_loop, application = asgi
+    for second in range(3):
+        post(asgi_loop, application, second).future.result(2)
+    server.app.test_client().delete("/api/messages")
+
+    stream = AsgiRequest(asgi_loop, application, "GET", "/api/stream", headers=[("Last-Event-ID", "1")])
+    assert wait_for(lambda: stream.status == 200)
+    assert asgi_loop.ticks_during(0.3) > 10
+    assert stream.events("stats") == []
+
+    request = post(asgi_loop, application, 30)
+    request.future.result(2)
+    seq = json.loads(request.body)["seq"]
+    assert wait_for(lambda: [message["seq"] for message in stream.events("message")] == [seq])
+    assert wait_for(lambda: stream.events("aggregates") and stream.events("aggregates")[-1]["global"]["captures"] == 1)
+    stream.disconnect()
+
+
+def test_ingest_waiting_for_store_lock_does_not_block_loop(server, asgi):
+    asgi_loop, application = asgi
+    with server.store_lock:
+        request = post(asgi_loop, application, 40)
+        # Ingestão parada no lock (como durante um DELETE ou POST /api/diagnosis)
+        assert asgi_loop.ticks_during(0.3) > 10
+        assert not request.future.done()
+    request.future.result(2)
+    assert request.status == 200
+    assert json.loads(request.body)["success"] is True
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Ingestão em lote (POST /api/messages/batch): resultado por item"""
+import json
+
+
+def envelope(second, device="LORA-BATCH"):
+    lora_data = {"dt": "20112025", "hr": f"15:00:{second:02d}", "m": second, "op": 1, "id": device}
+    return {"client_id": "gateway-batch", "message_id": second, "lora_data": json.dumps(lora_data)}
+
+
+def post_batch(server, items):
+    return server.app.test_client().post("/api/messages/batch", json=items)
+
+
+def test_mixed_items_get_their_own_status(server):
+    errors = server.current_stats()["errors"]
+    items = [
+        envelope(1),
+        42,
+        {},
+        envelope(2),
+        {"client_id": "gateway-batch", "lora_data": {"dt": 5}},
+        envelope(3)
+    ]
+    response = post_batch(server, items)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body["success"], body["received"], body["stored"], body["rejected"]) == (False, 6, 3, 3)
+
+    results = body["results"]
+    assert [result["index"] for result in results] == list(range(6))
+    assert [result["success"] for result in results] == [True, False, False, True, False, True]
+    assert results[1]["error"] == results[2]["error"] == "JSON inválido"
+    assert results[4]["error"]
+    # Itens aceitos recebem seqs contíguos, na ordem do lote
+    seqs = [results[index]["seq"] for index in (0, 3, 5)]
+    assert seqs == list(range(seqs[0], seqs[0] + 3))
+    assert all(results[index]["device_id"] == "LORA-BATCH" for index in (0, 3, 5))
+    assert [message["deteccoes"]["total"] for message in server.messages_storage.range()] == [1, 2, 3]
+    assert server.current_stats()["errors"] == errors + 3
+
+
+def test_all_valid_batch(server):
+    body = post_batch(server, [envelope(second) for second in range(5)]).get_json()
+    assert (body["success"], body["stored"], body["rejected"]) == (True, 5, 0)
+    assert all(result["format"] == "gateway_lora" for result in body["results"])
+
+
+def test_batch_limits(server, monkeypatch):
+    client = server.app.test_client()
+    monkeypatch.setattr(server, "MAX_BATCH_SIZE", 3)
+    response = post_batch(server, [envelope(second) for second in range(4)])
+    assert response.status_code == 413
+    assert len(server.messages_storage) == 0
+    assert client.post("/api/messages/batch", data="{", content_type="application/json").status_code == 400
+    assert post_batch(server, []).get_json()["received"] == 0
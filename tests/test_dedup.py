@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Deduplicação de retransmissões LoRa: janela, vários gateways e a cópia com melhor sinal"""
+import json
+import time
+
+import pytest
+
+from dedup import DedupIndex, message_keys
+from sqlite_backend import SQLiteBackend
+from storage import MessageStore
+from wal import WriteAheadLog
+
+
+def envelope(gateway, message_id, rssi, snr, hour="07:30:00", device="LORA-DUP"):
+    lora_data = {"dt": "20112025", "hr": hour, "m": 4, "op": 2, "id": device}
+    return {"client_id": gateway, "message_id": message_id, "rssi": rssi, "snr": snr, "lora_data": json.dumps(lora_data)}
+
+
+def post(server, body):
+    response = server.app.test_client().post("/api/messages", json=body)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_index_window_and_bound():
+    index = DedupIndex(window_seconds=0.1, max_entries=3)
+    keys = message_keys({"lora_id": "LORA-1", "timestamp": "2025-11-20 07:30:00", "gateway_id": "gw", "message_id": 7})
+    assert len(keys) == 2
+    index.add(keys, 10)
+    # Qualquer uma das chaves identifica a repetição
+    assert index.find(keys[:1]) == 10
+    assert index.find(keys[1:]) == 10
+    time.sleep(0.15)
+    assert index.find(keys) is None
+
+    index = DedupIndex(window_seconds=60, max_entries=3)
+    for seq in range(1, 5):
+        index.add([hash(("frame", seq))], seq)
+    # As chaves mais antigas saem primeiro
+    assert len(index) == 3
+    assert index.find([hash(("frame", 1))]) is None
+    assert index.find([hash(("frame", 4))]) == 4
+
+
+def test_retransmission_by_other_gateway_is_dropped(server):
+    first = post(server, envelope("gateway-a", 1, rssi=-90, snr=2))
+    copy = post(server, envelope("gateway-b", 55, rssi=-95, snr=1))
+    assert copy["duplicate"] is True
+    assert copy["seq"] == first["seq"]
+    # Mesmo gateway e message_id, frame diferente: também é retransmissão
+    resent = post(server, envelope("gateway-a", 1, rssi=-90, snr=2, hour="07:31:00"))
+    assert resent["duplicate"] is True
+
+    assert len(server.messages_storage) == 1
+    assert server.aggregates.snapshot()["global"]["captures"] == 1
+    stored = server.messages_storage.get(first["seq"])
+    # Sinal pior: a mensagem armazenada continua com o gateway original
+    assert (stored["gateway_id"], stored["rssi"]) == ("gateway-a", -90)
+
+
+def test_repeat_inside_batch(server):
+    response = server.app.test_client().post("/api/messages/batch", json=[
+        envelope("gateway-a", 1, rssi=-100, snr=0),
+        envelope("gateway-b", 2, rssi=-70, snr=6),
+        envelope("gateway-a", 3, rssi=-100, snr=0, hour="07:30:05")
+    ])
+    body = response.get_json()
+    assert response.status_code == 200
+    results = body["results"]
+    assert [result.get("duplicate", False) for result in results] == [False, True, False]
+    assert results[1]["seq"] == results[0]["seq"]
+    stored = server.messages_storage.get(results[0]["seq"])
+    assert (stored["gateway_id"], stored["rssi"], stored["snr"]) == ("gateway-b", -70, 6)
+
+
+@pytest.fixture
+def persistence(server, monkeypatch, tmp_path):
+    wal = WriteAheadLog(str(tmp_path / "wal"), retain=server.MAX_MESSAGES, version=server.PACK_VERSION, fsync_interval=0)
+    wal.replay()
+    backend = SQLiteBackend(str(tmp_path / "historico.db"))
+    monkeypatch.setattr(server, "wal", wal)
+    monkeypatch.setattr(server, "backend", backend)
+    yield wal, backend
+    backend.close()
+    wal.close()
+
+
+def test_best_signal_updates_store_wal_and_sqlite(server, persistence, tmp_path):
+    wal, backend = persistence
+    seq = post(server, envelope("gateway-a", 1, rssi=-110, snr=-3))["seq"]
+    assert post(server, envelope("gateway-b", 9, rssi=-60, snr=8))["duplicate"] is True
+
+    best = ("gateway-b", 9, -60, 8)
+    stored = server.messages_storage.get(seq)
+    assert (stored["gateway_id"], stored["message_id"], stored["rssi"], stored["snr"]) == best
+    assert server.messages_storage.select(gateway="gateway-b") == [stored]
+
+    # SQLite: a linha é regravada com o mesmo seq
+    backend.flush()
+    rows = backend.query()
+    assert [(row["seq"], row["gateway_id"], row["message_id"], row["rssi"], row["snr"]) for row in rows] == [(seq, *best)]
+
+    # WAL: o replay devolve o registro de atualização no lugar do original
+    wal.close()
+    restarted = WriteAheadLog(str(tmp_path / "wal"), retain=server.MAX_MESSAGES, version=server.PACK_VERSION, fsync_interval=0)
+    records = restarted.replay()
+    restarted.close()
+    assert [record_seq for record_seq, _ in records] == [seq]
+    restored = MessageStore(10)
+    restored.restore(records, restarted.next_seq)
+    message = restored.get(seq)
+    assert (message["gateway_id"], message["message_id"], message["rssi"], message["snr"]) == best
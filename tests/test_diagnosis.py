@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Diagnóstico do servidor: agregados e regravação do SQLite (POST /api/diagnosis)"""
+import json
+import threading
+
+import pytest
+
+from diagnosis import Thresholds
+from sqlite_backend import SQLiteBackend
+
+DEFAULTS = {"ocupacao_excessiva": 20, "anormal_ocupacao": 30, "anormal_moscas": 50}
+
+
+def post_frame(server, second, flies, occupancy=2):
+    # O dispositivo diz que está tudo normal; o servidor decide pelos limiares
+    lora_data = {"dt": "20112025", "hr": f"14:{second // 60:02d}:{second % 60:02d}", "m": flies, "op": occupancy,
+                 "dg": {"oe": False, "an": False}, "id": "LORA-DG"}
+    response = server.app.test_client().post("/api/messages", json={
+        "client_id": "gateway-dg", "message_id": second, "lora_data": json.dumps(lora_data)
+    })
+    assert response.status_code == 200
+    return response.get_json()
+
+
+@pytest.fixture
+def diagnosis(server):
+    client = server.app.test_client()
+    yield client
+    assert client.post("/api/diagnosis", json=DEFAULTS).status_code == 200
+
+
+def abnormal_count(server):
+    return server.app.test_client().get("/api/aggregates").get_json()["aggregates"]["global"]["count_abnormal"]
+
+
+def test_aggregates_count_server_diagnosis(server, diagnosis):
+    post_frame(server, 1, flies=55)
+    post_frame(server, 2, flies=5)
+    listed = diagnosis.get("/api/messages?status=anormal").get_json()
+    assert [message["deteccoes"]["total"] for message in listed["messages"]] == [55]
+    assert abnormal_count(server) == 1
+
+    assert diagnosis.post("/api/diagnosis", json={"anormal_moscas": 100}).status_code == 200
+    assert abnormal_count(server) == 0
+    assert diagnosis.post("/api/diagnosis", json={"anormal_moscas": 4}).status_code == 200
+    assert abnormal_count(server) == 2
+
+    # Despejar as mensagens reavaliadas desconta o que os agregados contaram para elas
+    for second in range(3, server.messages_storage.maxlen + 3):
+        post_frame(server, second, flies=1)
+    assert abnormal_count(server) == 0
+
+
+def test_sqlite_rewrite_runs_outside_store_lock(server, diagnosis, monkeypatch, tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "historico.db"))
+    monkeypatch.setattr(server, "backend", backend)
+    post_frame(server, 10, flies=55)
+
+    started, release = threading.Event(), threading.Event()
+    rediagnose = backend.rediagnose
+
+    def slow_rediagnose(thresholds):
+        started.set()
+        release.wait(5)
+        return rediagnose(thresholds)
+
+    monkeypatch.setattr(backend, "rediagnose", slow_rediagnose)
+    responses = []
+    worker = threading.Thread(target=lambda: responses.append(
+        server.app.test_client().post("/api/diagnosis", json={"anormal_moscas": 100})
+    ))
+    worker.start()
+    assert started.wait(5)
+    # A regravação do SQLite está em andamento e a ingestão não espera por ela
+    assert server.store_lock.acquire(timeout=1)
+    server.store_lock.release()
+    post_frame(server, 11, flies=55)
+    release.set()
+    worker.join(5)
+
+    assert responses[0].get_json()["reevaluated_stored"] == 2
+    assert backend.query(status="anormal") == []
+    backend.close()
+
+
+def test_sqlite_rediagnose_in_chunks(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "historico.db"))
+    messages = [
+        {"seq": seq, "timestamp": "2025-11-20 10:00:00", "lora_id": "LORA-1",
+         "deteccoes": {"total": seq * 10, "ocupacao_pct": 1}, "diagnostico": {"anormal": False}}
+        for seq in range(1, 11)
+    ]
+    backend.write(messages)
+    thresholds = Thresholds(ocupacao_excessiva=20, anormal_ocupacao=30, anormal_moscas=45)
+    assert backend.rediagnose(thresholds, chunk=3) == 10
+    assert [message["seq"] for message in backend.query(status="anormal")] == [5, 6, 7, 8, 9, 10]
+    backend.close()
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_alert_counts_match_full_rebuild(server, diagnosis, monkeypatch, vectorized):
+    import diagnosis as diagnosis_module
+    from aggregates import Aggregates
+
+    if not vectorized:
+        monkeypatch.setattr(diagnosis_module, "numpy", None)
+    for second in range(60):
+        post_frame(server, second, flies=second * 7 % 90, occupancy=second * 11 % 45)
+
+    for thresholds in ({"anormal_moscas": 30}, {"ocupacao_excessiva": 5, "anormal_ocupacao": 40}, DEFAULTS):
+        assert diagnosis.post("/api/diagnosis", json=thresholds).status_code == 200
+        rebuilt = Aggregates()
+        for message_data in server.messages_storage:
+            rebuilt.add(message_data)
+        assert server.aggregates.snapshot() == rebuilt.snapshot()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Exportação em streaming (GET /api/export): NDJSON paginado, CSV achatado e filtros"""
+import csv
+import io
+import json
+
+import pytest
+
+
+def post_batch(server, frames):
+    items = []
+    for second, device, flies, occupancy in frames:
+        lora_data = {"dt": "20112025", "hr": f"13:{second // 60:02d}:{second % 60:02d}", "ti": 120.5, "m": flies,
+                     "cm": 0.81, "op": occupancy, "dg": {"oe": occupancy > 20, "an": False}, "id": device}
+        items.append({"client_id": "gateway-exp", "message_id": second, "rssi": -80, "snr": 4.5,
+                      "lora_data": json.dumps(lora_data)})
+    response = server.app.test_client().post("/api/messages/batch", json=items)
+    assert response.status_code == 200
+    return [result["seq"] for result in response.get_json()["results"]]
+
+
+def export(server, query=""):
+    response = server.app.test_client().get(f"/api/export?{query}")
+    assert response.status_code == 200
+    return response
+
+
+def ndjson(server, query=""):
+    response = export(server, query)
+    assert response.mimetype == "application/x-ndjson"
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_ndjson_pages_cover_every_message(server, monkeypatch):
+    seqs = post_batch(server, [(second, f"LORA-{second % 2}", second, 5) for second in range(20)])
+    monkeypatch.setattr(server, "EXPORT_PAGE_SIZE", 7)
+    pages = []
+    select = server.messages_storage.select
+    monkeypatch.setattr(server.messages_storage, "select", lambda *args: pages.append(args) or select(*args))
+
+    exported = ndjson(server)
+    assert [message_data["seq"] for message_data in exported] == seqs
+    assert exported[3] == server.messages_storage.get(seqs[3])
+    # Páginas de até 7 mensagens com cursor de seq, até uma página vazia
+    assert [args[2] for args in pages] == [7] * 4
+    assert [args[0] for args in pages] == [-1, seqs[6], seqs[13], seqs[19]]
+
+
+def test_csv_flattens_groups(server):
+    seq, = post_batch(server, [(1, "LORA-CSV", 12, 25)])
+    response = export(server, "format=csv")
+    assert response.mimetype == "text/csv"
+    assert "attachment" in response.headers["Content-Disposition"]
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert list(rows[0]) == [key if group is None else f"{group}_{key}" for group, key in server.EXPORT_CSV_FIELDS]
+    row, = rows
+    assert row["seq"] == str(seq)
+    assert row["lora_id"] == "LORA-CSV"
+    assert row["gateway_id"] == "gateway-exp"
+    assert row["deteccoes_total"] == "12"
+    assert row["deteccoes_ocupacao_pct"] == "25"
+    assert row["diagnostico_ocupacao_excessiva"] == "true"
+    assert row["diagnostico_anormal"] == "false"
+    assert row["diagnostico_servidor_ocupacao_excessiva"] == "true"
+    assert row["snr"] == "4.5"
+    assert row["source_ip"] == "127.0.0.1"
+
+    # Campos e grupos ausentes (mensagens antigas) viram células vazias
+    cells = dict(zip(rows[0], server.export_row({"seq": 9, "deteccoes": {"total": 2}, "diagnostico": None})))
+    assert (cells["seq"], cells["deteccoes_total"], cells["deteccoes_ocupacao_pct"], cells["diagnostico_anormal"]) == (9, 2, "", "")
+
+
+def test_filtered_export(server):
+    seqs = post_batch(server, [
+        (1, "LORA-A", 3, 5), (2, "LORA-B", 60, 5), (3, "LORA-A", 4, 25), (70, "LORA-A", 2, 5)
+    ])
+    assert [message_data["seq"] for message_data in ndjson(server, "device=LORA-A")] == [seqs[0], seqs[2], seqs[3]]
+    assert [message_data["seq"] for message_data in ndjson(server, "status=anormal")] == [seqs[1]]
+    assert [message_data["seq"] for message_data in ndjson(server, "status=alerta&device=LORA-A")] == [seqs[2]]
+    window = "from=2025-11-20 13:00:02&to=2025-11-20 13:00:59"
+    assert [message_data["seq"] for message_data in ndjson(server, window)] == seqs[1:3]
+    rows = list(csv.DictReader(io.StringIO(export(server, f"format=csv&device=LORA-A&{window}").get_data(as_text=True))))
+    assert [int(row["seq"]) for row in rows] == [seqs[2]]
+
+
+@pytest.mark.parametrize("query", ["format=xml", "status=talvez", "from=ontem"])
+def test_invalid_parameters(server, query):
+    assert server.app.test_client().get(f"/api/export?{query}").status_code == 400
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""setup_logging: handlers de outro código no logger raiz são preservados"""
+import io
+import logging
+
+import pytest
+
+import log_pipeline
+
+
+@pytest.fixture
+def root():
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    yield root
+    log_pipeline.shutdown()
+    root.handlers = saved_handlers
+    root.setLevel(saved_level)
+
+
+def empty(root):
+    # O pytest instala seus handlers no início de cada teste, depois das fixtures
+    root.handlers = []
+
+
+def test_keeps_foreign_handlers(root):
+    empty(root)
+    foreign = logging.StreamHandler(io.StringIO())
+    root.addHandler(foreign)
+    root.setLevel(logging.DEBUG)
+
+    assert log_pipeline.setup_logging("WARNING") is False
+    assert root.handlers == [foreign]
+    assert root.level == logging.DEBUG
+
+
+def test_installs_queue_when_root_is_empty(root):
+    empty(root)
+    output = io.StringIO()
+    assert log_pipeline.setup_logging("INFO", stream=output) is True
+    assert len(root.handlers) == 1
+    logging.getLogger("teste").info("%s moscas", 7)
+    log_pipeline.shutdown()
+    assert output.getvalue().endswith("INFO - 7 moscas\n")
+
+
+def test_reconfigure_replaces_only_own_handlers(root):
+    empty(root)
+    assert log_pipeline.setup_logging("INFO", stream=io.StringIO()) is True
+    foreign = logging.NullHandler()
+    root.addHandler(foreign)
+
+    # Com um handler de outro código já presente, o da fila sai e o outro fica
+    assert log_pipeline.setup_logging("INFO", queue_size=0) is False
+    assert root.handlers == [foreign]
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Codec binário do frame LoRa: round-trip, equivalência com o JSON e frames inválidos"""
+import base64
+import json
+import random
+
+import pytest
+
+import lora_codec
+
+DEVICE_TABLE = [f"LORA-{index:03d}" for index in range(1, 201)]
+
+
+def make_compact(rng, dt=None, hr=None):
+    return {
+        "dt": dt or f"{rng.randint(1, 28):02d}{rng.randint(1, 12):02d}{rng.randint(2000, 2100)}",
+        "hr": hr or f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}",
+        "ti": rng.randint(0, 70000),
+        "m": rng.randint(0, 300),
+        "cm": round(rng.uniform(0.5, 1), 3),
+        "cmin": round(rng.uniform(0.3, 0.6), 3),
+        "cmax": round(rng.uniform(0.8, 1), 3),
+        "op": round(rng.uniform(0, 100), 2),
+        "dg": {"oe": rng.random() < 0.3, "an": rng.random() < 0.1},
+        "id": rng.choice(DEVICE_TABLE + ["trap_eye_01", "armadilha-ção"])
+    }
+
+
+def envelope(lora_data):
+    return {"client_id": "gateway-pico", "message_id": 1, "lora_data": lora_data, "rssi": -57, "snr": 9}
+
+
+@pytest.fixture
+def frames():
+    rng = random.Random(42)
+    return [make_compact(rng) for _ in range(500)]
+
+
+@pytest.mark.parametrize("table", [None, DEVICE_TABLE])
+def test_round_trip(frames, table):
+    for compact in frames:
+        assert lora_codec.decode(lora_codec.encode(compact, table), table) == compact
+
+
+@pytest.mark.parametrize("dt, hr", [
+    ("01012000", "00:00:00"),
+    ("31122099", "23:59:59"),
+    ("29022024", "12:00:00"),
+    ("01032024", "00:00:01"),
+    ("07022136", "06:28:15"),  # último segundo representável em uint32
+])
+def test_round_trip_date_edges(dt, hr):
+    compact = make_compact(random.Random(1), dt, hr)
+    assert lora_codec.decode(lora_codec.encode(compact)) == compact
+
+
+def test_date_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(lora_codec, "_dates", {})
+    monkeypatch.setattr(lora_codec, "_DATES_MAX", 10)
+    rng = random.Random(7)
+    for _ in range(50):
+        compact = make_compact(rng)
+        assert lora_codec.decode(lora_codec.encode(compact)) == compact
+    assert len(lora_codec._dates) <= 10
+
+
+def test_binary_expands_like_json(server, frames, monkeypatch):
+    monkeypatch.setattr(server, "LORA_DEVICE_TABLE", DEVICE_TABLE)
+    for compact in frames:
+        expected = server.expand_lora_payload(envelope(json.dumps(compact)))
+        encoded = base64.b64encode(lora_codec.encode(compact)).decode()
+        assert server.expand_lora_payload(envelope(encoded)) == expected
+        assert server.expand_lora_payload(envelope(lora_codec.encode(compact, DEVICE_TABLE))) == expected
+
+
+def test_invalid_frames():
+    frame = lora_codec.encode(make_compact(random.Random(3)), DEVICE_TABLE)
+    with pytest.raises(lora_codec.LoraCodecError):
+        lora_codec.decode(frame[:10], DEVICE_TABLE)
+    with pytest.raises(lora_codec.LoraCodecError):
+        lora_codec.decode(frame[:-1] + b"\x80", DEVICE_TABLE)
+    with pytest.raises(lora_codec.LoraCodecError):
+        lora_codec.decode(bytes([0x20]) + frame[1:], DEVICE_TABLE)
+    with pytest.raises(lora_codec.LoraCodecError):
+        lora_codec.decode(frame)
+    with pytest.raises(lora_codec.LoraCodecError):
+        lora_codec.encode({"dt": "31022024", "hr": "00:00:00"})
+    with pytest.raises(lora_codec.LoraCodecError):
+        lora_codec.encode({"dt": "01011999", "hr": "00:00:00"})
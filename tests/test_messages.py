@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Leitura incremental (GET /api/messages): cursores since/before, limit e next_since"""
+import json
+
+import pytest
+
+
+@pytest.fixture
+def seqs(server):
+    items = []
+    for second in range(10):
+        lora_data = {"dt": "20112025", "hr": f"17:00:{second:02d}", "m": second, "op": 1, "id": "LORA-CUR"}
+        items.append({"client_id": "gateway-cur", "message_id": second, "lora_data": json.dumps(lora_data)})
+    response = server.app.test_client().post("/api/messages/batch", json=items)
+    return [result["seq"] for result in response.get_json()["results"]]
+
+
+def get(server, query=""):
+    response = server.app.test_client().get(f"/api/messages?{query}")
+    assert response.status_code == 200
+    body = response.get_json()
+    return [message["seq"] for message in body["messages"]], body
+
+
+def test_without_parameters_returns_everything(server, seqs):
+    listed, body = get(server)
+    assert listed == seqs
+    assert (body["count"], body["first_seq"], body["last_seq"], body["next_since"]) == (10, seqs[0], seqs[-1], seqs[-1])
+
+
+def test_polling_with_next_since(server, seqs):
+    listed, body = get(server, f"since={seqs[0] - 1}&limit=4")
+    assert listed == seqs[:4]
+    cursor = body["next_since"]
+    assert cursor == seqs[3]
+
+    pages = [listed]
+    while True:
+        listed, body = get(server, f"since={cursor}&limit=4")
+        if not listed:
+            break
+        pages.append(listed)
+        cursor = body["next_since"]
+    assert [len(page) for page in pages] == [4, 4, 2]
+    assert sum(pages, []) == seqs
+    # Sem novidades: o cursor volta igual
+    assert body["next_since"] == seqs[-1]
+    assert body["count"] == 0
+
+
+def test_limit_and_before(server, seqs):
+    assert get(server, "limit=3")[0] == seqs[-3:]
+    assert get(server, f"before={seqs[5]}&limit=2")[0] == seqs[3:5]
+    assert get(server, f"before={seqs[5]}")[0] == seqs[:5]
+    assert get(server, f"since={seqs[2]}&before={seqs[6]}")[0] == seqs[3:6]
+    assert get(server, f"since={seqs[2]}&before={seqs[6]}&limit=2")[0] == seqs[3:5]
+    assert get(server, "limit=0")[0] == []
+    assert get(server, f"since={seqs[-1] + 100}")[0] == []
+
+
+def test_negative_limit_is_rejected(server, seqs):
+    response = server.app.test_client().get("/api/messages?limit=-1")
+    assert response.status_code == 400
+    assert response.get_json()["success"] is False
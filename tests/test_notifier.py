@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Alertas do Telegram contra a Bot API local (benchmarks/telegram_stub.py)"""
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from telegram_stub import frame, start_stub, wait_for  # noqa: E402
+
+from notifier import TelegramNotifier  # noqa: E402
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(fail=0, status=500):
+        server = start_stub(fail, status)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def notifier_for(server, **options):
+    return TelegramNotifier("teste", 42, f"http://127.0.0.1:{server.server_port}", **options)
+
+
+def test_coalesces_repeats_and_sends_worsening_at_once(stub):
+    server = stub()
+    notifier = notifier_for(server, window=0.5, backoff=0.05)
+    started = time.perf_counter()
+    for second in range(20):
+        assert notifier.notify(frame("LORA-001", 30 + second, 25.0, "alerta", second))
+    assert notifier.notify(frame("LORA-001", 60, 35.0, "anormal", 20))
+    assert not notifier.notify(frame("LORA-002", 1, 1.0, "normal", 21))
+    # A ingestão só enfileira
+    assert time.perf_counter() - started < 0.05
+
+    assert wait_for(lambda: len(server.messages) >= 3, timeout=3)
+    texts = [message["text"] for message in server.messages]
+    assert len(texts) == 3
+    assert texts[1].startswith("🔴 ANORMAL")
+    assert "mais 19 alerta(s)" in texts[2]
+    assert all(message["chat_id"] == 42 for message in server.messages)
+    assert len(server.connections) == 1
+    notifier.close()
+    assert notifier.stats()["coalesced"] == 19
+
+
+@pytest.mark.parametrize("status", [500, 429])
+def test_retries_until_delivered(stub, status):
+    server = stub(fail=2, status=status)
+    notifier = notifier_for(server, window=60, backoff=0.05)
+    notifier.notify(frame("LORA-003", 70, 40.0, "anormal", 0))
+    assert wait_for(lambda: len(server.messages) == 1)
+    stats = notifier.stats()
+    assert stats["retries"] == 2
+    assert stats["sent"] == 1
+    notifier.close()
+
+
+def test_drops_alert_when_api_is_down(stub):
+    server = stub()
+    port = server.server_port
+    server.shutdown()
+    server.server_close()
+    notifier = TelegramNotifier("teste", 42, f"http://127.0.0.1:{port}", window=60, max_retries=2, backoff=0.01)
+    notifier.notify(frame("LORA-004", 70, 40.0, "anormal", 0))
+    assert wait_for(lambda: notifier.stats()["failed"] == 1)
+    assert notifier.stats()["retries"] == 2
+    notifier.close()
+
+
+def test_full_queue_drops_without_blocking(stub):
+    server = stub()
+    port = server.server_port
+    server.shutdown()
+    server.server_close()
+    notifier = TelegramNotifier("teste", 42, f"http://127.0.0.1:{port}", queue_size=5, max_retries=50, backoff=1)
+    started = time.perf_counter()
+    results = [notifier.notify(frame(f"LORA-{second:03d}", 70, 40.0, "anormal", second)) for second in range(50)]
+    assert time.perf_counter() - started < 0.5
+    stats = notifier.stats()
+    assert stats["dropped"] == results.count(False) > 0
+    # Abandonar as tentativas restantes (backoff de até 50 s) antes de encerrar
+    notifier._stopping.set()
+    notifier.close(timeout=2)
+    assert not notifier._thread.is_alive()
+    assert notifier.stats()["pending"] == 0
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""Backends JSON (orjson, msgspec, json): mesma saída para os mesmos valores"""
+from datetime import date, datetime, time
+
+import pytest
+
+import payload_codec
+
+VALUE = {
+    "start_time": datetime(2025, 11, 20, 10, 0, 5, 123),
+    "midnight": datetime(2025, 11, 21),
+    "day": date(2025, 1, 2),
+    "hour": time(1, 2, 3),
+    "text": "ocupação",
+    "values": [1, 2.5, None, True]
+}
+
+EXPECTED = (
+    '{"start_time":"2025-11-20T10:00:05.000123","midnight":"2025-11-21T00:00:00",'
+    '"day":"2025-01-02","hour":"01:02:03","text":"ocupação","values":[1,2.5,null,true]}'
+).encode("utf-8")
+
+
+@pytest.fixture(params=payload_codec.available_backends())
+def backend(request):
+    previous = payload_codec.BACKEND
+    yield payload_codec.set_backend(request.param)
+    payload_codec.set_backend(previous)
+
+
+def test_dumps_same_bytes_in_every_backend(backend):
+    assert payload_codec.dumps(VALUE) == EXPECTED
+
+
+def test_dumps_rejects_unknown_types(backend):
+    with pytest.raises(TypeError):
+        payload_codec.dumps({"value": object()})
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Limite de taxa: lotes maiores que o burst e lotes com vários gateways"""
+import json
+
+import pytest
+
+from rate_limit import RateLimiter
+
+
+def test_cost_above_burst_is_not_capped():
+    limiter = RateLimiter(rate=1, burst=5)
+    assert limiter.acquire("gateway:a", 50) > 0
+    # O balde continua cheio: a recusa não consumiu fichas
+    assert limiter.acquire("gateway:a", 5) == 0
+
+
+def test_acquire_up_to_grants_available_tokens():
+    limiter = RateLimiter(rate=10, burst=5)
+    granted, wait = limiter.acquire_up_to("gateway:a", 8)
+    assert granted == 5
+    assert wait == pytest.approx(0.3, abs=0.01)
+    assert limiter.acquire_up_to("gateway:b", 3) == (3, 0)
+
+
+@pytest.fixture
+def limited(server, monkeypatch):
+    monkeypatch.setattr(server, "rate_limiter", RateLimiter(rate=0.01, burst=5))
+    return server
+
+
+def item(gateway, message_id):
+    lora_data = {"dt": "20112025", "hr": f"13:00:{message_id:02d}", "m": 3, "op": 1, "id": f"LORA-{gateway}"}
+    return {"client_id": gateway, "message_id": message_id, "lora_data": json.dumps(lora_data)}
+
+
+def post_batch(server, items):
+    return server.app.test_client().post("/api/messages/batch", json=items)
+
+
+def test_batch_charges_each_gateway_its_own_items(limited):
+    items = [item("gw-a", index) for index in range(8)] + [item("gw-b", index) for index in range(3)]
+    response = post_batch(limited, items)
+    body = response.get_json()
+
+    assert response.status_code == 200
+    assert body["stored"] == 5 + 3
+    assert body["rate_limited"] == 3
+    assert [result["index"] for result in body["results"] if "retry_after" in result] == [5, 6, 7]
+    assert int(response.headers["Retry-After"]) == body["retry_after"] >= 1
+
+    # gw-b gastou só as suas 3 fichas; gw-a está sem fichas
+    assert post_batch(limited, [item("gw-b", 10), item("gw-b", 11)]).get_json()["stored"] == 2
+    response = post_batch(limited, [item("gw-a", 20)])
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+
+
+def test_batch_larger_than_burst_is_partially_admitted(limited):
+    response = post_batch(limited, [item("gw-c", index) for index in range(20)])
+    body = response.get_json()
+    assert body["stored"] == 5
+    assert body["rate_limited"] == 15
+    assert body["success"] is False
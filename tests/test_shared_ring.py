@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Sincronização com o anel compartilhado (SHM_RING_NAME) quando o worker fica para trás"""
+import json
+import os
+
+import pytest
+
+from shm_ring import SharedRing
+
+
+@pytest.fixture
+def shared(server, monkeypatch):
+    ring = SharedRing(
+        f"trapeyes-test-{os.getpid()}",
+        capacity=server.messages_storage.maxlen,
+        slot_bytes=server.SHM_SLOT_BYTES,
+        version=server.PACK_VERSION,
+        counters=("total_messages", "errors"),
+        next_seq=server.messages_storage.next_seq
+    )
+    monkeypatch.setattr(server, "ring", ring)
+    monkeypatch.setattr(server, "shared_floor_seq", None)
+    yield ring
+    ring.close()
+    ring.unlink()
+
+
+def post_frame(server, second):
+    lora_data = {"dt": "20112025", "hr": f"12:{second // 60 % 60:02d}:{second % 60:02d}", "m": 5, "op": 2, "id": "LORA-SHM"}
+    response = server.app.test_client().post("/api/messages", json={
+        "client_id": "gateway-shm", "message_id": second, "lora_data": json.dumps(lora_data)
+    })
+    assert response.status_code == 200
+
+
+def test_worker_behind_ring_relearns_only_stored_frames(server, shared):
+    for second in range(10):
+        post_frame(server, second)
+    assert server.anomalies.baseline("LORA-SHM")["frames"] == 10
+
+    # Outro worker grava mais que a capacidade do anel enquanto este não sincroniza
+    template = server.messages_storage.range()[-1]
+    capacity = server.messages_storage.maxlen
+    payloads = []
+    for second in range(capacity + 5):
+        message_data = dict(template, timestamp=f"2025-11-21 {second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}")
+        payloads.append(server.messages_storage.pack_message(message_data))
+    for start in range(0, len(payloads), 100):
+        shared.append(payloads[start:start + 100])
+
+    server.sync_shared_storage()
+    assert len(server.messages_storage) == capacity
+    assert server.anomalies.baseline("LORA-SHM")["frames"] == capacity
+    stored_keys = {key for message_data in server.messages_storage.range() for key in server.message_keys(message_data)}
+    assert len(server.dedup) == len(stored_keys)
+    assert server.aggregates.snapshot()["global"]["captures"] == capacity
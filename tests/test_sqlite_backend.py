@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Histórico em SQLite (SQLITE_PATH): consultas, limpeza e o cache em memória na frente do banco"""
+import json
+import threading
+
+import pytest
+
+from diagnosis import Thresholds
+from sqlite_backend import SQLiteBackend
+from storage import parse_timestamp
+
+
+def post_frame(server, second, device="LORA-SQL", flies=3):
+    lora_data = {"dt": "20112025", "hr": f"09:{second // 60 % 60:02d}:{second % 60:02d}", "m": flies, "op": 2, "id": device}
+    response = server.app.test_client().post("/api/messages", json={
+        "client_id": "gateway-sql", "message_id": second, "lora_data": json.dumps(lora_data)
+    })
+    assert response.status_code == 200
+    return response.get_json()["seq"]
+
+
+@pytest.fixture
+def sqlite(server, monkeypatch, tmp_path):
+    # Lotes gravados só depois de 5 s sem escritas: o que foi recebido fica pendente durante o teste
+    backend = SQLiteBackend(str(tmp_path / "historico.db"), flush_interval=5)
+    monkeypatch.setattr(server, "backend", backend)
+    yield backend
+    backend.close()
+
+
+def seqs(response):
+    assert response.status_code == 200
+    return [message["seq"] for message in response.get_json()["messages"]]
+
+
+def test_filtered_get_reads_own_writes(server, sqlite):
+    seq = post_frame(server, 1, device="LORA-X")
+    client = server.app.test_client()
+    # As mais recentes já estão no cache: respondido sem esperar o banco gravar
+    assert seqs(client.get("/api/messages?device=LORA-X&limit=1")) == [seq]
+    assert sqlite.stats()["written"] == 0
+    for query in ("device=LORA-X", "from=2025-11-20", "status=normal", "gateway=gateway-sql&to=2025-11-20"):
+        assert seqs(client.get(f"/api/messages?{query}")) == [seq]
+
+
+def test_history_older_than_cache_comes_from_sqlite(server, sqlite):
+    capacity = server.messages_storage.maxlen
+    old = [post_frame(server, second, device="LORA-OLD") for second in range(5)]
+    recent = [post_frame(server, second) for second in range(5, capacity + 5)]
+    assert server.messages_storage.first_seq == recent[0]
+    client = server.app.test_client()
+
+    assert seqs(client.get("/api/messages?device=LORA-OLD")) == old
+    # Cursores que atravessam o início do cache: banco e memória, sem lacunas nem repetições
+    assert seqs(client.get(f"/api/messages?since={old[0]}&limit=10")) == old[1:] + recent[:6]
+    assert seqs(client.get(f"/api/messages?before={recent[3]}&limit=6")) == old[2:] + recent[:3]
+    assert seqs(client.get("/api/messages?from=2025-11-20&limit=7")) == recent[-7:]
+    assert seqs(client.get(f"/api/messages?from=2025-11-20&before={recent[2]}")) == old + recent[:2]
+
+
+def row(seq, device, gateway, second, flies=3, excessive=False, abnormal=False):
+    return {
+        "seq": seq, "timestamp": f"2025-11-20 10:00:{second:02d}", "lora_id": device, "gateway_id": gateway,
+        "deteccoes": {"total": flies, "ocupacao_pct": 1},
+        "diagnostico": {"ocupacao_excessiva": excessive, "anormal": abnormal}
+    }
+
+
+@pytest.fixture
+def history(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "historico.db"))
+    backend.write([
+        row(1, "LORA-1", "gw-a", 1),
+        row(2, "LORA-2", "gw-a", 2, excessive=True),
+        row(3, "LORA-1", "gw-b", 3, abnormal=True),
+        row(4, "LORA-1", "gw-a", 4, excessive=True, abnormal=True),
+        row(5, "LORA-2", "gw-b", 5)
+    ])
+    # diagnostico_servidor, quando presente, vale mais que o do dispositivo
+    backend.write([dict(row(6, "LORA-2", "gw-a", 6, abnormal=True), diagnostico_servidor={"ocupacao_excessiva": False, "anormal": False})])
+    backend.flush()
+    yield backend
+    backend.close()
+
+
+def parse(hour):
+    return parse_timestamp(f"2025-11-20 {hour}")
+
+
+def query_seqs(backend, **filters):
+    return [message["seq"] for message in backend.query(**filters)]
+
+
+def test_query_filters(history):
+    start = parse("10:00:02")
+    assert query_seqs(history, device="LORA-1") == [1, 3, 4]
+    assert query_seqs(history, gateway="gw-b") == [3, 5]
+    assert query_seqs(history, device="LORA-1", gateway="gw-a") == [1, 4]
+    assert query_seqs(history, start=start, end=parse("10:00:04")) == [2, 3, 4]
+    assert query_seqs(history, status="anormal") == [3, 4]
+    assert query_seqs(history, status="alerta") == [2]
+    assert query_seqs(history, status="normal") == [1, 5, 6]
+    assert query_seqs(history, since=2, before=6, device="LORA-1") == [3, 4]
+    message = history.query(since=5, limit=1)[0]
+    assert message["seq"] == 6
+    assert message["diagnostico_servidor"] == {"ocupacao_excessiva": False, "anormal": False}
+
+
+def test_query_limit_without_since_returns_newest_in_order(history):
+    assert query_seqs(history, limit=2) == [5, 6]
+    assert query_seqs(history, device="LORA-1", limit=2) == [3, 4]
+    assert query_seqs(history, before=5, limit=3) == [2, 3, 4]
+    # Com since, as primeiras depois do cursor
+    assert query_seqs(history, since=1, limit=2) == [2, 3]
+    assert query_seqs(history, limit=0) == []
+    assert [message["seq"] for message in history.last(3)] == [4, 5, 6]
+
+
+def test_clear_waits_for_pending_writes(history):
+    history.write([row(7, "LORA-3", "gw-c", 7)])
+    history.clear()
+    assert history.query() == []
+    assert history.max_seq() is None
+    history.write([row(8, "LORA-3", "gw-c", 8)])
+    history.flush()
+    assert query_seqs(history) == [8]
+
+
+def test_rediagnose_runs_in_chunks_on_writer_thread(history, monkeypatch):
+    calls = []
+    run = history._run
+
+    def traced_run(function):
+        def traced(connection):
+            statements = []
+            connection.set_trace_callback(statements.append)
+            try:
+                return function(connection)
+            finally:
+                connection.set_trace_callback(None)
+                calls.append((threading.current_thread().name, statements))
+        return run(traced)
+
+    monkeypatch.setattr(history, "_run", traced_run)
+    # Enfileirada antes da regravação: gravada antes dela, na mesma fila
+    history.write([row(seq, "LORA-4", "gw-d", seq % 60, flies=seq) for seq in range(7, 26)])
+    thresholds = Thresholds(ocupacao_excessiva=20, anormal_ocupacao=30, anormal_moscas=20)
+    assert history.rediagnose(thresholds, chunk=10) == 25
+
+    (thread_name, statements), = calls
+    assert thread_name == "sqlite-writer"
+    assert sum(statement.lstrip().startswith("UPDATE") for statement in statements) == 3
+    assert query_seqs(history, status="anormal") == list(range(21, 26))
+    assert query_seqs(history, status="alerta") == []
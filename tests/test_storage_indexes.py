@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Índices do MessageStore: horário (from/to) e listas de seqs por dispositivo, gateway e status"""
+import json
+import random
+
+import pytest
+
+from sqlite_backend import SQLiteBackend
+from storage import MessageStore, parse_timestamp
+
+
+def message(second, device="LORA-1", gateway="gateway-1", flies=3, abnormal=False):
+    return {
+        "timestamp": f"2025-11-20 {second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}",
+        "lora_id": device,
+        "gateway_id": gateway,
+        "deteccoes": {"total": flies, "ocupacao_pct": 1.5},
+        "diagnostico": {"ocupacao_excessiva": False, "anormal": abnormal}
+    }
+
+
+def seconds(text):
+    return parse_timestamp(f"2025-11-20 {text}")
+
+
+@pytest.fixture
+def sqlite(server, monkeypatch, tmp_path):
+    """SQLite configurado, mas sem consultas: o que está no cache vem dos índices em memória"""
+    backend = SQLiteBackend(str(tmp_path / "historico.db"))
+    monkeypatch.setattr(server, "backend", backend)
+    queries = []
+    query = backend.query
+    # Argumentos posicionais, como em app.query_messages
+    monkeypatch.setattr(backend, "query", lambda *args: queries.append(args) or query(*args))
+    yield queries
+    backend.close()
+
+
+def assert_history_only(server, queries):
+    """Nenhuma consulta ao SQLite (since, before, ...) alcança os seqs do cache em memória"""
+    first_seq = server.messages_storage.first_seq
+    assert all(args[1] is not None and args[1] <= first_seq for args in queries)
+
+
+def post_frame(server, second, hour, device="LORA-IDX", flies=2):
+    lora_data = {"dt": "20112025", "hr": hour, "m": flies, "op": 1, "id": device}
+    response = server.app.test_client().post("/api/messages", json={
+        "client_id": "gateway-idx", "message_id": second, "lora_data": json.dumps(lora_data)
+    })
+    assert response.status_code == 200
+    return response.get_json()["seq"]
+
+
+def test_late_frames_found_by_time_range():
+    store = MessageStore(200)
+    # Frames atrasados (gateway que reenviou a fila) chegam depois de horários mais recentes
+    moments = list(range(100))
+    random.Random(7).shuffle(moments)
+    for second in moments:
+        store.append(message(second))
+
+    selected = store.select(start=seconds("00:00:10"), end=seconds("00:00:19"))
+    expected = [seq for seq, second in enumerate(moments, start=1) if 10 <= second <= 19]
+    assert [message_data["seq"] for message_data in selected] == expected
+    assert sorted(message_data["timestamp"][-2:] for message_data in selected) == [f"{second:02d}" for second in range(10, 20)]
+    assert list(store._data.time_index) == sorted(store._data.time_index)
+
+    # Cursores e limit sobre o resultado em ordem de seq
+    assert store.select(since=expected[2], start=seconds("00:00:10"), end=seconds("00:00:19"), limit=2) == \
+        [store.get(seq) for seq in expected[3:5]]
+    assert store.select(start=seconds("00:00:10"), end=seconds("00:00:19"), limit=3) == \
+        [store.get(seq) for seq in expected[-3:]]
+
+
+def test_late_frame_in_route(server, sqlite):
+    for second, hour in enumerate(("12:00:00", "12:30:00", "08:15:00", "12:45:00")):
+        post_frame(server, second, hour)
+    client = server.app.test_client()
+    listed = client.get("/api/messages?from=2025-11-20 08:00:00&to=2025-11-20 12:00:00&limit=10").get_json()["messages"]
+    assert [message_data["timestamp"] for message_data in listed] == ["2025-11-20 12:00:00", "2025-11-20 08:15:00"]
+    # Com SQLITE_PATH, o banco só é consultado pelos seqs anteriores ao cache
+    assert_history_only(server, sqlite)
+
+
+def test_evicted_messages_leave_postings():
+    store = MessageStore(50)
+    store.extend([message(second, device="LORA-OLD", gateway="gateway-old", abnormal=True) for second in range(5)])
+    store.extend([message(second, device=f"LORA-{second % 4}") for second in range(5, 55)])
+
+    # Despejadas: ignoradas na leitura mesmo antes da reconstrução dos índices
+    assert store.select(device="LORA-OLD") == []
+    assert store.select(gateway="gateway-old") == []
+    assert store.select(status="anormal") == []
+    assert [message_data["seq"] for message_data in store.select(device="LORA-1")] == \
+        [seq for seq in range(store.first_seq, store.last_seq + 1) if (seq - 1) % 4 == 1]
+
+    # Despejos acima de _MIN_STALE_KEYS reconstroem os índices sem as entradas obsoletas
+    store.extend([message(55 + second % 3600, device="LORA-NEW") for second in range(1100)])
+    postings = store._data.postings
+    assert ("status", "anormal") not in postings
+    assert all(key[1] != store._strings.find("LORA-OLD") for key in postings if key[0] == "device")
+    assert len(store._data.time_index) < 1100
+    assert [message_data["seq"] for message_data in store.select(device="LORA-NEW")] == \
+        list(range(store.first_seq, store.last_seq + 1))
+
+
+def test_delete_resets_indexes(server, sqlite):
+    for second in range(5):
+        post_frame(server, second, f"10:00:{second:02d}", device="LORA-DEL", flies=80)
+    client = server.app.test_client()
+    assert client.get("/api/messages?status=anormal&limit=10").get_json()["count"] == 5
+    assert client.delete("/api/messages").status_code == 200
+
+    data = server.messages_storage._data
+    assert data.postings == {}
+    assert len(data.time_index) == 0
+    for query in ("device=LORA-DEL", "status=anormal", "from=2025-11-20"):
+        assert client.get(f"/api/messages?{query}&limit=10").get_json()["count"] == 0
+
+    sqlite.clear()
+    seq = post_frame(server, 10, "11:00:00", device="LORA-DEL", flies=80)
+    for query in ("device=LORA-DEL", "gateway=gateway-idx", "status=anormal", "from=2025-11-20 11:00:00"):
+        listed = client.get(f"/api/messages?{query}&limit=10").get_json()["messages"]
+        assert [message_data["seq"] for message_data in listed] == [seq]
+    # status=anormal no cache: lista de seqs em memória, não o json_extract do SQLite
+    assert_history_only(server, sqlite)
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""Escritas e leituras concorrentes no armazenamento (cenário de benchmarks/stress_store.py)"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+import stress_store  # noqa: E402
+
+
+@pytest.mark.parametrize("writers, readers", [(4, 4), (8, 2)])
+def test_concurrent_ingest_and_reads(server, writers, readers):
+    checks = stress_store.run(seconds=1.5, writers=writers, readers=readers)
+    failed = [f"{name}: {detail}" for name, ok, detail in checks if not ok]
+    assert not failed
+    assert len(server.messages_storage) == server.messages_storage.maxlen
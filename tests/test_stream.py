@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""Stream SSE (GET /api/stream): retomada por Last-Event-ID, lacunas e agregados"""
+import json
+import threading
+import time
+
+import pytest
+
+
+def post_frame(server, second, device="LORA-9", flies=6):
+    lora_data = {"dt": "20112025", "hr": f"10:{second // 60:02d}:{second % 60:02d}", "m": flies, "op": 3, "id": device}
+    response = server.app.test_client().post("/api/messages", json={
+        "client_id": "gateway-teste", "message_id": second, "lora_data": json.dumps(lora_data)
+    })
+    assert response.status_code == 200
+    return response.get_json()["seq"]
+
+
+def parse_events(chunks):
+    """(evento, dados) de cada bloco SSE, ignorando o retry inicial"""
+    events = []
+    for chunk in chunks:
+        for block in chunk.strip().split("\n\n"):
+            fields = dict(line.split(": ", 1) for line in block.split("\n") if ": " in line)
+            if "event" in fields:
+                events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+class StreamReader:
+    """Consome o gerador do stream numa thread, como o servidor WSGI faria"""
+
+    def __init__(self, generator):
+        self.chunks = []
+        self._generator = generator
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        for chunk in self._generator:
+            self.chunks.append(chunk)
+            if self._stop.is_set():
+                break
+        self._generator.close()
+
+    def events(self, name=None):
+        return [data for event, data in parse_events(list(self.chunks)) if name is None or event == name]
+
+    def wait_for(self, condition, timeout=3):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(2)
+
+
+@pytest.fixture
+def stream(server, monkeypatch):
+    monkeypatch.setattr(server, "STREAM_AGGREGATES_SECONDS", 0.1)
+    monkeypatch.setattr(server, "STREAM_KEEPALIVE_SECONDS", 15)
+    readers = []
+
+    def open_stream(last_event_id=None):
+        reader = StreamReader(server.stream_events(server.stream_cursor(last_event_id)))
+        readers.append(reader)
+        return reader
+
+    yield open_stream
+    for reader in readers:
+        reader.close()
+
+
+def test_resume_after_delete_waits_for_new_messages(server, stream, monkeypatch):
+    for second in range(3):
+        post_frame(server, second)
+    server.app.test_client().delete("/api/messages")
+
+    reads = []
+    storage_range = server.messages_storage.range
+    monkeypatch.setattr(server.messages_storage, "range", lambda *args, **kwargs: reads.append(1) or storage_range(*args, **kwargs))
+
+    # Cliente reconecta com um id cujas mensagens seguintes foram apagadas: o stream espera, sem girar
+    reader = stream("1")
+    time.sleep(0.5)
+    assert len(reads) < 20
+    assert reader.events("stats") == []
+
+    seq = post_frame(server, 10)
+    assert reader.wait_for(lambda: [m["seq"] for m in reader.events("message")] == [seq])
+
+
+def test_resume_skips_evicted_messages(server, stream):
+    capacity = server.messages_storage.maxlen
+    first = post_frame(server, 0)
+    for second in range(1, capacity + 5):
+        post_frame(server, second)
+
+    reader = stream(str(first))
+    assert reader.wait_for(lambda: len(reader.events("message")) == capacity)
+    assert reader.events("message")[0]["seq"] == server.messages_storage.first_seq
+
+
+def test_resume_with_id_ahead_of_server(server, stream):
+    # Servidor reiniciado sem WAL: o navegador ainda envia o último id antigo
+    reader = stream(str(server.broker.last_seq + 500))
+    seq = post_frame(server, 20)
+    assert reader.wait_for(lambda: [m["seq"] for m in reader.events("message")] == [seq])
+
+
+def test_aggregates_sent_during_steady_ingest(server, stream):
+    reader = stream()
+    for second in range(30):
+        post_frame(server, 100 + second, device=f"LORA-{second % 3}")
+        time.sleep(0.02)
+    assert reader.wait_for(lambda: len(reader.events("aggregates")) >= 3)
+
+    deltas = reader.events("aggregates")
+    assert deltas[0]["full"] is True
+    assert all(delta["full"] is False for delta in deltas[1:])
+    assert reader.events("stats") == []
+
+    # Aplicar as alterações, como o dashboard, reproduz /api/aggregates
+    reader.wait_for(lambda: reader.events("aggregates")[-1]["global"]["captures"] == 30)
+    state = {"devices": {}, "hourly": {}}
+    for delta in reader.events("aggregates"):
+        state["global"] = delta["global"]
+        for key, removed in (("devices", "removed_devices"), ("hourly", "removed_hours")):
+            state[key].update(delta[key])
+            for name in delta[removed]:
+                del state[key][name]
+    expected = server.app.test_client().get("/api/aggregates").get_json()["aggregates"]
+    assert state == expected
+
+
+@pytest.fixture
+def json_codec():
+    """Backend json da biblioteca padrão (imagem Docker sem orjson/msgspec)"""
+    import payload_codec
+
+    previous = payload_codec.BACKEND
+    payload_codec.set_backend("json")
+    yield
+    payload_codec.set_backend(previous)
+
+
+def test_stats_keepalive_with_stdlib_json(server, stream, json_codec, monkeypatch):
+    monkeypatch.setattr(server, "STREAM_KEEPALIVE_SECONDS", 0.2)
+    reader = stream()
+    assert reader.wait_for(lambda: reader.events("stats"))
+    stats = reader.events("stats")[0]
+    assert stats["start_time"] == server.start_time.isoformat()
+    assert stats["last_seq"] == server.broker.last_seq
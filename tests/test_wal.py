@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""WAL (WAL_DIR): replay depois de reiniciar, rotação, regravações e registros incompletos"""
+import json
+import os
+
+import pytest
+
+from wal import WriteAheadLog
+
+
+def open_wal(directory, retain=100, segment_bytes=2 ** 20, version=3):
+    wal = WriteAheadLog(str(directory), retain=retain, version=version, fsync_interval=0, segment_bytes=segment_bytes)
+    records = wal.replay()
+    return wal, records
+
+
+def payload(seq, text="frame"):
+    return f"{text}-{seq:04d}".encode()
+
+
+def segments(directory):
+    return sorted(name for name in os.listdir(directory) if name.startswith("segment-"))
+
+
+def test_replay_after_restart(tmp_path):
+    wal, records = open_wal(tmp_path)
+    assert records == []
+    assert wal.next_seq == 1
+    wal.append([(seq, payload(seq)) for seq in range(1, 4)])
+    wal.append([(4, payload(4))])
+    wal.close()
+
+    wal, records = open_wal(tmp_path)
+    assert records == [(seq, payload(seq)) for seq in range(1, 5)]
+    assert wal.next_seq == 5
+    wal.append([(5, payload(5))])
+    wal.close()
+
+    wal, records = open_wal(tmp_path)
+    assert [seq for seq, _ in records] == [1, 2, 3, 4, 5]
+    wal.close()
+
+
+def test_rotation_keeps_only_retained_segments(tmp_path):
+    wal, _ = open_wal(tmp_path, retain=10, segment_bytes=100)
+    for seq in range(1, 101):
+        wal.append([(seq, payload(seq))])
+    wal.close()
+
+    names = segments(tmp_path)
+    assert 1 < len(names) <= 4
+    # Os segmentos restantes ainda cobrem as últimas `retain` mensagens
+    assert int(names[0][len("segment-"):-len(".log")]) <= 91
+
+    wal, records = open_wal(tmp_path, retain=10, segment_bytes=100)
+    assert records == [(seq, payload(seq)) for seq in range(91, 101)]
+    assert wal.next_seq == 101
+    wal.close()
+
+
+def test_update_record_replaces_original(tmp_path):
+    wal, _ = open_wal(tmp_path)
+    wal.append([(seq, payload(seq)) for seq in range(1, 4)])
+    wal.update(2, payload(2, "melhor-sinal"))
+    wal.close()
+
+    wal, records = open_wal(tmp_path)
+    assert records == [(1, payload(1)), (2, payload(2, "melhor-sinal")), (3, payload(3))]
+    # Regravação depois de reiniciar, antes de qualquer nova mensagem
+    wal.update(3, payload(3, "melhor-sinal"))
+    wal.close()
+
+    wal, records = open_wal(tmp_path)
+    assert records[-1] == (3, payload(3, "melhor-sinal"))
+    assert wal.next_seq == 4
+    wal.close()
+
+
+@pytest.mark.parametrize("cut", [3, 14])
+def test_torn_tail_record_is_skipped(tmp_path, cut):
+    wal, _ = open_wal(tmp_path)
+    wal.append([(seq, payload(seq)) for seq in range(1, 4)])
+    wal.close()
+    # Queda no meio da escrita: dados (3 bytes) ou cabeçalho (14 bytes) do último registro incompletos
+    path = tmp_path / segments(tmp_path)[-1]
+    os.truncate(path, os.path.getsize(path) - cut)
+
+    wal, records = open_wal(tmp_path)
+    assert records == [(1, payload(1)), (2, payload(2))]
+    assert wal.next_seq == 3
+    # O seq perdido é gravado de novo, num segmento novo
+    wal.append([(3, payload(3, "de-novo"))])
+    wal.close()
+
+    wal, records = open_wal(tmp_path)
+    assert records == [(1, payload(1)), (2, payload(2)), (3, payload(3, "de-novo"))]
+    wal.close()
+
+
+def test_server_restores_messages_from_wal(server, monkeypatch, tmp_path):
+    wal, _ = open_wal(tmp_path, retain=server.MAX_MESSAGES, version=server.PACK_VERSION)
+    monkeypatch.setattr(server, "wal", wal)
+    client = server.app.test_client()
+    seqs = []
+    for second in range(5):
+        lora_data = {"dt": "20112025", "hr": f"05:00:{second:02d}", "m": second, "op": 1, "id": "LORA-WAL"}
+        response = client.post("/api/messages", json={
+            "client_id": "gateway-wal", "message_id": second, "lora_data": json.dumps(lora_data)
+        })
+        seqs.append(response.get_json()["seq"])
+    before = server.messages_storage.range()
+    wal.close()
+
+    # Reinicialização: memória vazia, mensagens recarregadas do WAL_DIR
+    server.clear_local_messages()
+    monkeypatch.setattr(server, "wal", None)
+    monkeypatch.setattr(server, "WAL_DIR", str(tmp_path))
+    server.restore_storage()
+    try:
+        assert server.messages_storage.range() == before
+        assert server.messages_storage.next_seq == seqs[-1] + 1
+        assert server.aggregates.snapshot()["global"]["captures"] == 5
+        assert [message["seq"] for message in server.messages_storage.select(device="LORA-WAL")] == seqs
+    finally:
+        server.wal.close()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""Webhooks contra o receptor local (benchmarks/webhook_stub.py): lotes, retry e transbordo em disco"""
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from webhook_stub import messages, start_stub, wait_for  # noqa: E402
+
+from webhooks import WebhookFanout, WebhookSink  # noqa: E402
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(delay=0.0, fail=0, port=0):
+        server = start_stub(delay, fail, port)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def sinks():
+    created = []
+
+    def sink(*args, **kwargs):
+        created.append(WebhookSink(*args, **kwargs))
+        return created[-1]
+
+    yield sink
+    for created_sink in created:
+        created_sink.close(timeout=2)
+
+
+def closed_port(stub):
+    server = stub()
+    port = server.server_port
+    server.shutdown()
+    server.server_close()
+    return port
+
+
+def test_batches_by_size_and_time(stub, sinks):
+    server = stub()
+    sink = sinks("stub", f"http://127.0.0.1:{server.server_port}/ingest", batch_size=50, flush_interval=0.3)
+    started = time.perf_counter()
+    for message in messages(1, 120):
+        assert sink.put(message)
+    # A ingestão só enfileira
+    assert time.perf_counter() - started < 0.05
+
+    assert wait_for(lambda: len(server.seqs) == 120)
+    assert sorted(server.batches) == [20, 50, 50]
+    assert sorted(server.seqs) == list(range(1, 121))
+    assert len(server.connections) <= sink.concurrency
+    assert wait_for(lambda: sink.stats()["lag_messages"] == 0)
+    assert sink.stats()["lag_seq"] == 0
+
+
+def test_concurrency_limit_with_slow_receiver(stub, sinks):
+    server = stub(delay=0.2)
+    sink = sinks("lento", f"http://127.0.0.1:{server.server_port}/", batch_size=10, flush_interval=0.05, concurrency=3)
+    for message in messages(1, 200):
+        sink.put(message)
+    assert wait_for(lambda: len(server.seqs) == 200)
+    assert server.max_active == 3
+
+
+def test_retries_after_unavailable(stub, sinks):
+    server = stub(fail=2)
+    sink = sinks("retry", f"http://127.0.0.1:{server.server_port}/", batch_size=10, concurrency=1, backoff=0.05)
+    for message in messages(1, 10):
+        sink.put(message)
+    assert wait_for(lambda: len(server.seqs) == 10)
+    stats = sink.stats()
+    assert stats["retries"] == 2
+    assert stats["delivered"] == 10
+
+
+def test_spills_to_disk_and_recovers(stub, sinks, tmp_path):
+    port = closed_port(stub)
+    sink = sinks("lake", f"http://127.0.0.1:{port}/", batch_size=25, flush_interval=0.1,
+                 max_retries=1, backoff=0.05, spill_dir=str(tmp_path))
+    for message in messages(1, 100):
+        sink.put(message)
+    assert wait_for(lambda: sink.stats()["spilled"] == 100)
+    assert sink.stats()["state"] == "down"
+    assert len(os.listdir(tmp_path / "lake")) == 4
+
+    # Destino volta: os lotes do disco são reenviados junto com os novos
+    server = stub(port=port)
+    for message in messages(101, 20):
+        sink.put(message)
+    # O stub registra os seqs antes de responder: esperar também o disco esvaziar
+    assert wait_for(lambda: len(set(server.seqs)) == 120 and sink.stats()["spilled"] == 0, timeout=15)
+    assert sink.stats()["state"] == "up"
+    assert os.listdir(tmp_path / "lake") == []
+
+
+def test_spilled_batches_survive_restart(stub, sinks, tmp_path):
+    port = closed_port(stub)
+    sink = sinks("lake", f"http://127.0.0.1:{port}/", batch_size=10, flush_interval=0.05,
+                 max_retries=0, backoff=0.05, spill_dir=str(tmp_path))
+    for message in messages(1, 30):
+        sink.put(message)
+    assert wait_for(lambda: sink.stats()["spilled"] == 30)
+    sink.close(timeout=2)
+
+    # Novo processo com o mesmo WEBHOOK_SPILL_DIR: reenvia o que ficou no disco
+    server = stub(port=port)
+    restarted = sinks("lake", f"http://127.0.0.1:{port}/", batch_size=10, backoff=0.05, spill_dir=str(tmp_path))
+    assert restarted.stats()["spilled"] == 30
+    restarted.put(messages(31, 1)[0])
+    assert wait_for(lambda: sorted(set(server.seqs)) == list(range(1, 32)) and restarted.stats()["spilled"] == 0)
+
+
+def test_ingest_forwards_stored_messages(server, stub, sinks, monkeypatch):
+    receiver = stub()
+    sink = sinks("app", f"http://127.0.0.1:{receiver.server_port}/", batch_size=100, flush_interval=0.05)
+    monkeypatch.setattr(server, "webhooks", WebhookFanout([sink]))
+    client = server.app.test_client()
+    seqs = []
+    for second in range(3):
+        lora_data = {"dt": "20112025", "hr": f"16:00:{second:02d}", "m": 4, "op": 2, "id": "LORA-WH"}
+        envelope = {"client_id": "gateway-wh", "message_id": second, "lora_data": json.dumps(lora_data)}
+        response = client.post("/api/messages", json=envelope)
+        seqs.append(response.get_json()["seq"])
+    # Retransmissão do mesmo frame: não armazenada nem encaminhada
+    assert client.post("/api/messages", json=envelope).get_json()["duplicate"] is True
+
+    assert wait_for(lambda: sorted(receiver.seqs) == seqs, timeout=3)
+    time.sleep(0.2)
+    assert sorted(receiver.seqs) == seqs
+    assert client.get("/api/stats").get_json()["stats"]["webhooks"]["app"]["delivered"] == 3
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Log de escrita antecipada (WAL) das mensagens armazenadas
+=========================================================
+
+Cada mensagem armazenada é anexada ao segmento atual como um registro
+binário ``seq (int64) | tamanho (uint32) | dados``, onde os dados são a
+linha empacotada pelo ``MessageStore``. Uma thread faz flush + fsync em
+grupo a cada intervalo configurado (0 = fsync a cada escrita). Os
+segmentos são rotacionados por tamanho e nomeados pelo primeiro seq que
+contêm; segmentos que só têm mensagens que já não caberiam no
+armazenamento em memória são apagados.
+
+Na inicialização, ``replay()`` mapeia os segmentos em memória (mmap) e
+devolve apenas os registros das últimas ``retain`` mensagens, pulando
+os demais sem decodificá-los.
+
+Uma mensagem já gravada pode ser regravada com ``update()``: o registro
+leva o seq negativo e, no replay, substitui os dados do registro
+original.
+"""
+import logging
+import mmap
+import os
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+_PREFIX = "segment-"
+_SUFFIX = ".log"
+
+# Cabeçalho do segmento: identificação + versão do formato dos dados
+_MAGIC = b"TRAPWAL1"
+_HEADER = struct.Struct("<8sI")
+_RECORD = struct.Struct("<qI")
+
+
+def _segment_name(first_seq):
+    return f"{_PREFIX}{first_seq:020d}{_SUFFIX}"
+
+
+class WriteAheadLog:
+    """Log append-only segmentado com fsync em grupo"""
+
+    def __init__(self, directory, retain, version=0, fsync_interval=0.1, segment_bytes=64 * 2 ** 20):
+        self.directory = directory
+        self.retain = retain
+        self.version = version
+        self.fsync_interval = fsync_interval
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._segments = self._list_segments()
+        self._next_seq = None
+        self._dirty = False
+        self._closed = threading.Event()
+        self._flusher = None
+        if fsync_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name="wal-fsync", daemon=True)
+            self._flusher.start()
+
+    def _list_segments(self):
+        """Primeiros seqs dos segmentos existentes, em ordem"""
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith(_PREFIX) and name.endswith(_SUFFIX):
+                try:
+                    segments.append(int(name[len(_PREFIX):-len(_SUFFIX)]))
+                except ValueError:
+                    continue
+        return sorted(segments)
+
+    def _path(self, first_seq):
+        return os.path.join(self.directory, _segment_name(first_seq))
+
+    # ------------------------------------------------------------------
+    # Leitura
+
+    def _read_segment(self, first_seq, min_seq):
+        """Gera (seq, dados) de um segmento, pulando seqs menores que min_seq"""
+        name = _segment_name(first_seq)
+        with open(self._path(first_seq), "rb") as segment:
+            size = os.fstat(segment.fileno()).st_size
+            if size < _HEADER.size:
+                return
+            with mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                magic, version = _HEADER.unpack_from(mapped)
+                if magic != _MAGIC or version != self.version:
+                    logger.warning(f"[WAL] Segmento {name} em formato incompatível ignorado")
+                    return
+                offset = _HEADER.size
+                while offset < size:
+                    # Registro incompleto no fim do segmento: escrita interrompida por queda
+                    if offset + _RECORD.size > size:
+                        logger.warning(f"[WAL] Registro incompleto ignorado em {name}")
+                        return
+                    seq, length = _RECORD.unpack_from(mapped, offset)
+                    offset += _RECORD.size
+                    if offset + length > size:
+                        logger.warning(f"[WAL] Registro incompleto ignorado em {name}")
+                        return
+                    if abs(seq) >= min_seq:
+                        yield seq, mapped[offset:offset + length]
+                    offset += length
+
+    def _last_seq(self):
+        """Último seq gravado (lido do último segmento não vazio)"""
+        for first_seq in reversed(self._segments):
+            last = None
+            for seq, _ in self._read_segment(first_seq, first_seq):
+                if seq > 0:
+                    last = seq
+            if last is not None:
+                return last
+        return None
+
+    def replay(self):
+        """
+        Registros (seq, dados) gravados, em ordem, limitados aos últimos ``retain``
+
+        Deve ser chamado antes da primeira escrita. Também define o próximo
+        seq a ser gravado, que continua a sequência anterior.
+        """
+        last_seq = self._last_seq()
+        if last_seq is None:
+            self._next_seq = self._segments[-1] if self._segments else 1
+            return []
+
+        min_seq = last_seq - self.retain + 1
+        records = []
+        positions = {}
+        for index, first_seq in enumerate(self._segments):
+            next_first = self._segments[index + 1] if index + 1 < len(self._segments) else None
+            if next_first is not None and next_first <= min_seq:
+                continue
+            for seq, data in self._read_segment(first_seq, min_seq):
+                if seq < 0:
+                    # Regravação (update): substitui o registro original
+                    position = positions.get(-seq)
+                    if position is not None:
+                        records[position] = (-seq, data)
+                    continue
+                positions[seq] = len(records)
+                records.append((seq, data))
+        self._next_seq = last_seq + 1
+        return records
+
+    @property
+    def next_seq(self):
+        return self._next_seq
+
+    # ------------------------------------------------------------------
+    # Escrita
+
+    def append(self, records):
+        """Anexa registros (seq, dados) ao segmento atual"""
+        if not records:
+            return
+        data = b"".join(_RECORD.pack(seq, len(payload)) + payload for seq, payload in records)
+        with self._lock:
+            if self._file is None or self._file.tell() >= self.segment_bytes:
+                self._rotate(records[0][0])
+            self._file.write(data)
+            self._next_seq = records[-1][0] + 1
+            if self.fsync_interval > 0:
+                self._dirty = True
+            else:
+                self._sync()
+
+    def update(self, seq, payload):
+        """Regrava os dados de um seq já anexado (o replay devolve a versão mais recente)"""
+        data = _RECORD.pack(-seq, len(payload)) + payload
+        with self._lock:
+            if self._file is None:
+                self._rotate(self._next_seq)
+            self._file.write(data)
+            if self.fsync_interval > 0:
+                self._dirty = True
+            else:
+                self._sync()
+
+    def _rotate(self, first_seq):
+        """Fecha o segmento atual, abre um novo e apaga segmentos antigos"""
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+        if not self._segments or self._segments[-1] != first_seq:
+            self._segments.append(first_seq)
+        self._file = open(self._path(first_seq), "ab")
+        if self._file.tell() == 0:
+            self._file.write(_HEADER.pack(_MAGIC, self.version))
+
+        # Um segmento pode ser apagado se os seguintes já cobrem `retain` mensagens
+        while len(self._segments) > 1 and first_seq - self._segments[1] >= self.retain:
+            os.remove(self._path(self._segments.pop(0)))
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._dirty = False
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.fsync_interval):
+            with self._lock:
+                if self._dirty and self._file is not None:
+                    try:
+                        self._sync()
+                    except OSError as e:
+                        logger.error(f"[WAL] Erro no fsync: {e}")
+
+    def reset(self, next_seq):
+        """Apaga todos os segmentos (mensagens apagadas); a sequência continua em next_seq"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            for first_seq in self._segments:
+                os.remove(self._path(first_seq))
+            self._segments = []
+            # Segmento vazio preserva o próximo seq entre reinicializações
+            self._rotate(next_seq)
+            self._sync()
+            self._next_seq = next_seq
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Encaminhamento das detecções para webhooks
+==========================================
+
+Cada destino (``WebhookSink``) recebe todas as mensagens armazenadas, em
+lotes: um POST com um array JSON (o mesmo formato aceito por
+POST /api/messages/batch), enviado ao juntar ``batch_size`` mensagens ou
+após ``flush_interval`` segundos da primeira.
+
+A ingestão só enfileira (fila limitada por destino, ``put_nowait``; com a
+fila cheia a mensagem é descartada e contada). Uma thread por destino
+monta os lotes e ``concurrency`` threads os entregam, cada uma com sua
+conexão HTTP persistente (keep-alive): no máximo ``concurrency``
+requisições simultâneas por destino. Falhas de rede, 429 e 5xx são
+repetidas com espera exponencial; outros 4xx descartam o lote.
+
+Esgotadas as tentativas, o destino é considerado fora do ar: o lote e os
+seguintes vão para ``spill_dir`` (um arquivo por lote) sem novas
+tentativas, e de tempos em tempos o lote mais antigo do disco é reenviado
+como sonda. Quando ela passa, os lotes do disco são reenviados. A entrega
+é "ao menos uma vez" e sem ordem garantida entre lotes: o consumidor deve
+usar o ``seq`` de cada mensagem para descartar repetições.
+"""
+import http.client
+import logging
+import os
+import queue
+import threading
+import time
+from urllib.parse import urlsplit
+
+import payload_codec
+from counters import ShardedCounter
+
+logger = logging.getLogger(__name__)
+
+# Marcador na fila: envia o lote em formação e encerra as threads
+_STOP = object()
+
+# Espera máxima entre tentativas e entre sondas de um destino fora do ar (segundos)
+_MAX_BACKOFF = 60.0
+
+
+def parse_sinks(spec):
+    """
+    Destinos de ``WEBHOOK_URLS``: "nome=url,nome=url" ou apenas "url,url"
+
+    Sem nome, o destino é identificado pelo host da URL.
+    """
+    sinks = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, separator, url = item.partition("=")
+        if not separator or "://" in name:
+            name, url = urlsplit(item).hostname or item, item
+        sinks.append((name.strip(), url.strip()))
+    names = [name for name, _ in sinks]
+    if len(set(names)) != len(names):
+        raise ValueError(f"nomes de webhook repetidos: {', '.join(names)}")
+    return sinks
+
+
+class _Batch:
+    """Lote pronto para envio (corpo serializado) e, se veio do disco, o arquivo"""
+
+    __slots__ = ("body", "count", "last_seq", "created", "path")
+
+    def __init__(self, body, count, last_seq, created, path=None):
+        self.body = body
+        self.count = count
+        self.last_seq = last_seq
+        self.created = created
+        self.path = path
+
+
+class WebhookSink:
+    """Um destino de webhook: fila, montagem de lotes, entregas concorrentes e transbordo em disco"""
+
+    def __init__(self, name, url, batch_size=100, flush_interval=1.0, concurrency=2, queue_size=10000,
+                 max_retries=5, backoff=1.0, timeout=10.0, spill_dir=None):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"URL de webhook inválida: {url}")
+        if batch_size < 1 or concurrency < 1:
+            raise ValueError("batch_size e concurrency devem ser positivos")
+        self.name = name
+        self._connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self._host = parts.hostname
+        self._port = parts.port
+        self._path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.spill_dir = os.path.join(spill_dir, name) if spill_dir else None
+        self._queue = queue.Queue(queue_size)
+        # No máximo um lote aguardando por entregador: o restante espera na fila de mensagens
+        self._batches = queue.Queue(concurrency)
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._threads = []
+
+        # Estado de entrega (protegido por _lock)
+        self._down = False
+        self._next_probe = 0.0
+        self._probe_backoff = backoff
+        self._replaying = set()
+        self._spilled = {}
+        self._in_flight = 0
+        self._delivered = 0
+        self._batches_delivered = 0
+        self._attempts_failed = 0
+        self._retries = 0
+        self._rejected = 0
+        self._lost = 0
+        self._last_seq = None
+        self._delivered_seq = None
+        self._last_success = None
+        self._last_error = None
+        self._lag_seconds = None
+
+        # Incrementados pelas threads de ingestão
+        self._enqueued = ShardedCounter()
+        self._dropped = ShardedCounter()
+
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            for filename in os.listdir(self.spill_dir):
+                count = self._spill_count(filename)
+                if count is not None:
+                    self._spilled[os.path.join(self.spill_dir, filename)] = count
+
+    # ------------------------------------------------------------------
+    # Ingestão (nunca bloqueia)
+
+    def put(self, message):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((time.monotonic(), message))
+        except queue.Full:
+            self._dropped.add()
+            return False
+        self._enqueued.add()
+        return True
+
+    def _ensure_started(self):
+        # Início preguiçoso: workers criados por fork (gunicorn) abrem as próprias threads
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._threads = [threading.Thread(target=self._collect_loop, name=f"webhook-{self.name}", daemon=True)]
+                self._threads.extend(
+                    threading.Thread(target=self._deliver_loop, name=f"webhook-{self.name}-{index}", daemon=True)
+                    for index in range(self.concurrency)
+                )
+                for thread in self._threads:
+                    thread.start()
+                self._pid = os.getpid()
+
+    def close(self, timeout=10):
+        """Entrega (ou transborda para o disco) o que está na fila e encerra as threads"""
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._threads[0].join(max(deadline - time.monotonic(), 0))
+        # Sem esperar novas tentativas: o que falhar vai para o disco
+        self._stopping.set()
+        for thread in self._threads[1:]:
+            thread.join(max(deadline - time.monotonic(), 0))
+
+    # ------------------------------------------------------------------
+    # Montagem dos lotes
+
+    def _collect_loop(self):
+        while True:
+            messages = []
+            created = None
+            timeout = self.flush_interval if not self._spilled else min(self.flush_interval, 0.5)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            while item is not None and item is not _STOP:
+                if created is None:
+                    created = item[0]
+                messages.append(item[1])
+                if len(messages) >= self.batch_size:
+                    break
+                remaining = created + self.flush_interval - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+            if messages:
+                self._dispatch(self._make_batch(messages, created))
+            if item is _STOP:
+                for _ in range(self.concurrency):
+                    self._batches.put(_STOP)
+                return
+            self._replay()
+
+    def _make_batch(self, messages, created):
+        seqs = [message.get("seq") for message in messages if isinstance(message.get("seq"), int)]
+        last_seq = max(seqs) if seqs else None
+        with self._lock:
+            if last_seq is not None and (self._last_seq is None or last_seq > self._last_seq):
+                self._last_seq = last_seq
+        return _Batch(payload_codec.dumps(messages), len(messages), last_seq, created)
+
+    def _dispatch(self, batch):
+        with self._lock:
+            down = self._down
+            if not down:
+                self._in_flight += batch.count
+        if down:
+            self._spill(batch)
+        else:
+            self._batches.put(batch)
+
+    def _replay(self):
+        """Sonda o destino fora do ar com o lote mais antigo do disco ou, no ar, reenvia os lotes do disco"""
+        with self._lock:
+            if not self._spilled:
+                return
+            if self._down:
+                if self._replaying or time.monotonic() < self._next_probe:
+                    return
+                slots = 1
+            else:
+                slots = self.concurrency - len(self._replaying)
+            paths = sorted(path for path in self._spilled if path not in self._replaying)[:max(slots, 0)]
+            self._replaying.update(paths)
+        for path in paths:
+            try:
+                with open(path, "rb") as spill_file:
+                    body = spill_file.read()
+            except OSError as e:
+                logger.error("[WEBHOOK] %s: lote %s ilegível, descartado: %s", self.name, path, e)
+                self._forget(path, lost=True)
+                continue
+            self._batches.put(_Batch(body, self._spilled[path], None, time.monotonic(), path))
+
+    # ------------------------------------------------------------------
+    # Entrega
+
+    def _deliver_loop(self):
+        connection = None
+        while True:
+            batch = self._batches.get()
+            if batch is _STOP:
+                if connection is not None:
+                    connection.close()
+                return
+            connection = self._deliver(batch, connection)
+
+    def _deliver(self, batch, connection):
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive", "User-Agent": "trapeyes-webhook"}
+        probing = batch.path is not None and self._down
+        attempts = 1 if probing else self.max_retries + 1
+        for attempt in range(attempts):
+            status = None
+            try:
+                if connection is None:
+                    connection = self._connection_class(self._host, self._port, timeout=self.timeout)
+                connection.request("POST", self._path, batch.body, headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+                if 200 <= status < 300:
+                    self._delivered_batch(batch)
+                    return connection
+                error = f"HTTP {status}"
+            except (OSError, http.client.HTTPException) as e:
+                # Conexão persistente caiu: reabrir na próxima tentativa
+                if connection is not None:
+                    connection.close()
+                connection = None
+                error = str(e) or type(e).__name__
+            with self._lock:
+                self._attempts_failed += 1
+                self._last_error = error
+            if status is not None and status != 429 and status < 500:
+                logger.error("[WEBHOOK] %s recusou o lote de %s mensagens (%s); descartado", self.name, batch.count, error)
+                with self._lock:
+                    self._rejected += batch.count
+                self._finish(batch, lost=True)
+                return connection
+            if attempt + 1 == attempts or self._down or self._stopping.is_set():
+                break
+            with self._lock:
+                self._retries += 1
+            logger.warning("[WEBHOOK] %s: %s (tentativa %s)", self.name, error, attempt + 1)
+            if self._stopping.wait(min(self.backoff * 2 ** attempt, _MAX_BACKOFF)):
+                break
+        self._failed_batch(batch, error)
+        return connection
+
+    def _delivered_batch(self, batch):
+        now = time.monotonic()
+        with self._lock:
+            self._delivered += batch.count
+            self._batches_delivered += 1
+            self._last_success = now
+            self._lag_seconds = now - batch.created if batch.path is None else self._lag_seconds
+            if batch.last_seq is not None and (self._delivered_seq is None or batch.last_seq > self._delivered_seq):
+                self._delivered_seq = batch.last_seq
+            if self._down:
+                logger.info("[WEBHOOK] %s de volta; reenviando %s lotes do disco", self.name, len(self._spilled))
+            self._down = False
+            self._probe_backoff = self.backoff
+        self._finish(batch)
+
+    def _failed_batch(self, batch, error):
+        with self._lock:
+            if not self._down:
+                logger.error("[WEBHOOK] %s fora do ar (%s); lotes vão para %s", self.name, error, self.spill_dir or "descarte")
+            self._down = True
+            self._next_probe = time.monotonic() + self._probe_backoff
+            self._probe_backoff = min(self._probe_backoff * 2, _MAX_BACKOFF)
+        if batch.path is not None:
+            # Já está no disco: continua lá para a próxima sonda
+            with self._lock:
+                self._replaying.discard(batch.path)
+            return
+        with self._lock:
+            self._in_flight -= batch.count
+        self._spill(batch)
+
+    def _finish(self, batch, lost=False):
+        if batch.path is not None:
+            self._forget(batch.path, lost)
+            return
+        with self._lock:
+            self._in_flight -= batch.count
+            if lost:
+                self._lost += batch.count
+
+    # ------------------------------------------------------------------
+    # Transbordo em disco
+
+    @staticmethod
+    def _spill_count(filename):
+        """Mensagens no arquivo de lote ``<ns>-<quantidade>.json`` (None se não for um lote)"""
+        stem, extension = os.path.splitext(filename)
+        _, _, count = stem.partition("-")
+        return int(count) if extension == ".json" and count.isdigit() else None
+
+    def _spill(self, batch):
+        if not self.spill_dir:
+            logger.error("[WEBHOOK] %s: lote de %s mensagens descartado (sem WEBHOOK_SPILL_DIR)", self.name, batch.count)
+            with self._lock:
+                self._lost += batch.count
+            return
+        path = os.path.join(self.spill_dir, f"{time.time_ns():020d}-{batch.count}.json")
+        temporary = path + ".tmp"
+        try:
+            with open(temporary, "wb") as spill_file:
+                spill_file.write(batch.body)
+            os.replace(temporary, path)
+        except OSError as e:
+            logger.error("[WEBHOOK] %s: falha ao gravar lote em disco, descartado: %s", self.name, e)
+            with self._lock:
+                self._lost += batch.count
+            return
+        with self._lock:
+            self._spilled[path] = batch.count
+
+    def _forget(self, path, lost=False):
+        with self._lock:
+            count = self._spilled.pop(path, 0)
+            self._replaying.discard(path)
+            if lost:
+                self._lost += count
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # ------------------------------------------------------------------
+    # Leitura
+
+    def stats(self):
+        now = time.monotonic()
+        enqueued = self._enqueued.value
+        with self._lock:
+            spilled = sum(self._spilled.values())
+            return {
+                "state": "down" if self._down else "up",
+                "enqueued": enqueued,
+                "delivered": self._delivered,
+                "batches": self._batches_delivered,
+                "pending": self._queue.qsize(),
+                "in_flight": self._in_flight,
+                "spilled": spilled,
+                "lag_messages": self._queue.qsize() + self._in_flight + spilled,
+                "lag_seq": self._last_seq - self._delivered_seq if self._last_seq is not None and self._delivered_seq is not None else None,
+                "lag_seconds": round(self._lag_seconds, 3) if self._lag_seconds is not None else None,
+                "last_success_seconds_ago": round(now - self._last_success, 3) if self._last_success is not None else None,
+                "failed_attempts": self._attempts_failed,
+                "retries": self._retries,
+                "dropped": self._dropped.value,
+                "rejected": self._rejected,
+                "lost": self._lost,
+                "last_error": self._last_error
+            }
+
+
+class WebhookFanout:
+    """Conjunto de destinos: cada mensagem vai para a fila de todos"""
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def put(self, messages):
+        for sink in self.sinks:
+            for message in messages:
+                sink.put(message)
+
+    def close(self, timeout=10):
+        for sink in self.sinks:
+            sink.close(timeout)
+
+    def stats(self):
+        return {sink.name: sink.stats() for sink in self.sinks}